@@ -0,0 +1,54 @@
+"""
+    Fixtures of the tests : watersteg.py is imported from the parent directory
+    and its arguments (ARGS) are given by the "set_args" fixture. None of these
+    tests calls ImageMagick or steghide : the "fake_programs" fixture puts
+    fake programs at the beginning of the PATH.
+"""
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import watersteg  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def set_args(monkeypatch):
+    """
+        Return a function setting watersteg.ARGS from command line arguments
+        (added to the required ones); ARGS is restored after the test.
+    """
+    def set_args_function(*arguments):
+        args = watersteg.get_args(["--source", "source",
+                                   "--passphrase", "passphrase",
+                                   "--message", "message",
+                                   "--overlay", "overlay.png"] + list(arguments))
+        monkeypatch.setattr(watersteg, "ARGS", args)
+        return args
+    return set_args_function
+
+
+@pytest.fixture
+def fake_programs(monkeypatch, tmp_path):
+    """
+        Return a function writing fake programs (name=source, a Python source
+        unless it begins with "#!") in tmp_path/"bin", put at the beginning of
+        the PATH; the function returns this directory.
+    """
+    directory = tmp_path / "bin"
+
+    def fake_programs_function(**programs):
+        directory.mkdir(exist_ok=True)
+        for name, source in programs.items():
+            filename = directory / name
+            if not source.startswith("#!"):
+                source = "#!" + sys.executable + "\n" + source
+            filename.write_text(source)
+            filename.chmod(filename.stat().st_mode | stat.S_IEXEC)
+        if os.environ["PATH"].split(os.pathsep)[0] != str(directory):
+            monkeypatch.setenv("PATH", str(directory) + os.pathsep + os.environ["PATH"])
+        return directory
+    return fake_programs_function
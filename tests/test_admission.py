@@ -0,0 +1,67 @@
+"""
+    Admission control of the batch (--memory-budget).
+"""
+import time
+
+import pytest
+
+import watersteg
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def run(source_file):
+    """Transformation of a worker : return (source file, start, end)."""
+    start = time.time()
+    time.sleep(0.2)
+    return (source_file, start, time.time())
+
+
+def source_files(directory, sizes):
+    """Write a PNG image for each (width, height) of sizes and return their source files."""
+    files = []
+    for number, size in enumerate(sizes):
+        filename = str(directory / "image{0}.png".format(number))
+        Image.new("L", size).save(filename)
+        files.append(("image{0}".format(number), ".png", filename, ""))
+    return files
+
+
+def test_estimated_memory(tmp_path):
+    source_file = source_files(tmp_path, [(100, 50)])[0]
+
+    assert watersteg.estimated_memory(source_file) == \
+           100 * 50 * watersteg.ADMISSION__BYTES_PER_PIXEL
+    assert watersteg.estimated_memory(("x", ".jpg", str(tmp_path / "missing.jpg"), "")) == 0
+
+
+def test_largest_first(set_args, tmp_path):
+    set_args("--memory-budget", "100")
+    files = source_files(tmp_path, [(10, 10), (300, 300), (100, 100)])
+
+    assert [result[0] for result in watersteg.admit_jobs(run, files, 1)] == \
+           [files[1], files[2], files[0]]
+
+
+def test_budget(set_args, tmp_path):
+    # about 23 MiB per large file, 0.2 MiB per small one :
+    set_args("--memory-budget", "30")
+    files = source_files(tmp_path, [(1000, 1000)] * 3 + [(100, 100)] * 2)
+
+    results = list(watersteg.admit_jobs(run, files, 3))
+
+    assert sorted(result[0] for result in results) == sorted(files)
+    large = sorted((start, end) for source_file, start, end in results
+                   if source_file in files[:3])
+    small = [start for source_file, start, _ in results if source_file in files[3:]]
+    # two large files never run at the same time...
+    assert all(previous[1] <= following[0] for previous, following in zip(large, large[1:]))
+    # ... but the small ones run with them :
+    assert max(small) < large[-1][0]
+
+
+def test_file_larger_than_the_budget(set_args, tmp_path):
+    set_args("--memory-budget", "1")
+    files = source_files(tmp_path, [(1000, 1000), (1000, 1000)])
+
+    assert sorted(result[0] for result in watersteg.admit_jobs(run, files, 2)) == sorted(files)
@@ -0,0 +1,48 @@
+"""
+    Benchmark suite (--benchmark) : corpus, statistics and regressions.
+"""
+import pytest
+
+import watersteg
+
+
+def test_statistics():
+    statistics = watersteg.benchmark_statistics([0.1 * number for number in range(20, 0, -1)],
+                                                duration=10.0, megapixels=5.0)
+
+    assert statistics["images"] == 20
+    assert statistics["images_per_second"] == 2.0
+    assert statistics["megapixels_per_second"] == 0.5
+    assert statistics["p50"] == pytest.approx(1.0)
+    assert statistics["p95"] == pytest.approx(1.9)
+    assert watersteg.benchmark_statistics([1.0, 3.0])["images_per_second"] == 0.5
+
+
+def test_compare_benchmarks():
+    baseline = {"results": {"a": {"images_per_second": 10.0, "p95": 1.0},
+                            "b": {"images_per_second": 10.0, "p95": 1.0}}}
+    report = {"results": {"a": {"images_per_second": 9.5, "p95": 1.05},
+                          "b": {"images_per_second": 8.0, "p95": 1.2},
+                          "c": {"images_per_second": 1.0, "p95": 9.0}}}
+
+    regressions = watersteg.compare_benchmarks(report, baseline)
+
+    # within BENCHMARK__REGRESSION_THRESHOLD for "a", no baseline for "c" :
+    assert regressions == ["b : 8.00 image(s)/s instead of 10.00",
+                           "b : p95 latency = 1.200s instead of 1.000s"]
+
+
+def test_corpus_is_reproducible(monkeypatch, tmp_path):
+    pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(watersteg, "BENCHMARK__RESOLUTIONS", ((64, 48), (128, 96)))
+    monkeypatch.setattr(watersteg, "BENCHMARK__IMAGES", 1)
+
+    contents = []
+    for directory in (tmp_path / "first", tmp_path / "second"):
+        directory.mkdir()
+        corpus = watersteg.generate_corpus(str(directory))
+        contents.append([(directory / (basename + extension)).read_bytes()
+                        for basename, extension, _, _ in corpus])
+
+    assert len(contents[0]) == 4
+    assert contents[0] == contents[1]
@@ -0,0 +1,37 @@
+"""
+    Caches of the watermark tiles and of the resized overlays.
+"""
+import pytest
+
+import watersteg
+
+
+def test_lru_cache():
+    evicted = []
+    cache = watersteg.LRUCache(2, evicted.append)
+
+    assert cache.get("a", lambda: 1) == 1
+    assert cache.get("b", lambda: 2) == 2
+    assert cache.get("a", lambda: 3) == 1
+    # "b" is the least recently used value :
+    assert cache.get("c", lambda: 4) == 4
+    assert evicted == [2]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.clear()
+    assert sorted(evicted) == [1, 2, 4]
+
+
+def test_overlay_cache(set_args, monkeypatch, tmp_path):
+    image = pytest.importorskip("PIL.Image")
+    set_args("--engine", "native")
+    monkeypatch.setattr(watersteg, "OVERLAY__CACHE", watersteg.LRUCache(4))
+    overlay = str(tmp_path / "overlay.png")
+    image.new("RGBA", (40, 20)).save(overlay)
+
+    resized = watersteg.get_overlay(overlay, (100, 100))
+    assert resized.size == (100, 50)
+    assert watersteg.get_overlay(overlay, (100, 100)) is resized
+    assert watersteg.get_overlay(overlay, (100, 100), gray=True) is not resized
+    assert watersteg.get_overlay(overlay, (60, 60)).size == (60, 30)
+    assert (watersteg.OVERLAY__CACHE.hits, watersteg.OVERLAY__CACHE.misses) == (1, 3)
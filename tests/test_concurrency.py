@@ -0,0 +1,103 @@
+"""
+    Asyncio scheduler (--concurrency > 1), with fake "convert", "identify" and
+    "steghide" programs (see the "fake_programs" fixture of conftest.py).
+"""
+import os
+
+import pytest
+
+import watersteg
+
+# writes the content of its first input file followed by the name of its step
+# in each output file; fails on the step named by $FAKE_CONVERT_FAILS :
+FAKE_CONVERT = """
+import os, sys
+arguments = sys.argv[1:]
+step = next((name for option, name in (("-resize", "resize"), ("-tile", "watermark"),
+                                       ("-grayscale", "gray"), ("-geometry", "overlay"))
+             if option in arguments), "")
+if step == os.environ.get("FAKE_CONVERT_FAILS"):
+    sys.exit(1)
+content = b""
+for argument in arguments:
+    if os.path.isfile(argument):
+        with open(argument, "rb") as input_file:
+            content = input_file.read()
+        break
+outputs = [arguments[index + 1] for index, argument in enumerate(arguments)
+           if argument == "-write"] + [arguments[-1]]
+for output in outputs:
+    with open(output, "wb") as output_file:
+        output_file.write(content + b"|" + step.encode())
+"""
+
+FAKE_IDENTIFY = """
+print("800 300")
+"""
+
+# writes the cover file followed by the message :
+FAKE_STEGHIDE = """
+import sys
+arguments = sys.argv[1:]
+def option(name):
+    return arguments[arguments.index(name) + 1]
+with open(option("-cf"), "rb") as cover_file, open(option("-ef"), "rb") as message_file:
+    content = cover_file.read() + b"+" + message_file.read()
+with open(option("-sf") if "-sf" in arguments else option("-cf"), "wb") as stego_file:
+    stego_file.write(content)
+"""
+
+
+@pytest.fixture
+def source_file(fake_programs, set_args, monkeypatch, tmp_path):
+    """
+        Put the fake programs at the beginning of the PATH, set --concurrency 3
+        and return the filename of a source file.
+    """
+    fake_programs(convert=FAKE_CONVERT, identify=FAKE_IDENTIFY, steghide=FAKE_STEGHIDE)
+
+    set_args("--concurrency", "3", "--quiet", "--scratch", str(tmp_path))
+    monkeypatch.setattr(watersteg, "WATERMARK__CACHE", watersteg.LRUCache(4))
+    monkeypatch.setattr(watersteg, "OVERLAY__CACHE", watersteg.LRUCache(4))
+    monkeypatch.setattr(watersteg, "CACHE__DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(watersteg, "STEGHIDE__EMBED_FILE", str(tmp_path / "steghide.embed"))
+    watersteg.write_embed_file(watersteg.STEGHIDE__EMBED_FILE)
+
+    (tmp_path / "dest").mkdir()
+    (tmp_path / "photo.jpg").write_bytes(b"source")
+    (tmp_path / "overlay.png").write_bytes(b"overlay")
+    return str(tmp_path / "photo.jpg")
+
+
+def destination(tmp_path):
+    """Return the destination files written in tmp_path/"dest" and their contents."""
+    return {name: (tmp_path / "dest" / name).read_bytes()
+            for name in os.listdir(str(tmp_path / "dest"))}
+
+
+def test_transformations(source_file, tmp_path):
+    watersteg.apply_transformations(str(tmp_path / "dest") + os.sep, "photo", ".jpg",
+                                    source_file, str(tmp_path / "overlay.png"))
+
+    assert destination(tmp_path) == {
+        "photo_1_400x_watermark_steghide.jpg": b"source|resize|watermark+message",
+        "photo_2_steghide.jpg": b"source+message",
+        "photo_3_steghide_overlay.jpg": b"source|overlay+message",
+        "photo_4_gray_steghide.jpg": b"source|gray+message",
+        "photo_5_gray_steghide_overlay.jpg": b"source|gray|overlay+message"}
+
+
+def test_failed_chain_stops_its_children(source_file, monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv("FAKE_CONVERT_FAILS", "gray")
+
+    statuses = watersteg.run_transformations(
+        source_file,
+        {number: str(tmp_path / "dest" / "photo_{0}.jpg".format(number))
+         for number in (1, 2, 3, 4, 5)},
+        str(tmp_path / "overlay.png"))
+
+    assert statuses[1] == statuses[2] == statuses[3] == 0
+    assert statuses[4] != 0 and statuses[5] != 0
+    # the files of the failed transformations aren't published :
+    assert sorted(destination(tmp_path)) == ["photo_1.jpg", "photo_2.jpg", "photo_3.jpg"]
+    assert "photo_5.jpg\" can't be written" in capsys.readouterr().out
@@ -0,0 +1,80 @@
+"""
+    Archive output sink (--dest-archive) and its index.
+"""
+import csv
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import watersteg
+
+CONTENTS = {"image_2_steghide.jpg": b"x" * 1000,
+            "sub/image_4_gray_steghide.jpg": b"y" * 512,
+            "sub/empty_2_steghide.jpg": b"",
+            "other_3_steghide_overlay.bmp": bytes(range(256)) * 7}
+
+
+def write_archive(directory, name):
+    """Write CONTENTS in the archive directory/name and return its filename."""
+    archivefilename = str(directory / name)
+    archive = watersteg.DestArchive(archivefilename)
+    for member, content in CONTENTS.items():
+        filename = directory / "dest" / member
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_bytes(content)
+    archive.add_files([str(directory / "dest" / member) for member in CONTENTS] +
+                      [str(directory / "dest" / "not_written.jpg")],
+                      str(directory / "dest"))
+    archive.close()
+    return archivefilename
+
+
+@pytest.mark.parametrize("name", ["images.tar", "images.zip"])
+def test_index_offsets(tmp_path, name):
+    archivefilename = write_archive(tmp_path, name)
+
+    with open(archivefilename + watersteg.DEST_ARCHIVE__INDEX_SUFFIX,
+              newline="", encoding="utf-8") as index_file:
+        index = list(csv.DictReader(index_file))
+    with open(archivefilename, "rb") as archive_file:
+        archive = archive_file.read()
+
+    assert [row["name"] for row in index] == list(CONTENTS)
+    for row in index:
+        offset, size = int(row["offset"]), int(row["size"])
+        assert archive[offset:offset + size] == CONTENTS[row["name"]]
+
+
+def test_tar_members(tmp_path):
+    archivefilename = write_archive(tmp_path, "images.tar")
+
+    with tarfile.open(archivefilename) as archive:
+        assert {member.name: archive.extractfile(member).read()
+                for member in archive.getmembers()} == CONTENTS
+
+
+def test_zip_members(tmp_path):
+    archivefilename = write_archive(tmp_path, "images.zip")
+
+    with zipfile.ZipFile(archivefilename) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == CONTENTS
+
+
+def test_files_removed_and_no_temporary_file(tmp_path):
+    write_archive(tmp_path, "images.tar")
+
+    assert sorted(os.listdir(str(tmp_path))) == ["dest", "images.tar", "images.tar.index"]
+    assert [filenames for _, _, filenames in os.walk(str(tmp_path / "dest"))] == [[], []]
+
+
+def test_tar_members_not_kept(tmp_path):
+    archive = watersteg.DestArchive(str(tmp_path / "images.tar"))
+    for number in range(3):
+        (tmp_path / "image.jpg").write_bytes(b"image")
+        archive.add(str(tmp_path / "image.jpg"), "image{0}.jpg".format(number))
+
+    assert archive.files == 3
+    assert not archive.archive.members
+    archive.close()
@@ -0,0 +1,34 @@
+"""
+    Batch mode (--jobs) : the pool of worker processes.
+"""
+import os
+
+import watersteg
+
+
+def worker_state(number):
+    """Return what a worker needs to embed the message : its pid and embed file."""
+    with open(watersteg.STEGHIDE__EMBED_FILE, encoding="utf-8") as embed_file:
+        return (number, os.getpid(), watersteg.STEGHIDE__EMBED_FILE, embed_file.read())
+
+
+def test_imap_jobs_in_this_process(set_args):
+    set_args()
+
+    assert list(watersteg.imap_jobs(lambda number: number * 2, range(4), 1)) == [0, 2, 4, 6]
+
+
+def test_imap_jobs(set_args, monkeypatch, tmp_path):
+    set_args("--message", "hello")
+    monkeypatch.setattr(watersteg, "STEGHIDE__EMBED_FILE", "steghide.embed")
+    monkeypatch.chdir(tmp_path)
+
+    results = list(watersteg.imap_jobs(worker_state, range(20), 3))
+
+    assert sorted(number for number, _, _, _ in results) == list(range(20))
+    embed_files = {pid: embed_file for _, pid, embed_file, _ in results}
+    # each worker has its own embed file, in a directory removed at the end :
+    assert len(set(embed_files.values())) == len(embed_files)
+    assert all(message == "hello" for _, _, _, message in results)
+    assert not any(os.path.exists(embed_file) for embed_file in embed_files.values())
+    assert os.listdir(str(tmp_path)) == []
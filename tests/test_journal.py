@@ -0,0 +1,149 @@
+"""
+    Crash-safe journal (--journal, --resume) and progress line.
+"""
+import json
+import os
+
+import pytest
+
+import watersteg
+
+
+@pytest.fixture
+def journal(set_args, monkeypatch, tmp_path):
+    """Set --journal (with the transformations 1,2,3) and return the journal's filename."""
+    journalfilename = str(tmp_path / "journal.jsonl")
+    set_args("--journal", journalfilename, "--transforms", "1,2,3", "--quiet")
+    monkeypatch.setattr(watersteg, "JOURNAL__DONE_FILES", set())
+    monkeypatch.setattr(watersteg, "JOURNAL__DONE_SOURCES", set())
+    return journalfilename
+
+
+def read_records(journalfilename):
+    """Return the records of the journal."""
+    with open(journalfilename, encoding="utf-8") as journal_file:
+        return [json.loads(line) for line in journal_file]
+
+
+def test_read_journal(journal, tmp_path):
+    destfilenames = {1: str(tmp_path / "a_1.jpg"), 2: str(tmp_path / "a_2.jpg")}
+    watersteg.journal_write(watersteg.journal_records("started", "a.jpg", destfilenames))
+    watersteg.journal_write(watersteg.journal_records("completed", "a.jpg",
+                                                      {1: destfilenames[1]}))
+    watersteg.journal_write([{"event": "completed", "source": "/b.jpg",
+                              "transforms": [1, 2, 3, 4, 5]},
+                             {"event": "completed", "source": "/c.jpg", "transforms": [1]}])
+
+    assert watersteg.read_journal(journal) == ({"/b.jpg"},
+                                               {destfilenames[1]},
+                                               {destfilenames[2]})
+
+
+def test_missing_journal(journal):
+    assert watersteg.read_journal(journal) == (set(), set(), set())
+
+
+def test_line_cut_by_a_crash(journal, tmp_path):
+    destfilename = str(tmp_path / "a_1.jpg")
+    watersteg.journal_write(watersteg.journal_records("started", "a.jpg", {1: destfilename}))
+    with open(journal, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"event": "compl')
+
+    assert watersteg.read_journal(journal) == (set(), set(), {destfilename})
+
+    # the next records are read after the cut line :
+    watersteg.journal_write(watersteg.journal_records("completed", "a.jpg", {1: destfilename}))
+    assert watersteg.read_journal(journal) == (set(), {destfilename}, set())
+
+
+def test_remove_partial_files(set_args, tmp_path):
+    set_args()
+    for name in ("a_1.jpg", "a_1.jpg.123.tmp", "a_2.jpg", "a_1.jpg.bak"):
+        (tmp_path / name).write_bytes(b"image")
+
+    assert watersteg.remove_partial_files({str(tmp_path / "a_1.jpg"),
+                                           str(tmp_path / "missing" / "b_1.jpg")}) == 2
+    assert sorted(os.listdir(str(tmp_path))) == ["a_1.jpg.bak", "a_2.jpg"]
+
+
+def run_transformations(calls, failed=()):
+    """
+        Return a fake run_transformations() writing the destination files (except
+        the transformations of failed) and recording them in calls.
+    """
+    def run_transformations_function(sourcefilename, destfilenames, overlay):
+        calls.append(sorted(destfilenames))
+        for transformation_number, destfilename in destfilenames.items():
+            if transformation_number not in failed:
+                with open(destfilename, "wb") as dest_file:
+                    dest_file.write(b"image")
+        return {transformation_number: 256 if transformation_number in failed else 0
+                for transformation_number in destfilenames}
+    return run_transformations_function
+
+
+def test_resume(journal, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(watersteg, "run_transformations", run_transformations(calls, (3,)))
+    destination_path = str(tmp_path) + os.sep
+    watersteg.apply_transformations(destination_path, "a", ".jpg", "a.jpg", None)
+
+    events = [(record["event"], record["transform"]) for record in read_records(journal)]
+    assert events == [("started", 1), ("started", 2), ("started", 3),
+                      ("completed", 1), ("completed", 2)]
+
+    # --resume : only the transformation #3 is computed again.
+    _, done_files, _ = watersteg.read_journal(journal)
+    watersteg.JOURNAL__DONE_FILES.update(done_files)
+    monkeypatch.setattr(watersteg, "run_transformations", run_transformations(calls))
+    watersteg.apply_transformations(destination_path, "a", ".jpg", "a.jpg", None)
+
+    assert calls == [[1, 2, 3], [3]]
+
+
+def test_source_completed(journal, monkeypatch, tmp_path):
+    monkeypatch.setattr(watersteg, "DESTPATH", str(tmp_path) + os.sep)
+    monkeypatch.setattr(watersteg, "WATERMARK__CACHE", watersteg.LRUCache(1))
+    monkeypatch.setattr(watersteg, "OVERLAY__CACHE", watersteg.LRUCache(1))
+    source_file = ("a", ".jpg", "a.jpg", "")
+
+    monkeypatch.setattr(watersteg, "run_transformations", run_transformations([], (3,)))
+    assert not watersteg.transform_file(source_file)["complete"]
+    assert watersteg.read_journal(journal)[0] == set()
+
+    monkeypatch.setattr(watersteg, "run_transformations", run_transformations([]))
+    assert watersteg.transform_file(source_file)["complete"]
+    assert watersteg.read_journal(journal)[0] == {os.path.abspath("a.jpg")}
+
+
+def test_count_source_files(set_args, tmp_path):
+    set_args("--recursive")
+    (tmp_path / "sub").mkdir()
+    for name in ("a.jpg", "b.jpg", "sub/c.jpg"):
+        (tmp_path / name).write_bytes(b"\xff\xd8\xff\xe0")
+    progress = {"total": None}
+
+    watersteg.count_source_files(watersteg.pending_source_files(str(tmp_path), "a directory"),
+                                 progress).join()
+
+    assert progress["total"] == 3
+
+
+def test_pending_source_files(journal, monkeypatch, tmp_path):
+    done_sources = {str(tmp_path / "a.jpg")}
+    monkeypatch.setattr(watersteg, "JOURNAL__DONE_SOURCES", done_sources)
+    for name in ("a.jpg", "b.jpg"):
+        (tmp_path / name).write_bytes(b"\xff\xd8\xff\xe0")
+
+    assert [source_file[2] for source_file in
+            watersteg.pending_source_files(str(tmp_path), "a directory")] == \
+           [str(tmp_path / "b.jpg")]
+
+
+def test_progress_line():
+    assert watersteg.progress_line(10, 40, 50, 20.0) == \
+           "~ progress : 10/40 file(s), 50 image(s) in 20.0s (2.50 image(s)/s), ETA 0:01:00"
+    # the source files are still being searched :
+    assert watersteg.progress_line(10, None, 50, 20.0) == \
+           "~ progress : 10/? file(s), 50 image(s) in 20.0s (2.50 image(s)/s), ETA ?"
+    assert watersteg.progress_line(0, 40, 0, 0.0).endswith("(0.00 image(s)/s), ETA ?")
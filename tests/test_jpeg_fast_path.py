@@ -0,0 +1,49 @@
+"""
+    JPEG fast path (--jpeg-fast-path).
+"""
+import pytest
+
+import watersteg
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def test_cache_key(set_args):
+    set_args()
+    key = watersteg.result_cache_key(4, "digest", None)
+    set_args("--jpeg-fast-path")
+
+    assert watersteg.result_cache_key(4, "digest", None) != key
+
+
+def test_gray_method(set_args):
+    args = set_args()
+    assert watersteg.gray_method() == "rec709luma"
+    assert watersteg.imagemagick_operators("gray", None, None, False) == ["-grayscale",
+                                                                       "rec709luma"]
+
+    fast_args = set_args("--jpeg-fast-path")
+    assert watersteg.gray_method() == "rec601luma"
+    # the arguments given (see process()) come before ARGS :
+    assert watersteg.gray_method(args) == "rec709luma"
+    assert watersteg.gray_method(fast_args) == "rec601luma"
+
+
+def test_native_gray(set_args):
+    image = Image.new("RGB", (1, 1), (0, 255, 0))
+
+    set_args("--engine", "native")
+    assert watersteg.native_gray(image).getpixel((0, 0)) == \
+           int(watersteg.NATIVE__REC709LUMA[1] * 255 + 0.5)
+    set_args("--engine", "native", "--jpeg-fast-path")
+    assert watersteg.native_gray(image).getpixel((0, 0)) == \
+           int(watersteg.NATIVE__REC601LUMA[1] * 255 + 0.5)
+
+
+def test_shrink_on_load_of_the_jpeg_files(set_args, tmp_path):
+    Image.new("RGB", (16, 16)).save(str(tmp_path / "image.jpg"))
+    Image.new("RGB", (16, 16)).save(str(tmp_path / "image.bmp"))
+    set_args("--jpeg-fast-path")
+
+    assert watersteg.shrink_on_load(str(tmp_path / "image.jpg"))
+    assert not watersteg.shrink_on_load(str(tmp_path / "image.bmp"))
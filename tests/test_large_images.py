@@ -0,0 +1,58 @@
+"""
+    Large-image mode (--large-images).
+"""
+import pytest
+
+import watersteg
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+
+def random_image(mode, size, seed):
+    """Return a PIL image of this mode and size with random samples."""
+    random = numpy.random.RandomState(seed)
+    samples = random.randint(0, 256, size=(size[1], size[0], len(mode)), dtype=numpy.uint8)
+    return Image.fromarray(samples.squeeze(), mode)
+
+
+def test_cache_key(set_args):
+    set_args()
+    key = watersteg.result_cache_key(1, "digest", None)
+    set_args("--large-images")
+
+    assert watersteg.result_cache_key(1, "digest", None) != key
+
+
+def test_shrink_on_load(set_args, tmp_path):
+    sourcefilename = str(tmp_path / "image.jpg")
+    random_image("RGB", (64, 48), 0).save(sourcefilename)
+    set_args()
+    assert not watersteg.shrink_on_load(sourcefilename)
+    args = set_args("--large-images", "--pipeline")
+
+    assert watersteg.shrink_on_load(sourcefilename)
+    # the registers of --pipeline would keep the full-size images :
+    assert not args.pipeline
+
+
+@pytest.mark.parametrize("mode, gray", [("RGB", False), ("L", True), ("RGBA", False)])
+def test_overlay_bands(set_args, tmp_path, mode, gray):
+    set_args("--engine", "native", "--large-images")
+    image = random_image(mode, (300, 3 * watersteg.LARGE_IMAGES__BAND_HEIGHT - 100), 1)
+    if mode == "RGBA":
+        # a translucent pixel amplifies the rounding of the resized overlay :
+        image.putalpha(255)
+    overlay = str(tmp_path / "overlay.png")
+    random_image("RGBA", (120, 250), 2).save(overlay)
+
+    result = watersteg.native_overlay__bands(image, overlay, gray)
+
+    expected = image.convert("RGBA")
+    expected.alpha_composite(watersteg.native_resized_overlay(overlay, image.size, gray))
+    expected = expected.convert(result.mode)
+    assert result.mode == mode
+    assert result.size == image.size
+    difference = numpy.abs(numpy.asarray(result, dtype=numpy.int16) -
+                           numpy.asarray(expected, dtype=numpy.int16))
+    assert difference.max() <= 2
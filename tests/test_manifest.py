@@ -0,0 +1,51 @@
+"""
+    Fan-out mode (--manifest) : reading the manifest.
+"""
+import pytest
+
+import watersteg
+
+
+def test_csv(tmp_path):
+    manifest = tmp_path / "recipients.csv"
+    manifest.write_text("recipient,message,passphrase\n"
+                        "alice,hi alice,secret\n"
+                        "bob smith/2,hi bob,\n")
+
+    assert watersteg.read_manifest(str(manifest), "default") == [
+        {"recipient": "alice", "message": "hi alice", "passphrase": "secret"},
+        {"recipient": "bob_smith_2", "message": "hi bob", "passphrase": "default"}]
+
+
+def test_jsonl(tmp_path):
+    manifest = tmp_path / "recipients.jsonl"
+    manifest.write_text('{"recipient": "alice", "message": "hi alice"}\n'
+                        '\n'
+                        '{"message": "hi", "passphrase": "secret"}\n')
+
+    assert watersteg.read_manifest(str(manifest), "default") == [
+        {"recipient": "alice", "message": "hi alice", "passphrase": "default"},
+        {"recipient": "recipient2", "message": "hi", "passphrase": "secret"}]
+
+
+@pytest.mark.parametrize("content", ["recipient,message\n",
+                                     "recipient,message\nalice,\n",
+                                     "recipient,message\nalice,hi\nalice,yo\n"])
+def test_wrong_manifest(tmp_path, content):
+    manifest = tmp_path / "recipients.csv"
+    manifest.write_text(content)
+
+    with pytest.raises(ValueError):
+        watersteg.read_manifest(str(manifest), "default")
+
+
+def test_get_args(set_args, tmp_path):
+    manifest = tmp_path / "recipients.csv"
+    manifest.write_text("recipient,message\nalice,hi\n")
+
+    assert set_args("--manifest", str(manifest)).recipients == [
+        {"recipient": "alice", "message": "hi", "passphrase": "passphrase"}]
+    assert set_args().recipients is None
+    (tmp_path / "wrong.csv").write_text("recipient\n")
+    with pytest.raises(SystemExit):
+        set_args("--manifest", str(tmp_path / "wrong.csv"))
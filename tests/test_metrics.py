@@ -0,0 +1,60 @@
+"""
+    Metrics of the external stages (--metrics-json, --metrics-prom).
+"""
+import json
+
+import watersteg
+
+
+def test_run_order_records_the_stage(monkeypatch):
+    metrics = watersteg.new_metrics()
+    monkeypatch.setitem(watersteg.METRICS__CONTEXT, "metrics", metrics)
+    monkeypatch.setitem(watersteg.METRICS__CONTEXT, "transform", "4+5")
+    monkeypatch.setitem(watersteg.METRICS__CONTEXT, "file", "image.jpg")
+
+    assert watersteg.run_order(["sh", "-c", "cat"], capture=True, data=b"12345") == (0, b"12345")
+    assert watersteg.run_order(["sh", "-c", "exit 3"])[0] == 3 << 8
+    assert watersteg.run_order(["watersteg-missing-program"])[0] == 127 << 8
+
+    assert metrics["stages"]["sh"]["runs"] == 2
+    assert metrics["stages"]["sh"]["failures"] == 1
+    assert metrics["stages"]["sh"]["output_bytes"] == 5
+    assert metrics["transforms"]["4+5"]["sh"]["runs"] == 2
+    assert metrics["files"]["image.jpg"]["runs"] == 3
+    assert metrics["stages"]["watersteg-missing-program"] == {"runs": 1, "failures": 1}
+
+
+def test_nothing_is_recorded_without_metrics(monkeypatch):
+    monkeypatch.setitem(watersteg.METRICS__CONTEXT, "metrics", None)
+
+    assert watersteg.run_order(["sh", "-c", "exit 0"]) == (0, None)
+
+
+def test_merge_metrics():
+    total, metrics = watersteg.new_metrics(), watersteg.new_metrics()
+    metrics["stages"]["convert"] = {"runs": 2, "maxrss_kb": 100}
+    metrics["transforms"]["1"] = {"convert": {"runs": 2, "maxrss_kb": 100}}
+    watersteg.merge_metrics(total, metrics)
+    metrics["stages"]["convert"] = {"runs": 1, "maxrss_kb": 50}
+    watersteg.merge_metrics(total, metrics)
+
+    # the peak RSS is a maximum, the other counters are added up :
+    assert total["stages"]["convert"] == {"runs": 3, "maxrss_kb": 100}
+    assert total["transforms"]["1"]["convert"] == {"runs": 4, "maxrss_kb": 100}
+
+
+def test_write_metrics(tmp_path):
+    metrics = watersteg.new_metrics()
+    metrics["transforms"]["3"] = {"convert": {"runs": 1, "wall_seconds": 0.5}}
+    metrics["files"]["image.jpg"] = {"runs": 1}
+    json_filename, prom_filename = str(tmp_path / "m.json"), str(tmp_path / "m.prom")
+
+    watersteg.write_metrics(metrics, json_filename, prom_filename)
+
+    with open(json_filename, encoding="utf-8") as json_file:
+        assert json.load(json_file) == metrics
+    with open(prom_filename, encoding="utf-8") as prom_file:
+        lines = prom_file.read().splitlines()
+    assert 'watersteg_stage_wall_seconds{stage="convert",transform="3"} 0.5' in lines
+    assert "watersteg_files 1" in lines
+    assert not (tmp_path / "m.prom.tmp").exists()
@@ -0,0 +1,99 @@
+"""
+    Native engine (--engine native) : the transformations computed without
+    ImageMagick, the message embedded by the native backend.
+"""
+import os
+
+import pytest
+
+import watersteg
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def source(set_args, monkeypatch, tmp_path):
+    """
+        Set the arguments of the native engine and return the filenames of a
+        source image and of an overlay.
+    """
+    set_args("--engine", "native", "--stego", "native", "--quiet",
+             "--scratch", str(tmp_path))
+    monkeypatch.setattr(watersteg, "WATERMARK__CACHE", watersteg.LRUCache(4))
+    monkeypatch.setattr(watersteg, "OVERLAY__CACHE", watersteg.LRUCache(4))
+    samples = numpy.random.RandomState(0).randint(0, 256, size=(300, 800, 3), dtype=numpy.uint8)
+    sourcefilename = str(tmp_path / "photo.bmp")
+    Image.fromarray(samples, "RGB").save(sourcefilename)
+    overlayfilename = str(tmp_path / "overlay.png")
+    Image.new("RGBA", (80, 30), (255, 0, 0, 128)).save(overlayfilename)
+    return sourcefilename, overlayfilename
+
+
+def test_transformations(source, tmp_path):
+    sourcefilename, overlayfilename = source
+    destination_path = str(tmp_path / "dest") + os.sep
+    os.mkdir(destination_path)
+
+    written_files = watersteg.apply_transformations(destination_path, "photo", ".bmp",
+                                                    sourcefilename, overlayfilename)
+
+    assert [os.path.basename(filename) for filename in written_files] == \
+           ["photo_1_400x_watermark_steghide.bmp", "photo_2_steghide.bmp",
+            "photo_3_steghide_overlay.bmp", "photo_4_gray_steghide.bmp",
+            "photo_5_gray_steghide_overlay.bmp"]
+    sizes_and_modes = []
+    for filename in written_files:
+        assert watersteg.native_stego_extract(filename, "passphrase") == b"message"
+        with Image.open(filename) as image:
+            sizes_and_modes.append((image.size, image.mode))
+    assert sizes_and_modes == [((400, 150), "RGB"), ((800, 300), "RGB"), ((800, 300), "RGB"),
+                               ((800, 300), "L"), ((800, 300), "L")]
+
+    # the overlay is over the top left corner of the image #3 only :
+    with Image.open(written_files[2]) as image:
+        red, green, _ = image.getpixel((10, 10))
+    with Image.open(sourcefilename) as image:
+        source_red, source_green, _ = image.getpixel((10, 10))
+    assert abs(red - (source_red + 255 + 1) // 2) <= 2
+    assert abs(green - source_green // 2) <= 2
+
+
+def test_only_the_transformations_asked(source, set_args, tmp_path):
+    sourcefilename, overlayfilename = source
+    set_args("--engine", "native", "--stego", "native", "--quiet",
+             "--scratch", str(tmp_path), "--transforms", "4")
+    destination_path = str(tmp_path / "dest") + os.sep
+    os.mkdir(destination_path)
+
+    watersteg.apply_transformations(destination_path, "photo", ".bmp",
+                                    sourcefilename, overlayfilename)
+
+    assert os.listdir(destination_path) == ["photo_4_gray_steghide.bmp"]
+
+
+def test_native_compare(source, tmp_path):
+    sourcefilename, overlayfilename = source
+    destination_path = str(tmp_path / "dest") + os.sep
+    os.mkdir(destination_path)
+    written_files = watersteg.apply_transformations(destination_path, "photo", ".bmp",
+                                                    sourcefilename, overlayfilename)
+
+    # the embedding only changes the least significant bits :
+    mean, maximum = watersteg.native_compare(sourcefilename, written_files[1])
+    assert maximum <= 1 and mean < 0.01
+    assert watersteg.native_compare(sourcefilename, written_files[0]) is None
+
+
+def test_check_engines_restores_the_engine(set_args, monkeypatch, tmp_path):
+    args = set_args("--engine", "native", "--check-engine")
+    engines = []
+
+    def apply_transformations(**_):
+        engines.append(watersteg.ARGS.engine)
+        return []
+    monkeypatch.setattr(watersteg, "apply_transformations", apply_transformations)
+
+    assert watersteg.check_engines(("photo", ".bmp", str(tmp_path / "photo.bmp"), ""))
+    assert engines == ["imagemagick", "native"]
+    assert args.engine == "native"
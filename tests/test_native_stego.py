@@ -0,0 +1,92 @@
+"""
+    Native steganography backend (--stego native).
+"""
+import io
+import os
+
+import pytest
+
+import watersteg
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+
+def cover(mode="RGB", size=(64, 48)):
+    """Return the content (bytes) of a PNG image with random samples."""
+    random = numpy.random.RandomState(0)
+    samples = random.randint(0, 256, size=(size[1], size[0], len(mode)), dtype=numpy.uint8)
+    content = io.BytesIO()
+    Image.fromarray(samples.squeeze(), mode).save(content, format="PNG")
+    return content.getvalue()
+
+
+def test_positions_are_distinct_and_stable():
+    key = watersteg.native_stego_key("passphrase")
+    positions = watersteg.native_stego_positions(key, 10000, 5000)
+
+    assert positions.size == 5000
+    assert numpy.unique(positions).size == 5000
+    assert positions.min() >= 0 and positions.max() < 10000
+    # the first positions don't depend on the count (the header is read first) :
+    assert (watersteg.native_stego_positions(key, 10000, 100) == positions[:100]).all()
+
+
+def test_positions_near_the_capacity():
+    key = watersteg.native_stego_key("passphrase")
+    positions = watersteg.native_stego_positions(key, 100000, 50000)
+
+    assert numpy.unique(positions).size == 50000
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_embed_extract(tmp_path, mode):
+    coverfilename = tmp_path / "cover.png"
+    coverfilename.write_bytes(cover(mode))
+    stegofilename = str(tmp_path / "stego.png")
+
+    assert watersteg.native_stego_embed(str(coverfilename), stegofilename,
+                                        "secret message", "passphrase") == 0
+    assert watersteg.native_stego_extract(stegofilename, "passphrase") == b"secret message"
+    assert watersteg.native_stego_extract(stegofilename, "wrong passphrase") is None
+    with Image.open(stegofilename) as image:
+        assert image.format == "PNG" and image.mode == mode
+
+
+def test_embed_too_small(tmp_path):
+    coverfilename = str(tmp_path / "cover.png")
+    with open(coverfilename, "wb") as cover_file:
+        cover_file.write(cover(size=(4, 4)))
+
+    assert watersteg.native_stego_embed(coverfilename, coverfilename,
+                                        "a message too long for the image", "passphrase") == 1
+
+
+def test_benchmark_stego_backends(set_args, monkeypatch, tmp_path, capsys):
+    set_args("--benchmark-stego")
+    embedded = []
+    for backend in ("steghide", "native"):
+        monkeypatch.setitem(watersteg.STEGO__BACKENDS, backend,
+                            (lambda coverfilename, stegofilename, backend=backend:
+                             embedded.append((backend, os.path.basename(coverfilename))), None))
+    source_files = [(name, extension, str(tmp_path / (name + extension)), "")
+                    for name, extension in (("a", ".bmp"), ("b", ".jpg"), ("c", ".png"))]
+
+    watersteg.benchmark_stego_backends(source_files)
+
+    assert embedded == [("steghide", "a.bmp"), ("native", "a.bmp"), ("steghide", "b.jpg")]
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split(":")[0].split() for line in lines] == [["~", "BMP", "steghide"],
+                                                             ["~", "BMP", "native"],
+                                                             ["~", "JPEG", "steghide"],
+                                                             ["~", "JPEG", "native"]]
+    assert lines[1].startswith("~ BMP  native   : 1 file(s) in")
+    assert "not supported" in lines[3]
+
+
+def test_positions_dont_depend_on_the_byte_order():
+    key = watersteg.native_stego_key("passphrase")
+    seed = numpy.frombuffer(key, dtype="<u4").astype(numpy.uint32)
+    expected = numpy.random.RandomState(seed).randint(0, 10000, size=8, dtype=numpy.int64)
+
+    assert (watersteg.native_stego_positions(key, 10000, 8) == expected).all()
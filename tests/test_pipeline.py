@@ -0,0 +1,58 @@
+"""
+    ImageMagick engine : one "convert" per chain of steps, or a single one with
+    --pipeline (the orders are recorded instead of being run).
+"""
+import os
+
+import pytest
+
+import watersteg
+
+
+@pytest.fixture
+def orders(set_args, monkeypatch, tmp_path):
+    """Record the orders given to system() and return their list."""
+    set_args("--scratch", str(tmp_path))
+    recorded = []
+    monkeypatch.setattr(watersteg, "system", lambda order, outputs=(): recorded.append(order))
+    monkeypatch.setattr(watersteg, "get_image_size", lambda filename, data=None: (800, 600))
+    monkeypatch.setattr(watersteg, "WATERMARK__CACHE", watersteg.LRUCache(4))
+    monkeypatch.setattr(watersteg, "OVERLAY__CACHE", watersteg.LRUCache(4))
+    monkeypatch.setattr(watersteg, "CACHE__DIRECTORY", str(tmp_path))
+    (tmp_path / "overlay.png").write_bytes(b"overlay")
+    return recorded
+
+
+def run_steps(tmp_path, transformation_numbers):
+    """Compute the chains of transformation_numbers for source.jpg; return the destination files."""
+    destfilenames = {number: str(tmp_path / "image_{0}.jpg".format(number))
+                     for number in transformation_numbers}
+    watersteg.run_steps(str(tmp_path / "source.jpg"), destfilenames,
+                        str(tmp_path / "overlay.png"),
+                        watersteg.plan_transformations(transformation_numbers))
+    return destfilenames
+
+
+def source_orders(orders, tmp_path):
+    """Return the orders of orders reading the source file."""
+    return [order for order in orders if str(tmp_path / "source.jpg") in order]
+
+
+def test_pipeline(set_args, orders, tmp_path):
+    set_args("--scratch", str(tmp_path), "--pipeline")
+    destfilenames = run_steps(tmp_path, (1, 3, 4, 5))
+
+    order, = source_orders(orders, tmp_path)
+    assert order.count(str(tmp_path / "source.jpg")) == 1
+    for destfilename in destfilenames.values():
+        assert order.count(destfilename) == 1
+
+
+def test_one_order_per_chain(orders, tmp_path):
+    run_steps(tmp_path, (1, 3, 4, 5))
+
+    # resize, overlay, gray : from the source file; watermark and gray+overlay
+    # from the intermediate files.
+    assert len(source_orders(orders, tmp_path)) == 3
+    assert len([order for order in orders if order[-1].startswith(str(tmp_path / "image_"))]) == 4
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith("watersteg.")]
@@ -0,0 +1,51 @@
+"""
+    Capacity pre-scan (--prescan) and its index (--capacity-index).
+"""
+import pytest
+
+import watersteg
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+DESTFILENAMES = {number: "photo_{0}.bmp".format(number) for number in (1, 2, 3, 4, 5)}
+
+
+@pytest.fixture
+def source(monkeypatch, tmp_path):
+    """Return the filename of an 800x300 RGB source image."""
+    monkeypatch.setattr(watersteg, "PRESCAN__INDEX", None)
+    monkeypatch.setattr(watersteg, "PRESCAN__SKIPPED", [])
+    sourcefilename = str(tmp_path / "photo.bmp")
+    Image.new("RGB", (800, 300)).save(sourcefilename)
+    return sourcefilename
+
+
+def test_small_destination_files_skipped(set_args, source):
+    # 44988 bytes in the source, about a quarter in the resized image and a
+    # third in the gray ones :
+    set_args("--prescan", "--stego", "native", "--quiet", "--message", "m" * 20000)
+
+    assert watersteg.prescan_transformations(source, DESTFILENAMES) == {1, 4, 5}
+    assert [skipped[0] for skipped in watersteg.PRESCAN__SKIPPED] == ["photo_1.bmp",
+                                                                       "photo_4.bmp",
+                                                                       "photo_5.bmp"]
+
+
+def test_nothing_skipped(set_args, source):
+    set_args("--prescan", "--stego", "native", "--quiet")
+
+    assert watersteg.prescan_transformations(source, DESTFILENAMES) == set()
+
+
+def test_capacity_index(set_args, source, monkeypatch, tmp_path):
+    set_args("--prescan", "--stego", "native", "--capacity-index", str(tmp_path / "index.db"))
+
+    assert watersteg.source_capacity(source, "native") == (800, 300, 44988)
+
+    # the capacity is read from the index, by content :
+    def native_stego_capacity(filename):
+        raise AssertionError(filename)
+    monkeypatch.setattr(watersteg, "native_stego_capacity", native_stego_capacity)
+    monkeypatch.setattr(watersteg, "PRESCAN__INDEX", None)
+    assert watersteg.source_capacity(source, "native") == (800, 300, 44988)
@@ -0,0 +1,120 @@
+"""
+    Library API : process(), with fake "convert", "identify" and "steghide"
+    programs (see the "fake_programs" fixture of conftest.py).
+"""
+import io
+import threading
+
+import pytest
+
+import watersteg
+
+numpy = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+# copies its standard input in each image written in a pipe (e.g. "png:fd:5") :
+FAKE_CONVERT = """
+import os, sys
+image = sys.stdin.buffer.read()
+for argument in sys.argv[1:]:
+    if argument.startswith("fd:"):
+        while os.read(int(argument[3:]), 65536):
+            pass
+for argument in sys.argv[1:]:
+    if ":fd:" in argument:
+        os.write(int(argument.split(":")[2]), image)
+"""
+
+FAKE_IDENTIFY = """
+import sys
+sys.stdin.buffer.read()
+sys.stdout.write("64 48")
+"""
+
+# writes its standard input followed by the message :
+FAKE_STEGHIDE = """
+import sys
+arguments = sys.argv[1:]
+with open(arguments[arguments.index("-ef") + 1], "rb") as message_file:
+    message = message_file.read()
+sys.stdout.buffer.write(sys.stdin.buffer.read() + b"+" + message)
+"""
+
+
+@pytest.fixture(autouse=True)
+def programs(fake_programs, monkeypatch):
+    """Put the fake programs at the beginning of the PATH."""
+    fake_programs(convert=FAKE_CONVERT, identify=FAKE_IDENTIFY, steghide=FAKE_STEGHIDE)
+    monkeypatch.setattr(watersteg, "ARGS", None)
+
+
+def png_image():
+    """Return the content (bytes) of a PNG image."""
+    samples = numpy.random.RandomState(0).randint(0, 256, size=(48, 64, 3), dtype=numpy.uint8)
+    content = io.BytesIO()
+    Image.fromarray(samples, "RGB").save(content, format="PNG")
+    return content.getvalue()
+
+
+def test_native_stego():
+    images = watersteg.process(png_image(), "hello", "passphrase", overlay=b"overlay",
+                               extension=".png", basename="photo", stego="native")
+
+    assert sorted(images) == ["photo_1_400x_watermark_steghide.png",
+                              "photo_2_steghide.png",
+                              "photo_3_steghide_overlay.png",
+                              "photo_4_gray_steghide.png",
+                              "photo_5_gray_steghide_overlay.png"]
+    for content in images.values():
+        assert watersteg.native_stego_extract(io.BytesIO(content), "passphrase") == b"hello"
+
+
+def test_steghide():
+    image = b"jpeg image"
+
+    images = watersteg.process(image, "hello", "passphrase", transforms=(2, 4))
+
+    assert images == {"image_2_steghide.jpg": b"jpeg image+hello",
+                      "image_4_gray_steghide.jpg": b"jpeg image+hello"}
+
+
+def test_concurrent_calls():
+    image = png_image()
+    results = {}
+
+    def call(index):
+        """Process the image with a message and a passphrase of its own."""
+        results[index] = watersteg.process(image, "message {0}".format(index),
+                                           "passphrase {0}".format(index),
+                                           transforms=(1, 4), extension=".png",
+                                           stego="native")
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == list(range(6))
+    for index, images in results.items():
+        for content in images.values():
+            assert watersteg.native_stego_extract(io.BytesIO(content),
+                                                  "passphrase {0}".format(index)) == \
+                   "message {0}".format(index).encode("utf-8")
+    assert watersteg.ARGS is None
+
+
+@pytest.mark.parametrize("arguments", [{"transforms": ()},
+                                       {"transforms": (6,)},
+                                       {"transforms": (3,)},
+                                       {"stego": "unknown"}])
+def test_wrong_arguments(arguments):
+    with pytest.raises(ValueError):
+        watersteg.process(b"image", "hello", "passphrase", **arguments)
+
+
+def test_failed_embedding(fake_programs):
+    fake_programs(steghide="#!/bin/sh\nexit 1\n")
+
+    with pytest.raises(RuntimeError):
+        watersteg.process(b"image", "hello", "passphrase", transforms=(2,))
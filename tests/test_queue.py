@@ -0,0 +1,119 @@
+"""
+    Sharding (--shard) and lease-based work queue (--queue).
+"""
+import os
+import time
+
+import pytest
+
+import watersteg
+
+SOURCE_FILE = ("image", ".jpg", "source/image.jpg", "")
+
+
+@pytest.fixture
+def queue(set_args, tmp_path):
+    """Set --queue (and --lease-seconds 10) and return the directory of the queue."""
+    set_args("--queue", str(tmp_path), "--lease-seconds", "10")
+    return tmp_path
+
+
+def test_shards_are_disjoint(set_args):
+    names = ["image{0}.jpg".format(number) for number in range(200)]
+    shards = []
+    for shard in range(1, 5):
+        set_args("--shard", "{0}/4".format(shard))
+        shards.append({name for name in names if watersteg.is_in_shard(name)})
+
+    assert sum(len(shard) for shard in shards) == len(names)
+    assert set().union(*shards) == set(names)
+    assert all(shards)
+
+
+def test_claim_once(queue):
+    leasefilename = watersteg.queue_claim("key", "node1")
+
+    assert leasefilename == str(queue / "key.lease")
+    with open(leasefilename, encoding="utf-8") as lease_file:
+        assert lease_file.read() == "node1"
+    assert watersteg.queue_claim("key", "node2") is None
+
+
+def test_done_isnt_claimed(queue):
+    (queue / "key.done").write_text("node1\n")
+
+    assert watersteg.queue_claim("key", "node2") is None
+    assert not (queue / "key.lease").exists()
+
+
+def test_expired_lease_is_taken_over(queue):
+    (queue / "key.lease").write_text("crashed node")
+    expired = time.time() - 60
+    os.utime(str(queue / "key.lease"), (expired, expired))
+
+    assert watersteg.queue_claim("key", "node2") == str(queue / "key.lease")
+    assert (queue / "key.lease").read_text() == "node2"
+    assert sorted(os.listdir(str(queue))) == ["key.lease"]
+
+
+def transform_file(written_files):
+    """Return a fake transform_file() having written written_files."""
+    def transform_file_function(source_file):
+        return {"source": source_file[2], "written_files": written_files,
+                "complete": all(os.path.exists(filename) for filename in written_files)}
+    return transform_file_function
+
+
+def test_done_when_complete(queue, monkeypatch):
+    (queue / "image_2_steghide.jpg").write_bytes(b"image")
+    monkeypatch.setattr(watersteg, "transform_file",
+                        transform_file([str(queue / "image_2_steghide.jpg")]))
+    key = watersteg.source_file_key("image.jpg")
+
+    assert watersteg.transform_file__queue(SOURCE_FILE)["complete"]
+    assert (queue / (key + ".done")).exists()
+    assert not (queue / (key + ".lease")).exists()
+    assert watersteg.transform_file__queue(SOURCE_FILE) is None
+
+
+def test_left_in_the_queue_when_incomplete(queue, monkeypatch):
+    monkeypatch.setattr(watersteg, "transform_file",
+                        transform_file([str(queue / "image_2_steghide.jpg")]))
+    key = watersteg.source_file_key("image.jpg")
+
+    assert not watersteg.transform_file__queue(SOURCE_FILE)["complete"]
+    assert not (queue / (key + ".done")).exists()
+    # the lease is released : the file can be claimed again.
+    assert watersteg.queue_claim(key, "node2") is not None
+
+
+def test_lease_released_when_transform_file_fails(queue, monkeypatch):
+    def transform_file_function(source_file):
+        raise RuntimeError(source_file[2])
+    monkeypatch.setattr(watersteg, "transform_file", transform_file_function)
+
+    with pytest.raises(RuntimeError):
+        watersteg.transform_file__queue(SOURCE_FILE)
+    assert os.listdir(str(queue)) == []
+
+
+def test_release(queue):
+    leasefilename = watersteg.queue_claim("key", "node1")
+
+    assert watersteg.queue_release(leasefilename, "node1")
+    assert os.listdir(str(queue)) == []
+    assert not watersteg.queue_release(leasefilename, "node1")
+
+
+def test_lease_taken_over_is_kept(queue, capsys):
+    leasefilename = watersteg.queue_claim("key", "node1")
+    # node1 has stalled : its lease has expired and node2 has taken it over.
+    expired = time.time() - 60
+    os.utime(leasefilename, (expired, expired))
+    assert watersteg.queue_claim("key", "node2") == leasefilename
+
+    assert not watersteg.queue_release(leasefilename, "node1")
+    assert os.listdir(str(queue)) == ["key.lease"]
+    assert (queue / "key.lease").read_text() == "node2"
+    assert watersteg.queue_claim("key", "node3") is None
+    assert "taken over" in capsys.readouterr().out
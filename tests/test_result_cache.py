@@ -0,0 +1,71 @@
+"""
+    Content-addressed result cache (--result-cache).
+"""
+import os
+
+import pytest
+
+import watersteg
+
+
+def key():
+    """Return the key of the transformation #1 of a source with the current ARGS."""
+    return watersteg.result_cache_key(1, "source digest", None)
+
+
+@pytest.mark.parametrize("arguments", [("--message", "another message"),
+                                       ("--passphrase", "another passphrase"),
+                                       ("--engine", "native"),
+                                       ("--stego", "native"),
+                                       ("--font", "DejaVu-Sans")])
+def test_key_depends_on_the_arguments(set_args, arguments):
+    set_args()
+    default_key = key()
+    set_args(*arguments)
+
+    assert key() != default_key
+
+
+def test_key_depends_on_the_source_and_the_overlay(set_args):
+    set_args()
+
+    assert watersteg.result_cache_key(1, "digest", None) == \
+           watersteg.result_cache_key(1, "digest", None)
+    assert watersteg.result_cache_key(1, "digest", None) != \
+           watersteg.result_cache_key(2, "digest", None)
+    assert watersteg.result_cache_key(3, "digest", "overlay") != \
+           watersteg.result_cache_key(3, "another digest", "overlay")
+    assert watersteg.result_cache_key(3, "digest", "overlay") != \
+           watersteg.result_cache_key(3, "digest", "another overlay")
+
+
+def test_key_doesnt_contain_the_passphrase(set_args):
+    set_args()
+
+    assert "passphrase" not in watersteg.result_cache_key(1, "digest", None)
+
+
+def test_store_and_fetch(set_args, tmp_path):
+    set_args("--result-cache", str(tmp_path / "cache"))
+    destfilename = str(tmp_path / "image_2_steghide.jpg")
+    with open(destfilename, "wb") as dest_file:
+        dest_file.write(b"content")
+
+    watersteg.result_cache_store("0123", destfilename, 0)
+    os.remove(destfilename)
+
+    assert watersteg.result_cache_fetch("0123", destfilename)
+    with open(destfilename, "rb") as dest_file:
+        assert dest_file.read() == b"content"
+    assert not watersteg.result_cache_fetch("4567", destfilename)
+
+
+def test_failed_files_arent_stored(set_args, tmp_path):
+    set_args("--result-cache", str(tmp_path / "cache"))
+    destfilename = str(tmp_path / "image_2_steghide.jpg")
+    with open(destfilename, "wb") as dest_file:
+        dest_file.write(b"content")
+
+    watersteg.result_cache_store("0123", destfilename, 256)
+
+    assert not os.path.exists(watersteg.result_cache_filename("0123", destfilename))
@@ -0,0 +1,58 @@
+"""
+    Scratch directory (--scratch) and publication of the destination files.
+"""
+import os
+import tempfile
+
+import watersteg
+
+
+def test_default_scratch_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(watersteg, "SCRATCH__DIRECTORY", str(tmp_path / "missing"))
+    assert watersteg.default_scratch_directory() == tempfile.gettempdir()
+
+    monkeypatch.setattr(watersteg, "SCRATCH__DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(watersteg, "SCRATCH__MINIMUM_FREE", 0)
+    assert watersteg.default_scratch_directory() == str(tmp_path)
+
+
+def test_publish_file(tmp_path):
+    (tmp_path / "staged.jpg").write_bytes(b"image")
+    (tmp_path / "dest.jpg").write_bytes(b"previous image")
+
+    watersteg.publish_file(str(tmp_path / "staged.jpg"), str(tmp_path / "dest.jpg"))
+
+    assert os.listdir(str(tmp_path)) == ["dest.jpg"]
+    assert (tmp_path / "dest.jpg").read_bytes() == b"image"
+
+
+def test_publish_file_across_filesystems(monkeypatch, tmp_path):
+    (tmp_path / "staged.jpg").write_bytes(b"image")
+    renames = []
+
+    def rename(source, destination):
+        """os.rename() failing for the staged file, as across filesystems."""
+        if source.endswith("staged.jpg"):
+            raise OSError(18, "Invalid cross-device link")
+        renames.append(os.path.basename(source))
+        os.replace(source, destination)
+    monkeypatch.setattr(os, "rename", rename)
+
+    watersteg.publish_file(str(tmp_path / "staged.jpg"), str(tmp_path / "dest.jpg"))
+
+    # the copy is written under a temporary name, then renamed :
+    assert renames == ["dest.jpg.{0}.tmp".format(os.getpid())]
+    assert os.listdir(str(tmp_path)) == ["dest.jpg"]
+    assert (tmp_path / "dest.jpg").read_bytes() == b"image"
+
+
+def test_result_cache_link_replaced(set_args, tmp_path):
+    set_args("--result-cache", str(tmp_path / "cache"))
+    (tmp_path / "dest.jpg").write_bytes(b"cached image")
+    watersteg.result_cache_store("0123", str(tmp_path / "dest.jpg"), 0)
+    (tmp_path / "staged.jpg").write_bytes(b"new image")
+
+    watersteg.publish_file(str(tmp_path / "staged.jpg"), str(tmp_path / "dest.jpg"))
+
+    with open(watersteg.result_cache_filename("0123", "dest.jpg"), "rb") as cached_file:
+        assert cached_file.read() == b"cached image"
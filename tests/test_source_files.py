@@ -0,0 +1,70 @@
+"""
+    Discovery of the source files (--recursive, --include, --exclude).
+"""
+import watersteg
+
+MAGIC_NUMBERS = {".jpg": b"\xff\xd8\xff\xe0", ".bmp": b"BM", ".png": b"\x89PNG\r\n\x1a\n"}
+
+
+def make_tree(directory):
+    """Write a few (truncated) images and a text file in directory."""
+    for name in ("a.jpg", "b.bmp", "c.png", "sub/d.jpg", "sub/e.bmp"):
+        filename = directory / name
+        filename.parent.mkdir(exist_ok=True)
+        filename.write_bytes(MAGIC_NUMBERS[filename.suffix] + b"\0" * 16)
+    (directory / "notes.jpg").write_bytes(b"not an image")
+
+
+def found(directory):
+    """Return the sorted (basename, subdirectory) of the source files found in directory."""
+    return sorted((basename + extension, subdirectory)
+                  for basename, extension, _, subdirectory
+                  in watersteg.get_source_files(str(directory), "a directory"))
+
+
+def test_sniff_image_format(tmp_path):
+    make_tree(tmp_path)
+
+    assert watersteg.sniff_image_format(str(tmp_path / "a.jpg")) == "JPEG"
+    assert watersteg.sniff_image_format(str(tmp_path / "b.bmp")) == "BMP"
+    assert watersteg.sniff_image_format(str(tmp_path / "c.png")) == "PNG"
+    assert watersteg.sniff_image_format(str(tmp_path / "notes.jpg")) is None
+    assert watersteg.sniff_image_format(str(tmp_path / "missing.jpg")) is None
+
+
+def test_directory(set_args, tmp_path):
+    make_tree(tmp_path)
+    set_args()
+
+    assert found(tmp_path) == [("a.jpg", ""), ("b.bmp", "")]
+
+
+def test_recursive_and_native(set_args, tmp_path):
+    make_tree(tmp_path)
+    set_args("--recursive", "--stego", "native")
+
+    assert found(tmp_path) == [("a.jpg", ""), ("b.bmp", ""), ("c.png", ""),
+                               ("d.jpg", "sub"), ("e.bmp", "sub")]
+
+
+def test_include_exclude(set_args, tmp_path):
+    make_tree(tmp_path)
+    set_args("--recursive", "--include", "*.jpg", "--exclude", "sub/*")
+
+    assert found(tmp_path) == [("a.jpg", "")]
+
+
+def test_symbolic_links_to_directories(set_args, tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / "sub" / "loop").symlink_to(tmp_path)
+    (tmp_path / "link").symlink_to(tmp_path / "sub")
+    set_args("--recursive")
+
+    assert found(tmp_path) == [("a.jpg", ""), ("b.bmp", ""), ("d.jpg", "sub"), ("e.bmp", "sub")]
+
+
+def test_unreadable_directory(set_args, tmp_path, capsys):
+    set_args("--recursive")
+
+    assert not list(watersteg.scan_directory(str(tmp_path / "missing"), True))
+    assert "missing\" skipped" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+"""
+    Steps of the transformations and their shared chains (see TRANSFORMATION_STEPS).
+"""
+import pytest
+
+import watersteg
+
+DESTFILENAMES = {1: "image_1.jpg", 2: "image_2.jpg", 3: "image_3.jpg",
+                 4: "image_4.jpg", 5: "image_5.jpg"}
+
+
+def test_plan_transformations():
+    assert watersteg.plan_transformations((3, 4, 5)) == [("overlay",), ("gray",),
+                                                         ("gray", "overlay")]
+    assert watersteg.plan_transformations((5,)) == [("gray",), ("gray", "overlay")]
+    assert watersteg.plan_transformations((2,)) == []
+
+
+@pytest.mark.parametrize("transformation_numbers", [(1, 2, 3, 4, 5), (5, 1), (4, 5), (3,)])
+def test_each_chain_once_after_its_parent(transformation_numbers):
+    chains = watersteg.plan_transformations(transformation_numbers)
+
+    assert len(set(chains)) == len(chains)
+    for index, chain in enumerate(chains):
+        assert len(chain) == 1 or chain[:-1] in chains[:index]
+    for transformation_number in transformation_numbers:
+        steps = watersteg.TRANSFORMATION_STEPS[transformation_number]
+        assert not steps or steps in chains
+
+
+def test_chain_outputs():
+    chains = watersteg.plan_transformations((1, 2, 3, 4, 5))
+
+    assert watersteg.chain_outputs(("gray",), chains, DESTFILENAMES) == (["image_4.jpg"], True)
+    assert watersteg.chain_outputs(("resize",), chains, DESTFILENAMES) == ([], True)
+    assert watersteg.chain_outputs(("resize", "watermark"), chains, DESTFILENAMES) == \
+           (["image_1.jpg"], False)
+    assert watersteg.chain_transformations(("gray",), DESTFILENAMES) == "4+5"
+
+
+def test_pipeline_order_reads_and_writes_once(set_args):
+    args = set_args()
+    destfilenames = {number: "jpg:fd:{0}".format(10 + number) for number in (1, 3, 4, 5)}
+    chains = watersteg.plan_transformations(destfilenames)
+
+    order = watersteg.pipeline_order("-", destfilenames, "fd:3", chains, (640, 480),
+                                     streams=True, args=args)
+
+    assert order[0] == "convert"
+    assert order.count("-") == 1
+    assert order.count("fd:3") == 1
+    for destfilename in destfilenames.values():
+        assert order.count(destfilename) == 1
+    assert order[-1] == destfilenames[5]
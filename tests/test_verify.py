@@ -0,0 +1,53 @@
+"""
+    Verification of the destination files (--verify).
+"""
+import os
+
+import pytest
+
+import watersteg
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def destination(fake_programs, set_args, tmp_path):
+    """
+        Write destination files (and other files) in tmp_path/"dest" and return
+        this directory; steghide finds no message.
+    """
+    fake_programs(steghide="#!/bin/sh\nexit 1\n")
+    set_args("--verify", "--quiet")
+
+    dest = tmp_path / "dest"
+    (dest / "sub").mkdir(parents=True)
+    for name, message in (("a_2_steghide.png", "message"),
+                          ("sub/a_4_gray_steghide.png", "message"),
+                          ("b_3_steghide_overlay.png", "another message"),
+                          ("c_2_steghide.png", None),
+                          ("a.png", "message")):
+        filename = str(dest / name)
+        Image.new("RGB", (64, 48), (100, 150, 200)).save(filename)
+        if message is not None:
+            watersteg.native_stego_embed(filename, filename, message, "passphrase")
+    (dest / "d_5_gray_steghide_overlay.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+    return dest
+
+
+def test_find_destination_files(destination):
+    assert sorted(os.path.relpath(filename, str(destination)) + ":" + str(number)
+                  for filename, number in watersteg.find_destination_files(str(destination))) == \
+           ["a_2_steghide.png:2", "b_3_steghide_overlay.png:3", "c_2_steghide.png:2",
+            "d_5_gray_steghide_overlay.png:5", "sub/a_4_gray_steghide.png:4"]
+
+
+def test_verify_file(destination):
+    statuses = {os.path.basename(result["file"]): (result["backend"], result["status"])
+                for result in map(watersteg.verify_file,
+                                  watersteg.find_destination_files(str(destination)))}
+
+    assert statuses == {"a_2_steghide.png": ("native", "ok"),
+                        "a_4_gray_steghide.png": ("native", "ok"),
+                        "b_3_steghide_overlay.png": ("native", "unexpected message"),
+                        "c_2_steghide.png": ("steghide", "no message"),
+                        "d_5_gray_steghide_overlay.png": (None, "unreadable")}
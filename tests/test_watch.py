@@ -0,0 +1,115 @@
+"""
+    Hot-folder daemon (--watch) : the files found when it starts and the files
+    written while it watches.
+"""
+import select
+import signal
+import types
+
+import pytest
+
+import watersteg
+
+
+class Pool:
+    """A pool of worker processes recording the source files given to it."""
+
+    def __init__(self):
+        self.source_files = []
+
+    def apply_async(self, function, arguments, callback, error_callback):
+        """Record the source file instead of transforming it."""
+        assert function is watersteg.transform_file
+        assert callback and error_callback
+        self.source_files.append(arguments[0])
+
+    def close(self):
+        """No worker process to stop."""
+
+    def join(self):
+        """No worker process to wait for."""
+
+
+class Select:
+    """
+        select.select() of the daemon : write_files() is called on the first
+        call, whose events are read; ^C on the second one.
+    """
+
+    def __init__(self, write_files):
+        self.write_files = write_files
+        self.calls = 0
+
+    def select(self, readable, writable, exceptional):
+        """Return the readable files after write_files(), then raise KeyboardInterrupt."""
+        self.calls += 1
+        if self.write_files is None or self.calls > 1:
+            raise KeyboardInterrupt
+        self.write_files()
+        return select.select(readable, writable, exceptional, 1.0)
+
+
+@pytest.fixture
+def watch(set_args, monkeypatch, tmp_path):
+    """
+        Return a function running the daemon on tmp_path/"source" (see Select)
+        and returning the names of the source files submitted.
+    """
+    def watch_function(destpath, *arguments, write_files=None):
+        set_args("--quiet", *arguments)
+        monkeypatch.setattr(watersteg, "DESTPATH", destpath)
+        pool = Pool()
+        monkeypatch.setattr(watersteg, "get_pool", lambda jobs, embed_directory: pool)
+        monkeypatch.setattr(watersteg, "select",
+                            types.SimpleNamespace(select=Select(write_files).select))
+        sigterm_handler = signal.getsignal(signal.SIGTERM)
+
+        watersteg.watch_source_directory(str(tmp_path / "source"))
+
+        assert signal.getsignal(signal.SIGTERM) is sigterm_handler
+        return sorted(source_file[2][len(str(tmp_path / "source")) + 1:]
+                      for source_file in pool.source_files)
+    return watch_function
+
+
+def make_source(directory):
+    """Write a source file, its destination files and a subdirectory "out" with an image."""
+    (directory / "out").mkdir(parents=True)
+    for name in ("image.jpg", "image_2_steghide.jpg", "image_5_gray_steghide_overlay.jpg",
+                 "out/other.jpg"):
+        (directory / name).write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 16)
+
+
+def test_default_destpath(watch, monkeypatch, tmp_path):
+    make_source(tmp_path / "source")
+    # the default destpath "." is the source directory :
+    monkeypatch.chdir(tmp_path / "source")
+
+    assert watch("./", "--recursive") == ["image.jpg", "out/other.jpg"]
+
+
+def test_destpath_in_the_source_directory(watch, tmp_path):
+    make_source(tmp_path / "source")
+
+    assert watch(str(tmp_path / "source" / "out") + "/", "--recursive") == ["image.jpg"]
+
+
+def test_destpath_outside_of_the_source_directory(watch, tmp_path):
+    make_source(tmp_path / "source")
+
+    assert watch(str(tmp_path) + "/") == ["image.jpg"]
+
+
+def test_written_files(watch, tmp_path):
+    source = tmp_path / "source"
+    make_source(source)
+
+    def write_files():
+        """Write a source file and its temporary destination file; touch image.jpg."""
+        (source / "new.jpg").write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 16)
+        (source / "new_2_steghide.jpg.1234.tmp").write_bytes(b"\xff\xd8\xff\xe0" + b"\0" * 16)
+        # closed after a write (IN_CLOSE_WRITE), not modified :
+        with open(str(source / "image.jpg"), "ab"):
+            pass
+
+    assert watch(str(tmp_path) + "/", write_files=write_files) == ["image.jpg", "new.jpg"]
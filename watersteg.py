@@ -22,12 +22,16 @@
      Watersteg project : apply a watermark and some steganographic data in an
                          image file.
 
-     Use this Python2/3 script in a Linux environment to apply some
+     Use this Python3 script in a Linux environment to apply some
      transformations (watermark + steghide) to an image or a group of images.
 
      External programs required by watersteg :
          o ImageMagick (http://www.imagemagick.org/script/index.php)
          o Steghide (http://steghide.sourceforge.net/)
+         o jpegtran (libjpeg), for --jpeg-fast-path
+
+     Optional Python packages :
+         o Pillow and NumPy, for the native engine (--engine native)
 
   ______________________________________________________________________________
 
@@ -46,10 +50,24 @@
 
         NB : the destination path must exist.
 
+        From Python, without writing anything on disk (see process()) :
+
+        >>> import watersteg
+        >>> images = watersteg.process(open("img/IMG_4280.JPG", "rb").read(),
+        ...                            "Hello !", "secret phrase",
+        ...                            overlay=open("overlay.png", "rb").read())
+        >>> sorted(images)
+        ['image_1_400x_watermark_steghide.jpg', 'image_2_steghide.jpg', ...]
+
 
         If you want to check what's written in a steghide'd image(s) :
 
         $ steghide extract -sf picture_steghide.jpg
+
+        or, for a whole directory (both backends) :
+
+        $ watersteg.py --source path/ --extract
+                       --passphrase="secret phrase" --message="Hello !" --overlay="overlay.png"
   ______________________________________________________________________________
 
   Transformations :
@@ -85,14 +103,35 @@
 
   Arguments :
 
-    usage: watersteg.py [-h] [--version] --source SOURCE [--destpath DESTPATH]
+    usage: watersteg.py [-h] [--version] [--source SOURCE] [--destpath DESTPATH]
                         [--debug] --passphrase PASSPHRASE --message MESSAGE
-                        [--quiet] --overlay OVERLAY
+                        [--quiet] --overlay OVERLAY [--jobs JOBS] [--pipeline]
+                        [--engine {imagemagick,native}] [--check-engine]
+                        [--stego {steghide,native}] [--extract] [--benchmark-stego]
+                        [--font FONT] [--cache-size CACHE_SIZE]
+                        [--result-cache RESULT_CACHE]
+                        [--recursive] [--include INCLUDE] [--exclude EXCLUDE]
+                        [--transforms TRANSFORMS] [--benchmark]
+                        [--benchmark-report BENCHMARK_REPORT]
+                        [--benchmark-baseline BENCHMARK_BASELINE]
+                        [--metrics-json METRICS_JSON]
+                        [--metrics-prom METRICS_PROM]
+                        [--concurrency CONCURRENCY] [--large-images]
+                        [--memory-limit MEMORY_LIMIT] [--pixel-cache PIXEL_CACHE]
+                        [--prescan] [--capacity-index CAPACITY_INDEX] [--verify]
+                        [--verify-report VERIFY_REPORT] [--watch]
+                        [--status-socket STATUS_SOCKET] [--scratch SCRATCH]
+                        [--shard SHARD] [--queue QUEUE]
+                        [--lease-seconds LEASE_SECONDS] [--manifest MANIFEST]
+                        [--memory-budget MEMORY_BUDGET] [--threads THREADS]
+                        [--jpeg-fast-path] [--dest-archive DEST_ARCHIVE]
+                        [--journal JOURNAL] [--resume]
 
     optional arguments:
       -h, --help            show this help message and exit
       --version             show the version and exit
       --source SOURCE       input file or input directory. Wildcards accepted
+                            (required, except with --benchmark and --verify)
                             (default: None)
       --destpath DESTPATH   output path (default: .)
       --debug               display debug messages (default: False)
@@ -102,10 +141,293 @@
       --quiet               disallow common messages' display; only the error
                             messages will be display (default: False)
       --overlay OVERLAY     Overlay file to be used. (default: None)
+      --jobs JOBS           number of source files transformed at once by a pool
+                            of worker processes; 0 means one worker per CPU
+                            (default: 1)
+      --pipeline            decode each source file once : all the images are
+                            written by a single call to ImageMagick (default:
+                            False)
+      --engine {imagemagick,native}
+                            imaging engine : ImageMagick's programs or an in-
+                            process engine based on Pillow and NumPy (default:
+                            imagemagick)
+      --check-engine        don't write anything in the destination path but
+                            compare, for each source file, the images written by
+                            both engines (default: False)
+      --stego {steghide,native}
+                            steganography backend : steghide or an in-process
+                            backend based on NumPy, embedding in the pixels of the
+                            lossless BMP/PNG files only (the JPEG files are always
+                            given to steghide, which embeds in their DCT
+                            coefficients) (default: steghide)
+      --extract             don't transform the source files but extract the
+                            message embedded in each of them and compare it with
+                            --message (default: False)
+      --benchmark-stego     don't transform the source files but measure the time
+                            spent to embed --message in them : both backends on
+                            the BMP files, steghide alone on the JPEG files (the
+                            native backend doesn't handle them) (default: False)
+      --font FONT           font of the watermark (ImageMagick's default font if
+                            not given) (default: None)
+      --cache-size CACHE_SIZE
+                            maximal number of watermark tiles and of resized
+                            overlays kept by each process (default: 32)
+      --result-cache RESULT_CACHE
+                            directory storing the destination files by content :
+                            a destination file already computed for the same
+                            source content and parameters is hardlinked (or
+                            copied) instead of being computed again (default:
+                            None)
+      --recursive           read the source files in the subdirectories too; the
+                            destination files are written in the same
+                            subdirectories of the destination path (default:
+                            False)
+      --include INCLUDE     only transform the source files matching this pattern
+                            (e.g. "*.jpg"); may be given several times (default:
+                            [])
+      --exclude EXCLUDE     don't transform the source files matching this
+                            pattern; may be given several times (default: [])
+      --transforms TRANSFORMS
+                            numbers of the transformations to be applied,
+                            separated by commas (default: 1,2,3,4,5)
+      --benchmark           don't transform the source files but time the
+                            transformations on a synthetic corpus, written in
+                            --source if it is given (in a temporary directory
+                            otherwise) (default: False)
+      --benchmark-report BENCHMARK_REPORT
+                            JSON file where the benchmark's report is written
+                            (displayed if not given) (default: None)
+      --benchmark-baseline BENCHMARK_BASELINE
+                            JSON report of a previous benchmark : the
+                            regressions are displayed and the program exits
+                            with 1 (default: None)
+      --metrics-json METRICS_JSON
+                            JSON file where the metrics of the external programs
+                            (wall/CPU time, exit status, output size, peak RSS)
+                            are written, per stage, per transformation and per
+                            source file (default: None)
+      --metrics-prom METRICS_PROM
+                            textfile where the metrics of the external programs
+                            are written for the node exporter of Prometheus
+                            (default: None)
+      --concurrency CONCURRENCY
+                            number of external programs run at the same time for
+                            one source file : with more than 1, the independent
+                            transformations and their embeddings are run
+                            concurrently by asyncio (default: 1)
+      --large-images        large-image mode : JPEG shrink-on-load for the resize
+                            step, overlay composited in bands by the native
+                            engine, ImageMagick's memory bounded by --memory-
+                            limit, peak RSS displayed for each file (--pipeline
+                            is ignored) (default: False)
+      --memory-limit MEMORY_LIMIT
+                            (--large-images) memory (in MiB) used by ImageMagick
+                            for its pixels, in each process; beyond, the pixels
+                            are cached on disk, in --pixel-cache (default: 256)
+      --pixel-cache PIXEL_CACHE
+                            (--large-images) directory where ImageMagick caches
+                            the pixels on disk (a temporary directory if not
+                            given) (default: None)
+      --prescan             estimate the capacity of each destination file before
+                            computing it : the transformations whose destination
+                            file couldn't carry the message are skipped (default:
+                            False)
+      --capacity-index CAPACITY_INDEX
+                            (--prescan) SQLite file where the capacities of the
+                            source files are stored by SHA-256, for the next runs
+                            (default: None)
+      --verify              don't transform anything but extract the message
+                            embedded in each destination file found in --destpath
+                            (and in its subdirectories) and compare it with
+                            --message; the program exits with 1 if a file is
+                            wrong (default: False)
+      --verify-report VERIFY_REPORT
+                            (--verify) JSON file where the status and the time of
+                            each destination file are written (default: None)
+      --watch               daemon : transform every file written or moved in the
+                            --source directory by a pool of --jobs worker
+                            processes started once, until SIGTERM or ^C (default:
+                            False)
+      --status-socket STATUS_SOCKET
+                            (--watch) Unix socket sending the status of the queue
+                            (depth, latencies) as JSON to each client (default:
+                            None)
+      --scratch SCRATCH     directory where the images are computed and steghide'd
+                            before being published in --destpath by a rename (or a
+                            single copy); /dev/shm if it has room, the temporary
+                            directory otherwise (default: None)
+      --shard SHARD         i/N : only transform the i-th of N deterministic
+                            shares of the source files (1 <= i <= N), e.g. one per
+                            node (default: None)
+      --queue QUEUE         work queue shared by several processes or nodes : each
+                            source file is claimed through a lease file in this
+                            directory and transformed once (default: None)
+      --lease-seconds LEASE_SECONDS
+                            (--queue) a lease which hasn't been renewed for this
+                            time (the node has crashed) is taken over by another
+                            node (default: 300)
+      --manifest MANIFEST   fan-out : CSV (recipient,message,passphrase) or JSONL
+                            file of recipients; each source file is prepared once
+                            and watermarked/steghide'd for every recipient
+                            (default: None)
+      --memory-budget MEMORY_BUDGET
+                            memory (in MiB) of the images transformed at the same
+                            time : the dimensions of the source files are read
+                            first, the largest files are transformed first and a
+                            file is only given to a worker if its estimated memory
+                            fits (default: None)
+      --threads THREADS     number of threads split between the worker processes
+                            and the threads of ImageMagick (MAGICK_THREAD_LIMIT);
+                            --jobs 0 means one worker per thread (default: None)
+      --jpeg-fast-path      JPEG sources : the gray image of the transformation #4
+                            is made in the DCT domain by jpegtran (lossless) and
+                            the resize step decodes the source at a reduced DCT
+                            scale; the gray images use the Rec.601 luma instead of
+                            Rec.709 (default: False)
+      --dest-archive DEST_ARCHIVE
+                            the destination files are appended to this archive
+                            (tar, or zip if the name ends with .zip) instead of
+                            being written in --destpath; an index
+                            (name,offset,size) is written in "<archive>.index"
+                            (default: None)
+      --journal JOURNAL     append-only journal where every destination file is
+                            recorded as started then completed (fsync'ed)
+                            (default: None)
+      --resume              (--journal) continue the batch recorded in the journal
+                            : the files completed are skipped, the ones only
+                            started are computed again (default: False)
   ______________________________________________________________________________
 
   History :
 
+        o version 7 (2026_10_17)
+
+                o added --jobs : the source files are spread over a pool of
+                  worker processes, each one with its own steghide embed file.
+                o added --pipeline : each source file is decoded once and the
+                  images of the transformations #1, #3, #4 and #5 are written
+                  by one call to convert (see run_steps__pipeline()).
+                o added steghide_embed().
+                o added --engine native : resize, grayscale, watermark and
+                  overlay are computed in-process by Pillow/NumPy (see the
+                  native_*() functions); --check-engine compares both engines.
+                o added --stego native : the message is embedded in-process in
+                  the BMP/PNG files (see the native_stego_*() functions and
+                  STEGO__BACKENDS); --extract checks the embedded messages and
+                  --benchmark-stego compares both backends. The JPEG files are
+                  still embedded by steghide (in their DCT coefficients) :
+                  Pillow doesn't give access to the coefficients, and an
+                  embedding in the decoded pixels wouldn't survive the JPEG
+                  encoding.
+                o the watermark tiles and the resized overlays are rendered
+                  once and kept in bounded LRU caches (see LRUCache,
+                  get_watermark_tile() and get_overlay()); added --font and
+                  --cache-size.
+                o added --result-cache : the destination files are stored by
+                  content (source, overlay, message, passphrase, transformation,
+                  version) and reused by the reruns and the duplicated sources;
+                  the digests are indexed by path/size/mtime in an SQLite file.
+                o the transformN() functions return the exit status of the
+                  embedding; apply_transformations() reads TRANSFORMATIONS.
+                o the source files are found by os.scandir() and transformed as
+                  soon as they are found; added --recursive, --include and
+                  --exclude; the files which can't carry steganographic data
+                  (README, .xmp, PNG with steghide...) are skipped after reading
+                  their first bytes (see sniff_image_format()).
+                o added --transforms : only the selected transformations are
+                  applied. The transformations are described as chains of steps
+                  (see TRANSFORMATION_STEPS); a chain shared by several
+                  transformations is computed once (see run_transformations()).
+                o added --benchmark : the transformations are timed on a
+                  synthetic corpus generated from fixed seeds (see
+                  generate_corpus()); the report gives images/s, p50/p95
+                  latencies and peak RSS; --benchmark-report writes it as JSON
+                  and --benchmark-baseline flags the regressions.
+                o system() runs the orders through run_order(), which records
+                  the wall time, CPU time, exit status, output size and peak RSS
+                  of every external stage (convert, identify, steghide...) per
+                  transformation and per source file (see record_stage());
+                  added --metrics-json and --metrics-prom.
+                o the external programs are called without any shell : the
+                  orders are lists of arguments (see run_order()).
+                o added --concurrency : the chains of steps and the embeddings
+                  of a source file are run as a graph of asyncio tasks (see
+                  run_transformations__async()). Python 3.7 or later is now
+                  required.
+                o added --large-images : the resize step decodes the JPEG
+                  sources at a reduced scale (shrink-on-load), the native engine
+                  composites the overlay in bands (see native_overlay__bands()),
+                  ImageMagick's memory is bounded by --memory-limit with a pixel
+                  cache on disk (--pixel-cache) and the peak RSS of each file is
+                  displayed and written in the metrics.
+                o added --prescan : the capacity of each source file ("steghide
+                  info" or the native backend) is scaled to the size of each
+                  destination file; the destination files which couldn't carry
+                  the message are skipped and reported (see
+                  prescan_transformations()). --capacity-index keeps the
+                  capacities by SHA-256.
+                o added --verify : the destination files found in --destpath
+                  (see find_destination_files()) are checked by the worker
+                  processes; --verify-report writes the status and the time of
+                  each file.
+                o added --watch : a daemon watches the source directory with
+                  inotify and gives the new files to a pool of worker processes
+                  started once (see watch_source_directory()); --status-socket
+                  sends the depth of the queue and the latencies.
+                o watersteg can be imported : the command line is run by main()
+                  and process() transforms an image given as bytes, without
+                  writing anything on disk (the images go through pipes, see
+                  run_order__pipes()).
+                o added --scratch : the images are computed and steghide'd in a
+                  scratch directory (/dev/shm by default), then published in the
+                  destination path by a rename or a single copy (see
+                  publish_file()); a file whose embedding has failed isn't
+                  published anymore.
+                o added --shard : the source files are split in N shares by the
+                  SHA-1 of their relative paths (see is_in_shard()).
+                o added --queue and --lease-seconds : several processes or nodes
+                  share the source files through lease files, renewed while a
+                  file is transformed and taken over when they expire; a "done"
+                  mark prevents a file from being transformed twice (see
+                  transform_file__queue()).
+                o added --manifest : fan-out mode, the source files are
+                  transformed for every recipient (message, passphrase) of a
+                  CSV/JSONL file (see read_manifest()); the resized, gray and
+                  overlaid images are computed once and only the watermark and
+                  the embedding are done for each recipient (see
+                  run_transformations__fanout()).
+                o added --memory-budget : the dimensions of the source files are
+                  read in their headers, the largest files are transformed first
+                  and a file is given to a worker only if its estimated memory
+                  fits in the budget (see admit_jobs()); added --threads, split
+                  between the workers and the threads of ImageMagick.
+                o added --jpeg-fast-path : for the JPEG sources, the gray image of
+                  the transformation #4 is made by jpegtran in the DCT domain,
+                  without a second lossy compression (see run_jpeg_fast_path())
+                  and the resize step decodes the source at a reduced DCT scale
+                  (not with --pipeline); the gray images of #4 and #5 use the
+                  Rec.601 luma of the JPEG files (see gray_method()); --benchmark
+                  gives the megapixels/s and the speedup of the fast path.
+                o added --dest-archive : the destination files are written in the
+                  scratch directory, appended to one archive (uncompressed tar or
+                  stored zip) as soon as their source file is transformed, then
+                  removed (see DestArchive); the index "<archive>.index" gives the
+                  offset and the size of each file in the archive.
+                o added --journal : every destination file is recorded as started,
+                  then as completed, in an append-only journal (fsync'ed, see
+                  journal_write()); added --resume : the source and destination
+                  files completed by the previous run are skipped, the files only
+                  started are removed and computed again (see read_journal()).
+                o a progress line (files done, images/s, ETA) is displayed while
+                  the source files are transformed (see progress_line()); they
+                  are counted by a thread (see count_source_files()).
+                o Pylint 4.1.3 : 9.18/10; the messages left are the
+                  "...".format() calls of the previous versions
+                  (consider-using-f-string), the size of some functions
+                  (too-many-*) and no-member for NumPy and Pillow.
+                o tests/ : "python -m pytest tests", without ImageMagick nor
+                  steghide (fake programs or fake functions take their place).
+
         o version 6 (2015_10_25)
 
                 o added a fifth transformation : transf5__gray__steg_overlay()
@@ -161,20 +483,66 @@
 """
 
 import argparse
+import asyncio
+import atexit
+import collections
+import csv
+import ctypes
+import ctypes.util
 import fnmatch
+import hashlib
+import io
+import json
+import math
+import multiprocessing
 import os.path
-from subprocess import check_output
+import queue
+import re
+import resource
+import select
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
+import shlex
+from subprocess import Popen, PIPE
 import sys
+import tarfile
 import tempfile
-
-PROGRAM_VERSION = "6"
+import threading
+import time
+import zipfile
+import zlib
+
+# Pillow and NumPy are only required by the native engine (--engine native) :
+try:
+    import numpy
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    numpy = None
+    Image = ImageDraw = ImageFont = None
+
+PROGRAM_VERSION = "7"
 PROGRAM_NAME = "Watersteg"
 
 # prompt displayed before any message on the console :
 PROMPT = "~"
 
+# command line arguments (see get_args()), destination path, overlay file and
+# number of worker processes : set by main(). process() doesn't use them : its
+# arguments are given to the functions it calls.
+ARGS = None
+DESTPATH = None
+OVERLAY = None
+JOBS = 1
+
 # file where the message to be embed will be written. This file will be erased
 # (see the end of the file).
+#
+# With --jobs > 1, every worker process gets its own copy of this file, in its
+# own temporary directory (see init_worker()) : the name stored by steghide in
+# the destination files remains the same.
 STEGHIDE__EMBED_FILE = "steghide.embed"
 
 # format of the destination files :
@@ -189,399 +557,4790 @@ FILENAME__TRANS3__FORMAT = "{0}{1}_3_steghide_overlay{2}"
 FILENAME__TRANS4__FORMAT = "{0}{1}_4_gray_steghide{2}"
 FILENAME__TRANS5__FORMAT = "{0}{1}_5_gray_steghide_overlay{2}"
 
-#///////////////////////////////////////////////////////////////////////////////
-def system(order):
-    """
-        Give a system "order" through a call to os.system() .
-
-        Display the order if an error occurs and stop the program.
-    """
-    if ARGS.debug:
-        print("@@ os.system() : \"{0}\"".format(order))
-
-    return os.system(order)
+# steps of the transformations : the destination file of a transformation is
+# the source file transformed by its steps, in this order, then steghide'd (see
+# run_transformations()). The chains of steps shared by several transformations
+# (e.g. ("gray",) for #4 and #5) are computed once.
+TRANSFORMATION_STEPS = {1: ("resize", "watermark"),
+                        2: (),
+                        3: ("overlay",),
+                        4: ("gray",),
+                        5: ("gray", "overlay")}
+
+# benchmark (--benchmark) :
+#
+#     o  synthetic corpus : BENCHMARK__IMAGES images for each resolution and
+#        each format, see generate_corpus()
+#     o  sizes of the batches given to apply_transformations()
+#     o  a result is a regression if its images/s (or its p95 latency) is worse
+#        than the baseline's one by more than this ratio
+#
+BENCHMARK__RESOLUTIONS = ((640, 480), (1920, 1080), (4000, 3000))
+BENCHMARK__FORMATS = (".jpg", ".bmp")
+BENCHMARK__IMAGES = 2
+BENCHMARK__BATCH_SIZES = (1, 4, 16)
+BENCHMARK__REGRESSION_THRESHOLD = 0.10
+
+# source files : the first bytes of a file give its format (see
+# sniff_image_format()); only the formats which can carry steganographic data
+# are transformed (see is_a_source_file()).
+SOURCE__SNIFF_LENGTH = 8
+SOURCE__MAGIC_NUMBERS = ((b"\xff\xd8\xff", "JPEG"),
+                         (b"BM", "BMP"),
+                         (b"\x89PNG\r\n\x1a\n", "PNG"))
+
+# watermark tile : size and color of the text (see get_watermark_tile())
+WATERMARK__TILE_SIZE = (240, 160)
+
+# directory where the cached watermark tiles and overlays are written by the
+# ImageMagick engine (see init_caches()) :
+CACHE__DIRECTORY = None
+
+# caches shared by all the source files transformed by a process (see
+# init_caches()) :
+#
+#     o  WATERMARK__CACHE : (engine, message, tile size, font) -> watermark tile
+#     o  OVERLAY__CACHE : (engine, overlay, overlay's mtime, target size, gray)
+#                          -> overlay resized to the target size
+#
+WATERMARK__CACHE = None
+OVERLAY__CACHE = None
 
-#///////////////////////////////////////////////////////////////////////////////
-def external_programs_are_available():
-    """
-        Check that the external programs required by waterseg are present.
-        If an error occurs, display a message explaining what was the problem.
+# result cache (--result-cache) : (pid, connection to the index), see
+# get_result_cache_index(); size of the chunks read to compute the digests.
+RESULT_CACHE__INDEX = None
+RESULT_CACHE__CHUNK_SIZE = 1024 * 1024
 
-        Return a boolean.
-    """
-    result = True
+# daemon (--watch) :
+#
+#     o  inotify's events (see <sys/inotify.h>) : a source file is transformed
+#        once it has been written (IN_CLOSE_WRITE) or moved (IN_MOVED_TO) in a
+#        watched directory; the new subdirectories (IN_CREATE + IN_ISDIR) are
+#        watched with --recursive.
+#     o  size of the buffer reading the events
+#     o  number of latencies (reception -> destination files written) kept for
+#        the status (--status-socket)
+#     o  names of the temporary files ("{file}.{pid}.tmp") written then renamed
+#        by publish_file(), result_cache_fetch() and the queue : never sources
+#
+INOTIFY__IN_CLOSE_WRITE = 0x00000008
+INOTIFY__IN_MOVED_TO = 0x00000080
+INOTIFY__IN_CREATE = 0x00000100
+INOTIFY__IN_Q_OVERFLOW = 0x00004000
+INOTIFY__IN_ISDIR = 0x40000000
+INOTIFY__MASK = INOTIFY__IN_CLOSE_WRITE | INOTIFY__IN_MOVED_TO | INOTIFY__IN_CREATE
+INOTIFY__BUFFER_SIZE = 64 * 1024
+WATCH__LATENCIES = 1000
+WATCH__TMPFILE_PATTERN = re.compile(r"\.[0-9]+\.tmp$")
+
+# capacity pre-scan (--prescan) :
+#
+#     o  PRESCAN__STEGHIDE_OVERHEAD : bytes added by steghide to the message and
+#        to the name of the embed file (header, encryption)
+#     o  PRESCAN__STEGHIDE_GRAY_FACTORS : steghide's capacity of the gray version
+#        of an image, relatively to the capacity of the image : one sample out of
+#        three for BMP, the luminance coefficients for JPEG (without the
+#        chrominance, subsampled)
+#     o  PRESCAN__INDEX : (pid, connection to the capacity index), see
+#        get_prescan_index()
+#     o  PRESCAN__SKIPPED : (destination file, estimated capacity, needed bytes)
+#        of the destination files skipped by this process
+#
+PRESCAN__STEGHIDE_OVERHEAD = 64
+PRESCAN__STEGHIDE_GRAY_FACTORS = {".bmp": 1.0 / 3, ".jpg": 2.0 / 3, ".jpeg": 2.0 / 3}
+PRESCAN__INDEX = None
+PRESCAN__SKIPPED = []
 
-    with tempfile.NamedTemporaryFile(mode='w', delete='True') as tmpfile:
+# native engine (--engine native) :
+#
+#     o  Rec.709 luma coefficients, as used by "-grayscale rec709luma", and
+#        Rec.601 ones, as used by "-grayscale rec601luma" (see gray_method())
+#     o  "grey" in ImageMagick is the X11 color #bebebe
+#     o  quality of the JPEG files when the source quality can't be estimated
+#        (ImageMagick's default)
+#     o  mean absolute difference (0-255 scale) accepted by --check-engine
+#        between the images written by both engines
+#
+NATIVE__REC709LUMA = (0.212656, 0.715158, 0.072186)
+NATIVE__REC601LUMA = (0.298839, 0.586811, 0.114350)
+NATIVE__WATERMARK_COLOR = (190, 190, 190, 255)
+NATIVE__DEFAULT_JPEG_QUALITY = 92
+NATIVE__CHECK_TOLERANCE = 4.0
+
+# libjpeg's standard luminance quantization table (quality 50), used to
+# estimate the quality of a JPEG source :
+NATIVE__STD_LUMINANCE_QUANT_TABLE = (16, 11, 10, 16, 24, 40, 51, 61,
+                                     12, 12, 14, 19, 26, 58, 60, 55,
+                                     14, 13, 16, 24, 40, 57, 69, 56,
+                                     14, 17, 22, 29, 51, 87, 80, 62,
+                                     18, 22, 37, 56, 68, 109, 103, 77,
+                                     24, 35, 55, 64, 81, 104, 113, 92,
+                                     49, 64, 78, 87, 103, 121, 120, 101,
+                                     72, 92, 95, 98, 112, 100, 103, 99)
+
+# native steganography backend (--stego native) :
+#
+#     o  the payload is NATIVE_STEGO__MAGIC + length of the message (4 bytes) +
+#        message + CRC32 of the message (4 bytes), encrypted by a keystream
+#        derived from the passphrase.
+#     o  the payload's bits replace the least significant bit of pixel samples
+#        chosen by a pseudo-random generator seeded by the passphrase.
+#     o  only lossless formats can carry these bits; the other covers (JPEG)
+#        are given to steghide.
+#
+NATIVE_STEGO__MAGIC = b"WSTG"
+NATIVE_STEGO__SALT = b"watersteg"
+NATIVE_STEGO__ITERATIONS = 10000
+NATIVE_STEGO__EXTENSIONS = (".bmp", ".png")
+NATIVE_STEGO__BLOCK = 4096
 
-        # TEST : does "convert" exist ?
-        if result and system("convert -version > {0}".format(tmpfile.name)) != 0:
-            print("{0} !! ImageMagic/convert can't be find : " \
-                  "the program has to stop.".format(PROMPT))
-            result = False
+# large images (--large-images) :
+#
+#     o  the resize step decodes the JPEG sources at LARGE_IMAGES__SHRINK_FACTOR
+#        times the target width (libjpeg's DCT scaling, "shrink-on-load")
+#     o  the native engine composites the overlay in bands of
+#        LARGE_IMAGES__BAND_HEIGHT rows
+#     o  ImageMagick's map limit is LARGE_IMAGES__MAP_FACTOR times its memory
+#        limit (--memory-limit); beyond, the pixels are cached on disk
+#
+LARGE_IMAGES__SHRINK_FACTOR = 2
+LARGE_IMAGES__BAND_HEIGHT = 512
+LARGE_IMAGES__MAP_FACTOR = 2
+
+# scratch directory (--scratch) : the images are computed and steghide'd there,
+# then published in the destination path (see publish_file()). Default : the
+# RAM-backed SCRATCH__DIRECTORY if at least SCRATCH__MINIMUM_FREE bytes are
+# available there, the temporary directory of the system otherwise.
+SCRATCH__DIRECTORY = "/dev/shm"
+SCRATCH__MINIMUM_FREE = 512 * 1024 * 1024
+
+# several nodes (--shard, --queue) :
+#
+#     o  --shard i/N : a source file belongs to the shard given by the SHA-1 of
+#        its path relative to --source, the same on every node (see
+#        source_file_key())
+#     o  --queue : a node claims a source file by creating its lease file
+#        "<SHA-1>.lease" (O_EXCL) in the queue directory and renews it every
+#        --lease-seconds / QUEUE__HEARTBEAT_FACTOR seconds while the file is
+#        transformed; a lease not renewed for --lease-seconds is taken over by
+#        another node. "<SHA-1>.done" marks the source files already transformed.
+#
+QUEUE__HEARTBEAT_FACTOR = 3
 
-        # TEST : does "steghide" exist ?
-        if result and system("steghide --version > {0}".format(tmpfile.name)) != 0:
-            print("{0} !! steghide can't be find : the program has to stop.".format(PROMPT))
-            result = False
+# fan-out (--manifest) : columns of the CSV manifest (keys of the JSONL one); a
+# missing recipient is named after its line, a missing passphrase is
+# --passphrase. The destination files of a recipient are named after
+# "<source basename>_<recipient>" (see apply_transformations__fanout()).
+MANIFEST__FIELDS = ("recipient", "message", "passphrase")
 
-    return result
+# admission control (--memory-budget, --threads) :
+#
+#     o  the memory needed to transform a source file is estimated from the
+#        dimensions read in its header : ADMISSION__BYTES_PER_PIXEL bytes per
+#        pixel (ImageMagick Q16 keeps 8 bytes per RGBA pixel, for about three
+#        images at once : source, intermediate image, overlay)
+#     o  the thread budget is split between the worker processes (and
+#        --concurrency) and the OpenMP threads of ImageMagick
+#
+ADMISSION__BYTES_PER_PIXEL = 24
+
+# archive sink (--dest-archive, see DestArchive) : the destination files are
+# written in the scratch directory, appended to the archive as soon as their
+# source file is transformed, then removed. The archive is an uncompressed tar,
+# or a zip (stored) if its name ends with DEST_ARCHIVE__ZIP_EXTENSION; the index
+# "<archive><DEST_ARCHIVE__INDEX_SUFFIX>" (CSV : name,offset,size) gives where
+# the bytes of each file are in the archive.
+DEST_ARCHIVE__ZIP_EXTENSION = ".zip"
+DEST_ARCHIVE__INDEX_SUFFIX = ".index"
+
+# crash-safe journal (--journal) : one JSON record per line, appended and
+# fsync'ed (see journal_write()) :
+#
+#     o  {"event": "started", "source": ..., "transform": n, "file": ...} : the
+#        destination file "file" is going to be computed
+#     o  {"event": "completed", "source": ..., "transform": n, "file": ...} : the
+#        destination file has been published
+#     o  {"event": "completed", "source": ..., "transforms": [...]} : all the
+#        destination files of the source file have been written
+#
+# With --resume, the journal of the previous run is read first (see
+# read_journal()) : the source files completed are skipped, the destination
+# files completed are kept (JOURNAL__DONE_SOURCES, JOURNAL__DONE_FILES : absolute
+# paths) and the destination files started but not completed are removed and
+# computed again.
+JOURNAL__DONE_SOURCES = set()
+JOURNAL__DONE_FILES = set()
+
+# minimal interval (in seconds) between two progress lines :
+PROGRESS__INTERVAL = 1.0
+
+# passphrase -> key, see native_stego_key()
+NATIVE_STEGO__KEYS = {}
+
+# last image decoded by native_open() : the five transformations of a source
+# file decode it only once.
+NATIVE__LAST_IMAGE = (None, None)
+
+# metrics of the external stages (convert, identify, steghide...), see
+# record_stage() :
+#
+#     o  "metrics" : where the counters are added (see new_metrics())
+#     o  "transform" : transformation(s) being computed, e.g. "3" or "4+5"
+#     o  "file" : source file being transformed
+#
+METRICS__CONTEXT = {"metrics": None, "transform": None, "file": None}
 
 #///////////////////////////////////////////////////////////////////////////////
-def get_args():
+def new_metrics():
     """
-        Read the command line arguments.
-
-        Return the argparse object.
-    """
-    parser = argparse.ArgumentParser(description="{0} v. {1}".format(PROGRAM_NAME, PROGRAM_VERSION),
-                                     epilog="by suizokukan AT orange DOT fr",
-                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-
-    parser.add_argument('--version',
-                        action='version',
-                        version="{0} v. {1}".format(PROGRAM_NAME, PROGRAM_VERSION),
-                        help="show the version and exit")
+        Return an empty metrics dict (see record_stage()) :
 
-    parser.add_argument('--source',
-                        type=str,
-                        required=True,
-                        help="input file or input directory. Wildcards accepted")
+            o "stages" : stage -> counters
+            o "transforms" : transformation(s) -> stage -> counters
+            o "files" : source file -> counters (all the stages)
 
-    parser.add_argument('--destpath',
-                        type=str,
-                        default=".",
-                        help="output path")
+        The counters are a dict : runs, failures, wall_seconds, cpu_seconds,
+        output_bytes and maxrss_kb (the largest peak RSS of a run); with
+        --large-images, the counters of a source file also give self_maxrss_kb,
+        the peak RSS of watersteg while the file was transformed.
+    """
+    return {"stages": {}, "transforms": {}, "files": {}}
 
-    parser.add_argument('--debug',
-                        action="store_true",
-                        help="display debug messages")
+#///////////////////////////////////////////////////////////////////////////////
+def add_counters(total, counters):
+    """
+        Add counters (see new_metrics()) to total.
+    """
+    for name, value in counters.items():
+        if name.endswith("maxrss_kb"):
+            total[name] = max(total.get(name, 0), value)
+        else:
+            total[name] = total.get(name, 0) + value
 
-    parser.add_argument('--passphrase',
-                        type=str,
-                        required=True,
-                        default="passphrase",
-                        help="steghide passphrase")
+#///////////////////////////////////////////////////////////////////////////////
+def merge_metrics(total, metrics):
+    """
+        Add metrics (see new_metrics()) to total.
+    """
+    for stage, counters in metrics["stages"].items():
+        add_counters(total["stages"].setdefault(stage, {}), counters)
+    for transformations, stages in metrics["transforms"].items():
+        for stage, counters in stages.items():
+            add_counters(total["transforms"].setdefault(transformations, {}).setdefault(stage, {}),
+                         counters)
+    for filename, counters in metrics["files"].items():
+        add_counters(total["files"].setdefault(filename, {}), counters)
 
-    parser.add_argument('--message',
-                        type=str,
-                        required=True,
-                        default="message",
-                        help="steghide message to be embed")
+#///////////////////////////////////////////////////////////////////////////////
+def record_stage(stage, counters, transform=None):
+    """
+        Add the counters of a run of stage to METRICS__CONTEXT["metrics"], for
+        the current transformation(s) and the current source file (see
+        METRICS__CONTEXT).
 
-    parser.add_argument('--quiet',
-                        action="store_true",
-                        help="disallow common messages' display; " \
-                             "only the error messages will be display")
+        transform : the transformation(s), if not METRICS__CONTEXT["transform"]
 
-    parser.add_argument('--overlay',
-                        type=str,
-                        required=True,
-                        help="Overlay file to be used.")
+        Nothing is recorded if METRICS__CONTEXT["metrics"] is None (e.g. the
+        calls to process() outside of the command line).
+    """
+    metrics = METRICS__CONTEXT["metrics"]
+    if metrics is None:
+        return
+
+    # metrics is a dict (see new_metrics()), not the None of the initial value :
+    # pylint: disable=unsubscriptable-object
+    add_counters(metrics["stages"].setdefault(stage, {}), counters)
+    add_counters(metrics["transforms"].setdefault(transform or
+                                                  METRICS__CONTEXT["transform"] or "-",
+                                                  {}).setdefault(stage, {}),
+                 counters)
+    if METRICS__CONTEXT["file"] is not None:
+        add_counters(metrics["files"].setdefault(METRICS__CONTEXT["file"], {}), counters)
 
-    return parser.parse_args()
+#///////////////////////////////////////////////////////////////////////////////
+def outputs_size(outputs):
+    """
+        Return the sum of the sizes of the files of outputs which exist.
+    """
+    return sum(os.path.getsize(output) for output in outputs if os.path.exists(output))
 
 #///////////////////////////////////////////////////////////////////////////////
-def transform1__r400_wm_s(sourcefilename, destfilename):
+def run_order(order, outputs=(), capture=False, data=None, pass_fds=()):
     """
-        transformation :
+        Run an "order" (a list of arguments, the first one being the program;
+        no shell is involved) and record its wall time, CPU time, exit status,
+        output size and peak RSS (see record_stage()); the stage is the name of
+        the program.
+
+        outputs : the files written by the order, whose sizes are added up
+        capture : if True, the standard output is read (its size is the output
+                  size); otherwise it is discarded.
+        data : if not None, bytes written on the standard input of the order
+        pass_fds : file descriptors inherited by the order (see run_order__pipes())
+
+        Return (exit status as returned by os.system(), standard output or None).
+    """
+    if ARGS is not None and ARGS.debug:
+        print("@@ system() : \"{0}\"".format(" ".join(shlex.quote(arg) for arg in order)))
+
+    start = time.time()
+    try:
+        child = Popen(order,
+                      stdin=None if data is None else PIPE,
+                      stdout=PIPE if capture else None,
+                      pass_fds=pass_fds)
+    except OSError:
+        # the program can't be found : exit status of the shell in this case.
+        record_stage(order[0], {"runs": 1, "failures": 1})
+        return (127 << 8, None)
+
+    with child:
+        writer = None
+        if data is not None:
+            # written by a thread : the order may fill its standard output before
+            # having read all its standard input.
+            writer = threading.Thread(target=write_pipe, args=(child.stdin, data), daemon=True)
+            writer.start()
+
+        stdout = child.stdout.read() if capture else None
+        # os.wait4() gives the resources used by the order (and by the processes
+        # it has waited for); Linux counts in ru_maxrss the memory of the process
+        # which has called exec(), i.e. the RSS of watersteg when the order
+        # starts :
+        _, status, rusage = os.wait4(child.pid, 0)
+        child.returncode = status
+        if writer is not None:
+            writer.join()
+    wall = time.time() - start
+
+    record_stage(order[0],
+                 {"runs": 1,
+                  "failures": 1 if status != 0 else 0,
+                  "wall_seconds": wall,
+                  "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+                  "output_bytes": len(stdout) if capture else outputs_size(outputs),
+                  "maxrss_kb": rusage.ru_maxrss})
+
+    return (status, stdout)
 
-                source file -> source file + resize 400 + watermark + steghide
+#///////////////////////////////////////////////////////////////////////////////
+def write_pipe(pipe, content):
+    """
+        Write content (bytes) in pipe (a binary file object) and close it; the
+        reader may stop before the end (e.g. an order which has failed).
+    """
+    try:
+        with pipe:
+            pipe.write(content)
+    except (IOError, OSError):
+        pass
 
-        this function should be only called by apply_transformations()
+#///////////////////////////////////////////////////////////////////////////////
+def read_pipe(pipe, contents, index):
     """
-    with tempfile.NamedTemporaryFile(mode='w', delete='True') as tmpfile:
+        Read pipe (a binary file object) until its end, close it and store what
+        has been read in contents[index].
+    """
+    with pipe:
+        contents[index] = pipe.read()
 
-        # resize 400x...
-        system("convert \"{0}\" -resize 400 \"{1}\"".format(sourcefilename,
-                                                            tmpfile.name))
+#///////////////////////////////////////////////////////////////////////////////
+def run_order__pipes(order_function, data, inputs=(), outputs_number=0):
+    """
+        Run the order returned by order_function(input_fds, output_fds) (see
+        run_order()) with data (bytes) on its standard input; nothing is written
+        on disk :
 
-        if not ARGS.quiet:
-            print("     {0} ... creating {1} ...".format(PROMPT, destfilename))
+            o input_fds : the file descriptors from which the order reads the
+              contents of inputs (a list of bytes), e.g. "fd:3" for ImageMagick
+              or "/dev/fd/3" for the other programs;
+            o output_fds : outputs_number file descriptors where the order
+              writes, e.g. "jpg:fd:4" for ImageMagick.
 
-        # watermark
-        system("convert -size 240x160 xc:none -fill grey " \
-               "-gravity NorthWest -draw \"text 10,10 '{2}'\" " \
-               "-gravity SouthEast -draw \"text 5,15 '{2}'\" miff:- " \
-               "| composite -tile - \"{0}\" \"{1}\"".format(tmpfile.name,
-                                                            destfilename,
-                                                            ARGS.message))
+        Each pipe is written or read by its own thread.
 
-        # steghide
-        system("steghide embed -cf \"{0}\" -ef \"{1}\" -p \"{2}\" -q".format(destfilename,
-                                                                             STEGHIDE__EMBED_FILE,
-                                                                             ARGS.passphrase))
+        Return (exit status as returned by os.system(), standard output, list of
+        what has been written in output_fds).
+    """
+    input_fds = []
+    output_fds = []
+    contents = [b""] * outputs_number
+    threads = []
+    for content in inputs:
+        read_fd, write_fd = os.pipe()
+        input_fds.append(read_fd)
+        threads.append(threading.Thread(target=write_pipe,
+                                        args=(os.fdopen(write_fd, "wb"), content)))
+    for index in range(outputs_number):
+        read_fd, write_fd = os.pipe()
+        output_fds.append(write_fd)
+        threads.append(threading.Thread(target=read_pipe,
+                                        args=(os.fdopen(read_fd, "rb"), contents, index)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        status, stdout = run_order(order_function(input_fds, output_fds),
+                                   capture=True,
+                                   data=data,
+                                   pass_fds=input_fds + output_fds)
+    finally:
+        # the order has ended : the readers get the end of their pipes and the
+        # writers stop if the order hasn't read everything.
+        for file_descriptor in input_fds + output_fds:
+            os.close(file_descriptor)
+    for thread in threads:
+        thread.join()
+
+    return (status, stdout, contents)
 
 #///////////////////////////////////////////////////////////////////////////////
-def transform2__steghide(sourcefilename, destfilename):
+def system(order, outputs=()):
     """
-        transformation :
+        Give a system "order" (see run_order(), which records its metrics).
 
-                source file -> source file + steghide
+        outputs : the files written by the order
 
-        this function should be only called by apply_transformations()
+        Return the exit status, as os.system() does.
     """
-    if not ARGS.quiet:
-        print("     {0} ... creating {1} ....".format(PROMPT, destfilename))
-
-    system("steghide embed -cf \"{0}\" -ef \"{1}\" " \
-           "-p \"{2}\" -q -sf \"{3}\" -f".format(sourcefilename,
-                                                 STEGHIDE__EMBED_FILE,
-                                                 ARGS.passphrase,
-                                                 destfilename))
+    return run_order(order, outputs)[0]
 
 #///////////////////////////////////////////////////////////////////////////////
-def transform3__steghide_overlay(sourcefilename, destfilename, overlay):
+def write_metrics(metrics, json_filename, prom_filename):
     """
-        transformation :
+        (--metrics-json, --metrics-prom) Write metrics (see new_metrics()) :
 
-                source file -> source file + steghide + overlay
+            o json_filename : as a JSON summary (if not None)
+            o prom_filename : as a textfile for the node exporter of Prometheus
+              (if not None), without the per-file counters; the file is written
+              then renamed, so that the exporter never reads half a file.
+    """
+    if json_filename is not None:
+        with open(json_filename, "w", encoding="utf-8") as json_file:
+            json.dump(metrics, json_file, indent=4, sort_keys=True)
+
+    if prom_filename is not None:
+        lines = []
+        for name, help_text in (("runs", "runs of the external stage"),
+                                ("failures", "runs with an exit status != 0"),
+                                ("wall_seconds", "wall time of the runs"),
+                                ("cpu_seconds", "CPU time (user + system)"),
+                                ("output_bytes", "size of the written files"),
+                                ("maxrss_kb", "largest peak RSS of a run")):
+            metric = "watersteg_stage_" + name
+            lines.append("# HELP {0} {1} during the last run of watersteg.".format(metric,
+                                                                                 help_text))
+            lines.append("# TYPE {0} gauge".format(metric))
+            for transformations, stages in sorted(metrics["transforms"].items()):
+                for stage, counters in sorted(stages.items()):
+                    lines.append("{0}{{stage=\"{1}\",transform=\"{2}\"}} {3}".format(
+                        metric, stage, transformations, counters.get(name, 0)))
+
+        lines.append("# HELP watersteg_files number of source files during the last run " \
+                     "of watersteg.")
+        lines.append("# TYPE watersteg_files gauge")
+        lines.append("watersteg_files {0}".format(len(metrics["files"])))
+        lines.append("# HELP watersteg_last_run_timestamp_seconds end of the last run " \
+                     "of watersteg.")
+        lines.append("# TYPE watersteg_last_run_timestamp_seconds gauge")
+        lines.append("watersteg_last_run_timestamp_seconds {0}".format(time.time()))
+
+        with open(prom_filename + ".tmp", "w", encoding="utf-8") as prom_file:
+            prom_file.write("\n".join(lines) + "\n")
+        os.rename(prom_filename + ".tmp", prom_filename)
 
-        this function should be only called by apply_transformations()
+#///////////////////////////////////////////////////////////////////////////////
+def steghide_embed_order(coverfilename, stegofilename=None):
     """
-    if not ARGS.quiet:
-        print("     {0} ... creating {1} ....".format(PROMPT, destfilename))
+        Return the order (see run_order()) embedding the content of
+        STEGHIDE__EMBED_FILE in coverfilename and writing the result in
+        stegofilename (or in coverfilename itself if stegofilename is None).
+    """
+    order = ["steghide", "embed", "-cf", coverfilename, "-ef", STEGHIDE__EMBED_FILE,
+             "-p", ARGS.passphrase, "-q"]
+    if stegofilename is not None:
+        order += ["-sf", stegofilename, "-f"]
+    return order
 
-    # dimensions of the source file  ?
-    size = check_output(["identify", "-format", "%wx%h", sourcefilename])
+#///////////////////////////////////////////////////////////////////////////////
+def steghide_embed(coverfilename, stegofilename=None):
+    """
+        Embed the content of STEGHIDE__EMBED_FILE in coverfilename and write the
+        result in stegofilename (or in coverfilename itself if stegofilename is
+        None).
+    """
+    return system(steghide_embed_order(coverfilename, stegofilename),
+                  outputs=(stegofilename or coverfilename,))
 
-    system("convert -size {0} -composite \"{1}\" \"{2}\" " \
-           "-geometry {0}+0+0 -depth 8 \"{3}\"".format(size.decode(),
-                                                       sourcefilename,
-                                                       overlay,
-                                                       destfilename))
+#///////////////////////////////////////////////////////////////////////////////
+def steghide_extract(filename, passphrase):
+    """
+        Extract with steghide the message embedded in filename.
 
-    system("steghide embed -cf \"{0}\" -ef \"{1}\" " \
-           "-p \"{2}\" -q -sf \"{3}\" -f".format(destfilename,
-                                                 STEGHIDE__EMBED_FILE,
-                                                 ARGS.passphrase,
-                                                 destfilename))
+        Return the message (bytes) or None if nothing could be extracted.
+    """
+    tmpdirectory = tempfile.mkdtemp(prefix="watersteg.")
+    try:
+        extracted = os.path.join(tmpdirectory, "extracted")
+        if system(["steghide", "extract", "-sf", filename, "-p", passphrase,
+                   "-xf", extracted, "-f", "-q"],
+                  outputs=(extracted,)) != 0:
+            return None
+        with open(extracted, "rb") as extracted_file:
+            return extracted_file.read()
+    finally:
+        shutil.rmtree(tmpdirectory)
 
 #///////////////////////////////////////////////////////////////////////////////
-def transform4__gray__steghide(sourcefilename, destfilename):
+def native_stego_key(passphrase):
     """
-        transformation :
+        Return the 32 bytes key derived from passphrase (native steganography
+        backend). The keys are kept in NATIVE_STEGO__KEYS since the derivation is
+        slow on purpose.
+    """
+    if passphrase not in NATIVE_STEGO__KEYS:
+        NATIVE_STEGO__KEYS[passphrase] = hashlib.pbkdf2_hmac("sha256",
+                                                             passphrase.encode("utf-8"),
+                                                             NATIVE_STEGO__SALT,
+                                                             NATIVE_STEGO__ITERATIONS)
+    return NATIVE_STEGO__KEYS[passphrase]
 
-                source file -> source file in gray + steghide
+#///////////////////////////////////////////////////////////////////////////////
+def native_stego_keystream(key, length):
+    """
+        Return "length" bytes of keystream (SHA-256 of key + block counter) as a
+        NumPy array.
+    """
+    blocks = [hashlib.sha256(key + struct.pack(">I", counter)).digest()
+              for counter in range(length // 32 + 1)]
+    return numpy.frombuffer(b"".join(blocks)[:length], dtype=numpy.uint8)
 
-        this function should be only called by apply_transformations()
+#///////////////////////////////////////////////////////////////////////////////
+def native_stego_positions(key, carriers, count):
     """
-    if not ARGS.quiet:
-        print("     {0} ... creating {1} ....".format(PROMPT, destfilename))
+        Return the indexes of the "count" samples (among "carriers" samples)
+        carrying the payload's bits.
+
+        The candidates are drawn by blocks of a fixed size : the first positions
+        don't depend on "count", so that the header can be read before knowing
+        the length of the message. A candidate already drawn is skipped (a mask
+        of the samples already chosen : each block costs the same, even near
+        the capacity).
+    """
+    # the seed is read little-endian whatever the machine : a file embedded on
+    # one architecture is extracted on another.
+    random = numpy.random.RandomState(numpy.frombuffer(key, dtype="<u4"))
+    chosen = numpy.zeros(carriers, dtype=bool)
+    blocks = []
+    found = 0
+
+    while found < count:
+        candidates = random.randint(0, carriers, size=NATIVE_STEGO__BLOCK, dtype=numpy.int64)
+        # duplicates are removed, the first occurrence being kept :
+        first_occurrences = numpy.unique(candidates, return_index=True)[1]
+        candidates = candidates[numpy.sort(first_occurrences)]
+        candidates = candidates[~chosen[candidates]]
+        chosen[candidates] = True
+        blocks.append(candidates)
+        found += candidates.size
+
+    return numpy.concatenate(blocks)[:count]
 
-    system("convert -grayscale rec709luma \"{0}\" \"{1}\"".format(sourcefilename,
-                                                                  destfilename))
+#///////////////////////////////////////////////////////////////////////////////
+def native_stego_samples(filename):
+    """
+        Decode filename (or a binary file object) and return (image mode, NumPy
+        array of its samples, image format).
 
-    system("steghide embed -cf \"{0}\" -ef \"{1}\" " \
-           "-p \"{2}\" -q -sf \"{3}\" -f".format(destfilename,
-                                                 STEGHIDE__EMBED_FILE,
-                                                 ARGS.passphrase,
-                                                 destfilename))
+        The modes are restricted to the ones written back without loss.
+    """
+    with Image.open(filename) as image:
+        image_format = image.format
+        if image.mode not in ("L", "RGB", "RGBA", "LA") or \
+           (image_format == "BMP" and image.mode not in ("L", "RGB")):
+            image = image.convert("RGB")
+        return (image.mode, numpy.array(image), image_format)
 
 #///////////////////////////////////////////////////////////////////////////////
-def transf5__gray__steg_overlay(sourcefilename, destfilename, overlay):
+def native_stego_capacity(filename):
     """
-        transformation :
+        Return the number of message bytes that the native backend can embed in
+        filename.
+    """
+    samples = native_stego_samples(filename)[1]
+    return max(0, samples.size // 2 // 8 - len(NATIVE_STEGO__MAGIC) - 8)
 
-                source file -> source file + steghide + overlay
+#///////////////////////////////////////////////////////////////////////////////
+def native_stego_embed(coverfilename, stegofilename, message, passphrase):
+    """
+        Embed message (str) in coverfilename with the native backend and write the
+        result in stegofilename (which may be coverfilename); both may be binary
+        file objects (see embed__streams()).
 
-        this function should be only called by apply_transformations()
+        Return 0 if the message has been embedded, 1 otherwise (as system() does).
     """
-    if not ARGS.quiet:
-        print("     {0} ... creating {1} ....".format(PROMPT, destfilename))
+    message = message.encode("utf-8")
+    payload = NATIVE_STEGO__MAGIC + struct.pack(">I", len(message)) + message + \
+              struct.pack(">I", zlib.crc32(message) & 0xffffffff)
 
-    # dimensions of the source file  ?
-    size = check_output(["identify", "-format", "%wx%h", sourcefilename])
+    mode, samples, image_format = native_stego_samples(coverfilename)
+    flat = samples.reshape(-1)
 
-    system("convert -grayscale rec709luma -size {0} -composite \"{1}\" \"{2}\" " \
-           "-geometry {0}+0+0 -depth 8 \"{3}\"".format(size.decode(),
-                                                       sourcefilename,
-                                                       overlay,
-                                                       destfilename))
+    # at most one sample out of two carries a bit : see native_stego_positions().
+    if len(payload) * 8 > flat.size // 2:
+        print("{0} !! \"{1}\" is too small to carry the message.".format(PROMPT,
+                                                                       coverfilename))
+        return 1
 
-    system("steghide embed -cf \"{0}\" -ef \"{1}\" " \
-           "-p \"{2}\" -q -sf \"{3}\" -f".format(destfilename,
-                                                 STEGHIDE__EMBED_FILE,
-                                                 ARGS.passphrase,
-                                                 destfilename))
+    key = native_stego_key(passphrase)
+    encrypted = numpy.frombuffer(payload, dtype=numpy.uint8) ^ \
+                native_stego_keystream(key, len(payload))
+    bits = numpy.unpackbits(encrypted)
+
+    positions = native_stego_positions(key, flat.size, bits.size)
+    flat[positions] = (flat[positions] & 0xfe) | bits
+
+    Image.fromarray(samples, mode).save(stegofilename, format=image_format)
+    return 0
 
 #///////////////////////////////////////////////////////////////////////////////
-def apply_transformations(destination_path,
-                          source_basename,
-                          source_extension,
-                          source_directory,
-                          overlay):
+def native_stego_extract(filename, passphrase):
     """
-        Apply all defined transformations to the source_* file and write the
-        resulting files in destination_path .
+        Extract the message embedded in filename by the native backend.
+
+        Return the message (bytes) or None if nothing could be extracted.
     """
-    filename__trans1 = FILENAME__TRANS1__FORMAT.format(destination_path,
-                                                       source_basename,
-                                                       source_extension)
-    transform1__r400_wm_s(source_directory, filename__trans1)
+    flat = native_stego_samples(filename)[1].reshape(-1)
+    key = native_stego_key(passphrase)
+    header_length = len(NATIVE_STEGO__MAGIC) + 4
 
+    if header_length * 8 > flat.size // 2:
+        return None
 
-    filename__trans2 = FILENAME__TRANS2__FORMAT.format(destination_path,
-                                                       source_basename,
-                                                       source_extension)
-    transform2__steghide(source_directory, filename__trans2)
+    def read(length):
+        """Return the first "length" bytes of the decrypted payload."""
+        positions = native_stego_positions(key, flat.size, length * 8)
+        return numpy.packbits(flat[positions] & 1) ^ native_stego_keystream(key, length)
 
-    filename__trans3 = FILENAME__TRANS3__FORMAT.format(destination_path,
-                                                       source_basename,
-                                                       source_extension)
-    transform3__steghide_overlay(source_directory, filename__trans3, overlay)
+    header = read(header_length).tobytes()
+    if not header.startswith(NATIVE_STEGO__MAGIC):
+        return None
 
-    filename__trans4 = FILENAME__TRANS4__FORMAT.format(destination_path,
-                                                       source_basename,
-                                                       source_extension)
-    transform4__gray__steghide(source_directory, filename__trans4)
+    length = struct.unpack(">I", header[len(NATIVE_STEGO__MAGIC):])[0]
+    if (header_length + length + 4) * 8 > flat.size // 2:
+        return None
 
-    filename__trans5 = FILENAME__TRANS5__FORMAT.format(destination_path,
-                                                       source_basename,
-                                                       source_extension)
-    transf5__gray__steg_overlay(source_directory, filename__trans5, overlay)
+    payload = read(header_length + length + 4).tobytes()
+    message, crc = payload[header_length:-4], struct.unpack(">I", payload[-4:])[0]
+    if zlib.crc32(message) & 0xffffffff != crc:
+        return None
 
+    return message
 
 #///////////////////////////////////////////////////////////////////////////////
+def native_embed(coverfilename, stegofilename=None):
+    """
+        Embed ARGS.message in coverfilename with the native backend and write the
+        result in stegofilename (or in coverfilename itself if stegofilename is
+        None).
+    """
+    return native_stego_embed(coverfilename,
+                              stegofilename or coverfilename,
+                              ARGS.message,
+                              ARGS.passphrase)
+
 #///////////////////////////////////////////////////////////////////////////////
-#///                                                                         ///
-#///                            ENTRY POINT                                  ///
-#///                                                                         ///
+def native_stego_can_embed(filename):
+    """
+        Return True if the native backend can embed data in filename.
+    """
+    return os.path.splitext(filename)[1].lower() in NATIVE_STEGO__EXTENSIONS
+
+# steganography backends (--stego) : name -> (embed function, extract function)
+#
+#     o  embed function(coverfilename, stegofilename=None) : see steghide_embed()
+#     o  extract function(filename, passphrase) : see steghide_extract()
+#
+STEGO__BACKENDS = {"steghide": (steghide_embed, steghide_extract),
+                   "native": (native_embed, native_stego_extract)}
+
 #///////////////////////////////////////////////////////////////////////////////
+def stego_backend(coverfilename):
+    """
+        Return the name of the backend (see STEGO__BACKENDS) embedding the message
+        in coverfilename : the one chosen by --stego, except for the JPEG files
+        which the native backend can't handle.
+    """
+    if ARGS.stego == "native" and not native_stego_can_embed(coverfilename):
+        return "steghide"
+    return ARGS.stego
+
 #///////////////////////////////////////////////////////////////////////////////
+def embed(coverfilename, stegofilename=None):
+    """
+        Embed ARGS.message in coverfilename with the backend chosen by --stego
+        and write the result in stegofilename (or in coverfilename itself if
+        stegofilename is None).
+
+        The native backend can't embed data in JPEG files : these files are
+        always given to steghide (see stego_backend()).
+    """
+    return STEGO__BACKENDS[stego_backend(coverfilename)][0](coverfilename, stegofilename)
 
 #///////////////////////////////////////////////////////////////////////////////
-#
-# (0) warm-up
-#
+def extract(filename, passphrase):
+    """
+        Extract the message embedded in filename : the native backend is tried
+        first on the files it can handle, then steghide.
+
+        Return a (backend's name, message) tuple; message is None if nothing could
+        be extracted.
+    """
+    if Image is not None and native_stego_can_embed(filename):
+        message = STEGO__BACKENDS["native"][1](filename, passphrase)
+        if message is not None:
+            return ("native", message)
+
+    return ("steghide", STEGO__BACKENDS["steghide"][1](filename, passphrase))
+
 #///////////////////////////////////////////////////////////////////////////////
+def embed__streams(content, extension, args=None):
+    """
+        process() : embed the message of args (the arguments, see get_args() :
+        ARGS by default) in content (the bytes of an image whose format is given
+        by extension) and return the bytes of the result.
 
-# (0.a) arguments from the command line
-ARGS = get_args()
+        Nothing is written on disk : the native backend works on file objects in
+        memory, steghide reads the image on its standard input, the message
+        through a pipe ("-N" : no file name is embedded with it) and writes the
+        result on its standard output.
 
-# (0.b) source file/directory
-SOURCE = os.path.expanduser(ARGS.source)
+        Raise RuntimeError if the message can't be embedded.
+    """
+    args = args or ARGS
+
+    if args.stego == "native" and extension.lower() in NATIVE_STEGO__EXTENSIONS:
+        stego = io.BytesIO()
+        if native_stego_embed(io.BytesIO(content), stego, args.message, args.passphrase) != 0:
+            raise RuntimeError("the native backend can't embed the message")
+        return stego.getvalue()
+
+    status, stdout, _ = run_order__pipes(
+        lambda input_fds, output_fds: ["steghide", "embed", "-cf", "-",
+                                       "-ef", "/dev/fd/{0}".format(input_fds[0]), "-N",
+                                       "-p", args.passphrase, "-q", "-sf", "-"],
+        content,
+        inputs=[args.message.encode("utf-8")])
+    if status != 0:
+        raise RuntimeError("steghide has failed (exit status {0})".format(status >> 8))
+    return stdout
 
-SOURCE_TYPE = None
-if os.path.isfile(SOURCE):
-    SOURCE_TYPE = "a file"
-elif os.path.isdir(SOURCE):
-    SOURCE_TYPE = "a directory"
-else:
-    # ... hopefully something with wildcards.
-    SOURCE_TYPE = "neither a file nor a directory"
+#///////////////////////////////////////////////////////////////////////////////
+def external_programs_are_available():
+    """
+        Check that the external programs required by waterseg are present.
+        If an error occurs, display a message explaining what was the problem.
 
-# (0.c) destination path
-DESTPATH = os.path.expanduser(ARGS.destpath)
-if not DESTPATH.endswith("/"):
-    DESTPATH += "/"
-if not os.path.exists(DESTPATH):
-    print("{0} !! the destination path \"{1}\" doesn't exist : " \
-          "the program has to stop.".format(PROMPT, DESTPATH))
-    sys.exit()
+        Return a boolean.
+    """
+    result = True
 
-# (0.d) overlay file
-OVERLAY = os.path.expanduser(ARGS.overlay)
+    # TEST : does "convert" exist ? (not used by the native engine)
+    if result and \
+       (ARGS.check_engine or \
+        (ARGS.engine == "imagemagick" and \
+         not (ARGS.extract or ARGS.verify or ARGS.benchmark_stego))) and \
+       run_order(["convert", "-version"], capture=True)[0] != 0:
+        print("{0} !! ImageMagic/convert can't be find : " \
+              "the program has to stop.".format(PROMPT))
+        result = False
+
+    # TEST : does "steghide" exist ? (only required for JPEG files by the native
+    #        steganography backend)
+    if result and (ARGS.stego == "steghide" or ARGS.benchmark_stego) and \
+       run_order(["steghide", "--version"], capture=True)[0] != 0:
+        print("{0} !! steghide can't be find : the program has to stop.".format(PROMPT))
+        result = False
+
+    # TEST : does "jpegtran" exist ? (--jpeg-fast-path)
+    if result and ARGS.jpeg_fast_path and \
+       run_order(["jpegtran", "-version"], capture=True)[0] != 0:
+        print("{0} !! jpegtran can't be find (--jpeg-fast-path) : " \
+              "the program has to stop.".format(PROMPT))
+        result = False
+
+    # TEST : are Pillow and NumPy available for the native engine/backend ?
+    if result and (ARGS.engine == "native" or ARGS.check_engine) and Image is None:
+        print("{0} !! Pillow/NumPy can't be imported, the native engine can't be used : " \
+              "the program has to stop.".format(PROMPT))
+        result = False
+
+    if result and (ARGS.stego == "native" or ARGS.benchmark_stego) and Image is None:
+        print("{0} !! Pillow/NumPy can't be imported, the native steganography backend " \
+              "can't be used : the program has to stop.".format(PROMPT))
+        result = False
 
-# (0.e) displaying the summary
-if not ARGS.quiet:
-    print("=== {0} v. {1} === ".format(PROGRAM_NAME, PROGRAM_VERSION))
+    return result
 
-    print("{0} source=\"{1}\" ({2})".format(PROMPT, SOURCE, SOURCE_TYPE))
-    if SOURCE_TYPE == "neither a file nor a directory":
-        print("{0} source \"{1}\" is neither an existing file nor an existing directory : " \
-              "it will be analysed as a path with wildcards.".format(PROMPT, SOURCE))
+#///////////////////////////////////////////////////////////////////////////////
+def write_embed_file(filename):
+    """
+        Write ARGS.message in the file used by steghide to embed the message.
+    """
+    with open(filename, "w", encoding="utf-8") as steghide_message:
+        steghide_message.write(ARGS.message)
 
-    print("{0} output path=\"{1}\"".format(PROMPT, DESTPATH))
+#///////////////////////////////////////////////////////////////////////////////
+def read_manifest(filename, default_passphrase):
+    """
+        (--manifest) Read the recipients in filename : a JSONL file (one object
+        per line) if its extension is .jsonl, a CSV file with a header line
+        otherwise (see MANIFEST__FIELDS).
 
-# (0.f) are the required external programs available ?
-if not external_programs_are_available():
-    sys.exit()
+        Return a list of dicts (recipient, message, passphrase); the names of the
+        recipients are reduced to the characters allowed in a filename.
 
-# (0.g) creating the embed file used by steghide :
-with open(STEGHIDE__EMBED_FILE, "w") as steghide_message:
-    steghide_message.write(ARGS.message)
+        Raise ValueError if the manifest is wrong.
+    """
+    with open(filename, newline="", encoding="utf-8") as manifest_file:
+        if filename.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in manifest_file if line.strip()]
+        else:
+            rows = list(csv.DictReader(manifest_file))
+
+    recipients = []
+    for line_number, row in enumerate(rows, 1):
+        if not isinstance(row, dict) or not row.get("message"):
+            raise ValueError("no message for the recipient #{0}".format(line_number))
+        recipient = re.sub(r"[^\w.-]", "_", str(row.get("recipient") or
+                                               "recipient{0}".format(line_number)))
+        if recipient in [known["recipient"] for known in recipients]:
+            raise ValueError("the recipient \"{0}\" appears twice".format(recipient))
+        recipients.append({"recipient": recipient,
+                           "message": str(row["message"]),
+                           "passphrase": str(row.get("passphrase") or default_passphrase)})
+
+    if not recipients:
+        raise ValueError("no recipient in \"{0}\"".format(filename))
+    return recipients
 
 #///////////////////////////////////////////////////////////////////////////////
-#
-# (1) transformations
-#
+def default_scratch_directory():
+    """
+        Return the default scratch directory (see SCRATCH__DIRECTORY).
+    """
+    try:
+        stat = os.statvfs(SCRATCH__DIRECTORY)
+        if os.access(SCRATCH__DIRECTORY, os.W_OK) and \
+           stat.f_bavail * stat.f_frsize >= SCRATCH__MINIMUM_FREE:
+            return SCRATCH__DIRECTORY
+    except OSError:
+        pass
+    return tempfile.gettempdir()
+
 #///////////////////////////////////////////////////////////////////////////////
-NUMBER_OF_FILES_READ_AND_TRANSFORMED = 0
+def get_args(arguments=None):
+    """
+        Read the command line arguments (or arguments, a list of strings, if
+        given : see process()).
 
-if SOURCE_TYPE == 'a file':
-    # it's a file : let's read and transform it.
+        Return the argparse object.
+    """
+    parser = argparse.ArgumentParser(description="{0} v. {1}".format(PROGRAM_NAME, PROGRAM_VERSION),
+                                     epilog="by suizokukan AT orange DOT fr",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-    # e.g. if SOURCE = img/IMG_4280.JPG,
-    #           then SOURCE_BASENAME = IMG_4280.JPG
-    #           then SOURCE_EXTENSION = .JPG
-    SOURCE_BASENAME, SOURCE_EXTENSION = os.path.splitext(os.path.basename(SOURCE))
+    parser.add_argument('--version',
+                        action='version',
+                        version="{0} v. {1}".format(PROGRAM_NAME, PROGRAM_VERSION),
+                        help="show the version and exit")
 
-    apply_transformations(destination_path=DESTPATH,
-                          source_basename=SOURCE_BASENAME,
-                          source_extension=SOURCE_EXTENSION,
-                          source_directory=SOURCE,
-                          overlay=OVERLAY)
+    parser.add_argument('--source',
+                        type=str,
+                        help="input file or input directory. Wildcards accepted " \
+                             "(required, except with --benchmark and --verify)")
 
-    NUMBER_OF_FILES_READ_AND_TRANSFORMED += 1
+    parser.add_argument('--destpath',
+                        type=str,
+                        default=".",
+                        help="output path")
 
-elif SOURCE_TYPE == 'a directory':
-    # it's a directory : let's read and transform every file in it.
+    parser.add_argument('--debug',
+                        action="store_true",
+                        help="display debug messages")
 
-    for filename in os.listdir(SOURCE):
+    parser.add_argument('--passphrase',
+                        type=str,
+                        required=True,
+                        default="passphrase",
+                        help="steghide passphrase")
 
-        # e.g. if SOURCE = img/subdir/ and if filename = file001.jpg
-        #           then SOURCE_BASENAME = file001
-        #           then SOURCE_EXTENSION = .jpg
-        SOURCE_BASENAME, SOURCE_EXTENSION = \
-                            os.path.splitext(os.path.basename(os.path.join(SOURCE, filename)))
+    parser.add_argument('--message',
+                        type=str,
+                        required=True,
+                        default="message",
+                        help="steghide message to be embed")
 
-        apply_transformations(destination_path=DESTPATH,
-                              source_basename=SOURCE_BASENAME,
-                              source_extension=SOURCE_EXTENSION,
-                              source_directory=os.path.join(SOURCE, filename),
-                              overlay=OVERLAY)
+    parser.add_argument('--quiet',
+                        action="store_true",
+                        help="disallow common messages' display; " \
+                             "only the error messages will be display")
 
-        NUMBER_OF_FILES_READ_AND_TRANSFORMED += 1
+    parser.add_argument('--overlay',
+                        type=str,
+                        required=True,
+                        help="Overlay file to be used.")
 
-else:
-    # SOURCE_TYPE == 'neither a file nor a directory', hopefully something with wildcards.
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help="number of source files transformed at once by a pool of " \
+                             "worker processes; 0 means one worker per CPU")
 
-    SOURCE_DIRECTORY = os.path.dirname(SOURCE)
-    SOURCE_NAME = os.path.basename(SOURCE)
+    parser.add_argument('--pipeline',
+                        action="store_true",
+                        help="decode each source file once : all the images are " \
+                             "written by a single call to ImageMagick")
 
-    for filename in os.listdir(SOURCE_DIRECTORY):
-        if fnmatch.fnmatch(filename, SOURCE_NAME):
+    parser.add_argument('--engine',
+                        choices=("imagemagick", "native"),
+                        default="imagemagick",
+                        help="imaging engine : ImageMagick's programs or an in-process " \
+                             "engine based on Pillow and NumPy")
 
-            SOURCE_BASENAME, SOURCE_EXTENSION = os.path.splitext(filename)
-            # e.g. if SOURCE = img/subdir/ and if filename = file001.jpg
-            #           then SOURCE_BASENAME = file001
-            #           then SOURCE_EXTENSION = .jpg
-            SOURCE_BASENAME, SOURCE_EXTENSION = \
-                      os.path.splitext(os.path.basename(os.path.join(SOURCE, filename)))
+    parser.add_argument('--check-engine',
+                        action="store_true",
+                        help="don't write anything in the destination path but compare, " \
+                             "for each source file, the images written by both engines")
+
+    parser.add_argument('--stego',
+                        choices=("steghide", "native"),
+                        default="steghide",
+                        help="steganography backend : steghide or an in-process backend " \
+                             "based on NumPy, embedding in the pixels of the lossless " \
+                             "BMP/PNG files only (the JPEG files are always given to " \
+                             "steghide, which embeds in their DCT coefficients)")
+
+    parser.add_argument('--extract',
+                        action="store_true",
+                        help="don't transform the source files but extract the message " \
+                             "embedded in each of them and compare it with --message")
 
-            apply_transformations(destination_path=DESTPATH,
-                                  source_basename=SOURCE_BASENAME,
-                                  source_extension=SOURCE_EXTENSION,
-                                  source_directory=os.path.join(SOURCE_DIRECTORY, filename),
-                                  overlay=OVERLAY)
+    parser.add_argument('--benchmark-stego',
+                        action="store_true",
+                        help="don't transform the source files but measure the time " \
+                             "spent to embed --message in them : both backends on the " \
+                             "BMP files, steghide alone on the JPEG files (the native " \
+                             "backend doesn't handle them)")
 
-            NUMBER_OF_FILES_READ_AND_TRANSFORMED += 1
+    parser.add_argument('--font',
+                        type=str,
+                        default=None,
+                        help="font of the watermark (ImageMagick's default font if " \
+                             "not given)")
+
+    parser.add_argument('--cache-size',
+                        type=int,
+                        default=32,
+                        help="maximal number of watermark tiles and of resized " \
+                             "overlays kept by each process")
+
+    parser.add_argument('--result-cache',
+                        type=str,
+                        default=None,
+                        help="directory storing the destination files by content : " \
+                             "a destination file already computed for the same source " \
+                             "content and parameters is hardlinked (or copied) " \
+                             "instead of being computed again")
+
+    parser.add_argument('--recursive',
+                        action="store_true",
+                        help="read the source files in the subdirectories too; the " \
+                             "destination files are written in the same subdirectories " \
+                             "of the destination path")
+
+    parser.add_argument('--include',
+                        type=str,
+                        action="append",
+                        default=[],
+                        help="only transform the source files matching this pattern " \
+                             "(e.g. \"*.jpg\"); may be given several times")
+
+    parser.add_argument('--exclude',
+                        type=str,
+                        action="append",
+                        default=[],
+                        help="don't transform the source files matching this pattern; " \
+                             "may be given several times")
+
+    parser.add_argument('--transforms',
+                        type=str,
+                        default="1,2,3,4,5",
+                        help="numbers of the transformations to be applied, separated " \
+                             "by commas")
+
+    parser.add_argument('--benchmark',
+                        action="store_true",
+                        help="don't transform the source files but time the " \
+                             "transformations on a synthetic corpus, written in " \
+                             "--source if it is given (in a temporary directory " \
+                             "otherwise)")
+
+    parser.add_argument('--benchmark-report',
+                        type=str,
+                        default=None,
+                        help="JSON file where the benchmark's report is written " \
+                             "(displayed if not given)")
+
+    parser.add_argument('--benchmark-baseline',
+                        type=str,
+                        default=None,
+                        help="JSON report of a previous benchmark : the regressions are " \
+                             "displayed and the program exits with 1")
+
+    parser.add_argument('--metrics-json',
+                        type=str,
+                        default=None,
+                        help="JSON file where the metrics of the external programs " \
+                             "(wall/CPU time, exit status, output size, peak RSS) " \
+                             "are written, per stage, per transformation and per " \
+                             "source file")
+
+    parser.add_argument('--metrics-prom',
+                        type=str,
+                        default=None,
+                        help="textfile where the metrics of the external programs " \
+                             "are written for the node exporter of Prometheus")
+
+    parser.add_argument('--concurrency',
+                        type=int,
+                        default=1,
+                        help="number of external programs run at the same time for " \
+                             "one source file : with more than 1, the independent " \
+                             "transformations and their embeddings are run " \
+                             "concurrently by asyncio")
+
+    parser.add_argument('--large-images',
+                        action="store_true",
+                        help="large-image mode : JPEG shrink-on-load for the resize " \
+                             "step, overlay composited in bands by the native engine, " \
+                             "ImageMagick's memory bounded by --memory-limit, peak " \
+                             "RSS displayed for each file (--pipeline is ignored)")
+
+    parser.add_argument('--memory-limit',
+                        type=int,
+                        default=256,
+                        help="(--large-images) memory (in MiB) used by ImageMagick " \
+                             "for its pixels, in each process; beyond, the pixels " \
+                             "are cached on disk, in --pixel-cache")
+
+    parser.add_argument('--pixel-cache',
+                        type=str,
+                        default=None,
+                        help="(--large-images) directory where ImageMagick caches the " \
+                             "pixels on disk (a temporary directory if not given)")
+
+    parser.add_argument('--prescan',
+                        action="store_true",
+                        help="estimate the capacity of each destination file before " \
+                             "computing it : the transformations whose destination " \
+                             "file couldn't carry the message are skipped")
+
+    parser.add_argument('--capacity-index',
+                        type=str,
+                        default=None,
+                        help="(--prescan) SQLite file where the capacities of the " \
+                             "source files are stored by SHA-256, for the next runs")
+
+    parser.add_argument('--verify',
+                        action="store_true",
+                        help="don't transform anything but extract the message " \
+                             "embedded in each destination file found in --destpath " \
+                             "(and in its subdirectories) and compare it with " \
+                             "--message; the program exits with 1 if a file is wrong")
+
+    parser.add_argument('--verify-report',
+                        type=str,
+                        default=None,
+                        help="(--verify) JSON file where the status and the time of " \
+                             "each destination file are written")
+
+    parser.add_argument('--watch',
+                        action="store_true",
+                        help="daemon : transform every file written or moved in the " \
+                             "--source directory by a pool of --jobs worker processes " \
+                             "started once, until SIGTERM or ^C")
+
+    parser.add_argument('--status-socket',
+                        type=str,
+                        default=None,
+                        help="(--watch) Unix socket sending the status of the queue " \
+                             "(depth, latencies) as JSON to each client")
+
+    parser.add_argument('--scratch',
+                        type=str,
+                        default=None,
+                        help="directory where the images are computed and steghide'd " \
+                             "before being published in --destpath by a rename (or a " \
+                             "single copy); {0} if it has room, the temporary directory " \
+                             "otherwise".format(SCRATCH__DIRECTORY))
+
+    parser.add_argument('--shard',
+                        type=str,
+                        default=None,
+                        help="i/N : only transform the i-th of N deterministic shares " \
+                             "of the source files (1 <= i <= N), e.g. one per node")
+
+    parser.add_argument('--queue',
+                        type=str,
+                        default=None,
+                        help="work queue shared by several processes or nodes : each " \
+                             "source file is claimed through a lease file in this " \
+                             "directory and transformed once")
+
+    parser.add_argument('--lease-seconds',
+                        type=int,
+                        default=300,
+                        help="(--queue) a lease which hasn't been renewed for this time " \
+                             "(the node has crashed) is taken over by another node")
+
+    parser.add_argument('--manifest',
+                        type=str,
+                        default=None,
+                        help="fan-out : CSV (recipient,message,passphrase) or JSONL file " \
+                             "of recipients; each source file is prepared once and " \
+                             "watermarked/steghide'd for every recipient")
+
+    parser.add_argument('--memory-budget',
+                        type=int,
+                        default=None,
+                        help="memory (in MiB) of the images transformed at the same time : " \
+                             "the dimensions of the source files are read first, the " \
+                             "largest files are transformed first and a file is only " \
+                             "given to a worker if its estimated memory fits")
+
+    parser.add_argument('--threads',
+                        type=int,
+                        default=None,
+                        help="number of threads split between the worker processes and " \
+                             "the threads of ImageMagick (MAGICK_THREAD_LIMIT); --jobs 0 " \
+                             "means one worker per thread")
+
+    parser.add_argument('--jpeg-fast-path',
+                        action="store_true",
+                        help="JPEG sources : the gray image of the transformation #4 is " \
+                             "made in the DCT domain by jpegtran (lossless) and the " \
+                             "resize step decodes the source at a reduced DCT scale; " \
+                             "the gray images use the Rec.601 luma instead of Rec.709")
+
+    parser.add_argument('--dest-archive',
+                        type=str,
+                        default=None,
+                        help="the destination files are appended to this archive (tar, " \
+                             "or zip if the name ends with .zip) instead of being " \
+                             "written in --destpath; an index (name,offset,size) is " \
+                             "written in \"<archive>.index\"")
+
+    parser.add_argument('--journal',
+                        type=str,
+                        default=None,
+                        help="append-only journal where every destination file is " \
+                             "recorded as started then completed (fsync'ed)")
+
+    parser.add_argument('--resume',
+                        action="store_true",
+                        help="(--journal) continue the batch recorded in the journal : the " \
+                             "files completed are skipped, the ones only started are " \
+                             "computed again")
+
+    args = parser.parse_args(arguments)
+
+    if args.source is None and not (args.benchmark or args.verify):
+        parser.error("the following arguments are required: --source")
+
+    if args.result_cache is not None:
+        args.result_cache = os.path.expanduser(args.result_cache)
+
+    try:
+        args.transforms = sorted(set(int(number) for number in args.transforms.split(",")))
+    except ValueError:
+        parser.error("--transforms expects numbers separated by commas, e.g. 1,3,5")
+    if not args.transforms or not set(args.transforms) <= set(TRANSFORMATION_STEPS):
+        parser.error("--transforms : the transformations are numbered from 1 to 5")
+
+    if args.jobs < 0:
+        parser.error("--jobs must be a positive number (or 0 for one job per CPU)")
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    if args.status_socket is not None:
+        args.status_socket = os.path.expanduser(args.status_socket)
+
+    if args.capacity_index is not None:
+        args.capacity_index = os.path.expanduser(args.capacity_index)
+
+    if args.scratch is None:
+        args.scratch = default_scratch_directory()
+    else:
+        args.scratch = os.path.expanduser(args.scratch)
+
+    if args.shard is not None:
+        try:
+            args.shard = tuple(int(number) for number in args.shard.split("/"))
+        except ValueError:
+            parser.error("--shard expects i/N, e.g. 1/4")
+        if len(args.shard) != 2 or not 1 <= args.shard[0] <= args.shard[1]:
+            parser.error("--shard expects i/N with 1 <= i <= N, e.g. 1/4")
+
+    if args.queue is not None:
+        args.queue = os.path.expanduser(args.queue)
+        if args.lease_seconds < QUEUE__HEARTBEAT_FACTOR:
+            parser.error("--lease-seconds must be at least {0}".format(QUEUE__HEARTBEAT_FACTOR))
+
+    args.recipients = None
+    if args.manifest is not None:
+        try:
+            args.recipients = read_manifest(os.path.expanduser(args.manifest),
+                                            args.passphrase)
+        except (IOError, OSError, ValueError) as error:
+            parser.error("--manifest : {0}".format(error))
+
+    if args.memory_budget is not None and args.memory_budget < 1:
+        parser.error("--memory-budget must be at least 1 (MiB)")
+
+    if args.threads is not None and args.threads < 1:
+        parser.error("--threads must be at least 1")
+
+    if args.dest_archive is not None:
+        args.dest_archive = os.path.abspath(os.path.expanduser(args.dest_archive))
+
+    if args.journal is not None:
+        args.journal = os.path.abspath(os.path.expanduser(args.journal))
+    if args.resume and args.journal is None:
+        parser.error("--resume requires --journal")
+    if args.resume and args.dest_archive is not None:
+        # the archive of the previous run has been closed (or not renamed) :
+        parser.error("--resume can't be used with --dest-archive")
+
+    if args.memory_limit < 1:
+        parser.error("--memory-limit must be at least 1 (MiB)")
+
+    if args.large_images:
+        # the registers of --pipeline keep the full-size images in memory :
+        args.pipeline = False
+        if args.pixel_cache is not None:
+            args.pixel_cache = os.path.expanduser(args.pixel_cache)
+
+    return args
+
+#///////////////////////////////////////////////////////////////////////////////
+class LRUCache:
+    """
+        Bounded cache : when more than "maxsize" values are stored, the least
+        recently used value is dropped (and given to on_eviction, if any).
+
+        hits/misses count the calls to get() which found/didn't find the key.
+    """
+
+    #///////////////////////////////////////////////////////////////////////////
+    def __init__(self, maxsize, on_eviction=None):
+        self.maxsize = maxsize
+        self.on_eviction = on_eviction
+        self.values = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    #///////////////////////////////////////////////////////////////////////////
+    def get(self, key, function):
+        """
+            Return the value stored for key; if there's no such value, store and
+            return function() .
+        """
+        if key in self.values:
+            self.hits += 1
+            value = self.values.pop(key)
+        else:
+            self.misses += 1
+            value = function()
+
+        # the most recently used value is the last one :
+        self.values[key] = value
+
+        while len(self.values) > self.maxsize:
+            evicted_value = self.values.popitem(last=False)[1]
+            if self.on_eviction is not None:
+                self.on_eviction(evicted_value)
+
+        return value
+
+    #///////////////////////////////////////////////////////////////////////////
+    def clear(self):
+        """
+            Drop all the values.
+        """
+        while self.values:
+            evicted_value = self.values.popitem(last=False)[1]
+            if self.on_eviction is not None:
+                self.on_eviction(evicted_value)
+
+#///////////////////////////////////////////////////////////////////////////////
+class DestArchive:
+    """
+        (--dest-archive) Archive where the destination files are appended, one
+        after the other, with its index (see DEST_ARCHIVE__INDEX_SUFFIX).
+
+        The archive and its index are written under a temporary name and
+        renamed by close() : a crashed run doesn't leave a truncated archive.
+        The members aren't kept in memory by the tar archive; the zip archive
+        keeps its central directory (about a hundred bytes per file).
+    """
+
+    #///////////////////////////////////////////////////////////////////////////
+    def __init__(self, filename):
+        self.filename = filename
+        self.indexfilename = filename + DEST_ARCHIVE__INDEX_SUFFIX
+        self.tmpsuffix = ".{0}.tmp".format(os.getpid())
+        self.lock = threading.Lock()
+        self.files = 0
+
+        # the files are kept open until close() :
+        # pylint: disable=consider-using-with
+        self.archive_file = open(self.filename + self.tmpsuffix, "wb")
+        if filename.lower().endswith(DEST_ARCHIVE__ZIP_EXTENSION):
+            self.archive = zipfile.ZipFile(self.archive_file, "w", zipfile.ZIP_STORED,
+                                           allowZip64=True)
+        else:
+            self.archive = tarfile.open(fileobj=self.archive_file, mode="w")
+
+        self.index_file = open(self.indexfilename + self.tmpsuffix, "w", newline="",
+                               encoding="utf-8")
+        self.index = csv.writer(self.index_file)
+        self.index.writerow(("name", "offset", "size"))
+
+    #///////////////////////////////////////////////////////////////////////////
+    def add(self, filename, name):
+        """
+            Append filename to the archive as "name" and remove it.
+        """
+        size = os.path.getsize(filename)
+        with self.lock:
+            if isinstance(self.archive, zipfile.ZipFile):
+                self.archive.write(filename, name)
+                padding = 0
+            else:
+                # not gettarinfo() : a file hardlinked to the result cache would
+                # be stored as a link to another member.
+                tarinfo = tarfile.TarInfo(name)
+                tarinfo.size = size
+                tarinfo.mtime = int(time.time())
+                tarinfo.mode = 0o644
+                with open(filename, "rb") as member_file:
+                    self.archive.addfile(tarinfo, member_file)
+                # the members are only needed to read the archive :
+                self.archive.members = []
+                padding = -size % tarfile.BLOCKSIZE
+
+            # the data of a member is just before the current position (and the
+            # padding of the tar blocks) :
+            self.index.writerow((name, self.archive_file.tell() - padding - size, size))
+            self.files += 1
+
+        os.remove(filename)
+
+    #///////////////////////////////////////////////////////////////////////////
+    def add_files(self, filenames, directory):
+        """
+            Append to the archive the files of filenames which exist, named after
+            their path relative to directory.
+        """
+        for filename in filenames:
+            if os.path.exists(filename):
+                self.add(filename, os.path.relpath(filename, directory))
+
+    #///////////////////////////////////////////////////////////////////////////
+    def close(self):
+        """
+            Finish the archive and its index and give them their final name.
+        """
+        with self.lock:
+            self.archive.close()
+            self.archive_file.close()
+            self.index_file.close()
+            os.rename(self.filename + self.tmpsuffix, self.filename)
+            os.rename(self.indexfilename + self.tmpsuffix, self.indexfilename)
+
+#///////////////////////////////////////////////////////////////////////////////
+def init_caches(directory):
+    """
+        Create WATERMARK__CACHE and OVERLAY__CACHE; the files rendered by the
+        ImageMagick engine are written in directory.
+    """
+    global CACHE__DIRECTORY, WATERMARK__CACHE, OVERLAY__CACHE  # pylint: disable=global-statement
+
+    def remove_cached_file(value):
+        """Remove the files written by the ImageMagick engine."""
+        if not isinstance(value, str):
+            return
+        if os.path.exists(value):
+            os.remove(value)
+
+    CACHE__DIRECTORY = directory
+    WATERMARK__CACHE = LRUCache(ARGS.cache_size, remove_cached_file)
+    OVERLAY__CACHE = LRUCache(ARGS.cache_size, remove_cached_file)
+
+#///////////////////////////////////////////////////////////////////////////////
+def cache_counters():
+    """
+        Return a dict cache's name -> [hits, misses] .
+    """
+    return {"watermark": [WATERMARK__CACHE.hits, WATERMARK__CACHE.misses],
+            "overlay": [OVERLAY__CACHE.hits, OVERLAY__CACHE.misses]}
+
+#///////////////////////////////////////////////////////////////////////////////
+def cached_filename(key, extension):
+    """
+        Return the name of the file, in CACHE__DIRECTORY, storing the value of key.
+    """
+    return os.path.join(CACHE__DIRECTORY,
+                        hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + extension)
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_image_size(filename, data=None):
+    """
+        Return the (width, height) of the image stored in filename ("identify -ping"
+        doesn't decode the pixels).
+
+        data : if not None, the content of the image, read by identify on its
+               standard input (filename being "-")
+    """
+    size = run_order(["identify", "-ping", "-format", "%w %h", filename],
+                     capture=True,
+                     data=data)[1]
+    return tuple(int(dimension) for dimension in size.decode().split())
+
+#///////////////////////////////////////////////////////////////////////////////
+def watermark_tile_operators(message, font=None):
+    """
+        Return the ImageMagick arguments rendering the watermark tile of message
+        with font (see --font and get_watermark_tile()).
+    """
+    return ["-size", "{0}x{1}".format(*WATERMARK__TILE_SIZE), "xc:none", "-fill", "grey"] + \
+           ([] if font is None else ["-font", font]) + \
+           ["-gravity", "NorthWest", "-draw", "text 10,10 '{0}'".format(message),
+            "-gravity", "SouthEast", "-draw", "text 5,15 '{0}'".format(message)]
+
+#///////////////////////////////////////////////////////////////////////////////
+def gray_method(args=None):
+    """
+        Return the "-grayscale" method of the gray images : "rec709luma", or,
+        with --jpeg-fast-path, "rec601luma" as the luma of the JPEG files (see
+        run_jpeg_fast_path()), so that the gray images of the transformations
+        #4 and #5 are computed with the same coefficients.
+
+        args : the arguments (see get_args()), ARGS by default.
+    """
+    return "rec601luma" if (args or ARGS).jpeg_fast_path else "rec709luma"
+
+#///////////////////////////////////////////////////////////////////////////////
+def overlay_operators(size, gray=False, args=None):
+    """
+        Return the ImageMagick operators resizing the overlay to fit in size (a
+        (width, height) tuple), converted to gray first if gray is True (see
+        get_overlay()).
+
+        args : the arguments (see get_args()), ARGS by default.
+    """
+    return (["-grayscale", gray_method(args)] if gray else []) + \
+           ["-resize", "{0}x{1}".format(*size)]
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_watermark_tile(message):
+    """
+        Return the watermark tile for message, from WATERMARK__CACHE :
+
+            o ImageMagick engine : the name of a MIFF file
+            o native engine : a PIL.Image object (see native_watermark_tile())
+    """
+    key = (ARGS.engine, message, WATERMARK__TILE_SIZE, ARGS.font)
+
+    def render():
+        """Render the watermark tile."""
+        if ARGS.engine == "native":
+            return native_watermark_tile(message)
+
+        tilefilename = cached_filename(key, ".miff")
+        system(["convert"] + watermark_tile_operators(message, ARGS.font) + [tilefilename],
+               outputs=(tilefilename,))
+        return tilefilename
+
+    return WATERMARK__CACHE.get(key, render)
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_overlay(overlay, size, gray=False):
+    """
+        Return the overlay file resized to fit in size (a (width, height) tuple),
+        from OVERLAY__CACHE :
+
+            o ImageMagick engine : the name of a MIFF file
+            o native engine : an "RGBA" PIL.Image object
+
+        gray : if True, the overlay is converted to gray first.
+    """
+    key = (ARGS.engine, overlay, os.path.getmtime(overlay), tuple(size), gray)
+
+    def render():
+        """Resize the overlay."""
+        if ARGS.engine == "native":
+            return native_resized_overlay(overlay, size, gray)
+
+        overlayfilename = cached_filename(key, ".miff")
+        system(["convert", overlay] + overlay_operators(size, gray) + [overlayfilename],
+               outputs=(overlayfilename,))
+        return overlayfilename
+
+    return OVERLAY__CACHE.get(key, render)
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_open(sourcefilename):
+    """
+        Decode sourcefilename with Pillow (native engine).
+
+        The last decoded image is kept in NATIVE__LAST_IMAGE : the transformations
+        of the same source file share it and must not modify it.
+
+        Return a PIL.Image object.
+    """
+    global NATIVE__LAST_IMAGE  # pylint: disable=global-statement
+
+    key = (sourcefilename, os.path.getmtime(sourcefilename))
+    if NATIVE__LAST_IMAGE[0] != key:
+        image = Image.open(sourcefilename)
+        image.load()
+        NATIVE__LAST_IMAGE = (key, image)
+
+    return NATIVE__LAST_IMAGE[1]
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_jpeg_quality(image):
+    """
+        Estimate the quality used to write the JPEG image (native engine), by
+        comparing its luminance quantization table with libjpeg's standard table.
+
+        Return an integer (NATIVE__DEFAULT_JPEG_QUALITY if the image isn't a JPEG).
+    """
+    quantization = getattr(image, "quantization", None)
+    if not quantization or 0 not in quantization:
+        return NATIVE__DEFAULT_JPEG_QUALITY
+
+    scale = 100.0 * sum(quantization[0]) / sum(NATIVE__STD_LUMINANCE_QUANT_TABLE)
+    if scale <= 100:
+        quality = (200 - scale) / 2
+    else:
+        quality = 5000 / scale
+
+    return max(1, min(100, int(round(quality))))
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_save(image, destfilename, quality):
+    """
+        Write image in destfilename (native engine); the format is given by the
+        extension of destfilename.
+    """
+    extension = os.path.splitext(destfilename)[1].lower()
+    if extension in (".jpg", ".jpeg"):
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(destfilename, format="JPEG", quality=quality)
+    elif extension == ".bmp" and image.mode not in ("RGB", "L", "P", "1"):
+        image.convert("RGB").save(destfilename, format="BMP")
+    else:
+        image.save(destfilename)
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_resize400(image):
+    """
+        Native equivalent of "convert -resize 400" : the width becomes 400 pixels,
+        the aspect ratio is kept.
+    """
+    width, height = image.size
+    new_height = max(1, int(height * 400.0 / width + 0.5))
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGB")
+    return image.resize((400, new_height), Image.LANCZOS)
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_gray(image):
+    """
+        Native equivalent of "convert -grayscale rec709luma" (rec601luma, see
+        gray_method()).
+
+        Return an "L" image (or "LA" if image has an alpha channel).
+    """
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or \
+                (image.mode == "P" and "transparency" in image.info)
+    rgba = numpy.asarray(image.convert("RGBA"), dtype=numpy.float32)
+
+    weights = NATIVE__REC601LUMA if gray_method() == "rec601luma" else NATIVE__REC709LUMA
+    luma = rgba[:, :, :3].dot(numpy.array(weights, dtype=numpy.float32))
+    luma = numpy.clip(luma + 0.5, 0, 255).astype(numpy.uint8)
+
+    if has_alpha:
+        return Image.fromarray(numpy.dstack((luma, rgba[:, :, 3].astype(numpy.uint8))), "LA")
+    return Image.fromarray(luma, "L")
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_font():
+    """
+        Return the font used to draw the watermark (native engine) : ARGS.font
+        or Pillow's default font.
+    """
+    if ARGS.font is not None:
+        return ImageFont.truetype(ARGS.font, 12)
+
+    try:
+        return ImageFont.load_default(size=12)
+    except TypeError:
+        # Pillow < 10.1 : bitmap font, no size.
+        return ImageFont.load_default()
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_watermark_tile(message):
+    """
+        Native equivalent of :
+
+                convert -size 240x160 xc:none -fill grey
+                        -gravity NorthWest -draw "text 10,10 'message'"
+                        -gravity SouthEast -draw "text 5,15 'message'"
+
+        Return an "RGBA" image.
+    """
+    tile_width, tile_height = WATERMARK__TILE_SIZE
+    tile = Image.new("RGBA", (tile_width, tile_height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    font = native_font()
+
+    # NorthWest, +10+10 :
+    draw.text((10, 10), message, fill=NATIVE__WATERMARK_COLOR, font=font)
+
+    # SouthEast, +5+15 : the offsets are counted from the bottom right corner.
+    left, top, right, bottom = draw.textbbox((0, 0), message, font=font)
+    draw.text((tile_width - 5 - (right - left) - left,
+               tile_height - 15 - (bottom - top) - top),
+              message, fill=NATIVE__WATERMARK_COLOR, font=font)
+
+    return tile
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_watermark(image, message):
+    """
+        Native equivalent of "composite -tile tile image" : the watermark tile
+        is repeated over the whole image.
+    """
+    tile = get_watermark_tile(message)
+    width, height = image.size
+
+    tiled = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    for x_offset in range(0, width, tile.size[0]):
+        for y_offset in range(0, height, tile.size[1]):
+            tiled.paste(tile, (x_offset, y_offset))
+
+    mode = image.mode
+    result = Image.alpha_composite(image.convert("RGBA"), tiled)
+    if mode in ("L", "LA", "RGBA"):
+        return result.convert(mode)
+    return result.convert("RGB")
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_resized_overlay(overlay, size, gray=False):
+    """
+        Native equivalent of "convert overlay -resize WxH" where WxH is size :
+        the overlay is resized to fit in size (the aspect ratio is kept).
+
+        gray : if True, the overlay is converted to gray first.
+
+        Return an "RGBA" image.
+    """
+    overlay_image = Image.open(overlay)
+    if gray:
+        overlay_image = native_gray(overlay_image)
+
+    return overlay_image.convert("RGBA").resize(native_fit(overlay_image.size, size),
+                                                Image.LANCZOS)
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_fit(size, target_size):
+    """
+        Return size (a (width, height) tuple) resized to fit in target_size, the
+        aspect ratio being kept.
+    """
+    ratio = min(float(target_size[0]) / size[0], float(target_size[1]) / size[1])
+    return (max(1, int(size[0] * ratio + 0.5)),
+            max(1, int(size[1] * ratio + 0.5)))
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_overlay(image, overlay, gray=False):
+    """
+        Native equivalent of
+                "convert image overlay -geometry WxH+0+0 -composite -depth 8"
+        where WxH is the size of image : the overlay is resized to fit in the
+        image (the aspect ratio is kept, see get_overlay()) and put over its top
+        left corner.
+
+        gray : if True, the overlay is converted to gray first.
+    """
+    if ARGS.large_images:
+        return native_overlay__bands(image, overlay, gray)
+
+    overlay_image = get_overlay(overlay, image.size, gray)
+
+    mode = image.mode
+    result = image.convert("RGBA")
+    result.alpha_composite(overlay_image, (0, 0))
+    if mode in ("L", "LA", "RGBA"):
+        return result.convert(mode)
+    return result.convert("RGB")
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_overlay__bands(image, overlay, gray=False):
+    """
+        (--large-images) native_overlay() computed in bands of
+        LARGE_IMAGES__BAND_HEIGHT rows : only the overlay file is decoded at its
+        own size; the resized overlay, the gray and RGBA conversions and the RGBA
+        copy of image are computed band by band, each band of the overlay being
+        resized from the matching rows of the overlay file (plus the margin read
+        by the Lanczos filter).
+    """
+    overlay_image = Image.open(overlay)
+    overlay_image.load()
+
+    overlay_width, overlay_height = native_fit(overlay_image.size, image.size)
+    scale = float(overlay_image.size[1]) / overlay_height
+    margin = int(math.ceil(3 * max(scale, 1.0))) + 1
+
+    mode = image.mode if image.mode in ("L", "LA", "RGBA") else "RGB"
+    result = Image.new(mode, image.size)
+    for top in range(0, image.size[1], LARGE_IMAGES__BAND_HEIGHT):
+        bottom = min(top + LARGE_IMAGES__BAND_HEIGHT, image.size[1])
+        band = image.crop((0, top, image.size[0], bottom))
+
+        if top < overlay_height:
+            overlay_bottom = min(bottom, overlay_height)
+            first_row = max(0, int(top * scale) - margin)
+            last_row = min(overlay_image.size[1],
+                           int(math.ceil(overlay_bottom * scale)) + margin)
+            overlay_rows = overlay_image.crop((0, first_row, overlay_image.size[0], last_row))
+            if gray:
+                overlay_rows = native_gray(overlay_rows)
+            band_overlay = overlay_rows.convert("RGBA").resize(
+                (overlay_width, overlay_bottom - top),
+                Image.LANCZOS,
+                box=(0, top * scale - first_row,
+                     overlay_image.size[0], overlay_bottom * scale - first_row))
+            band = band.convert("RGBA")
+            band.alpha_composite(band_overlay, (0, 0))
+
+        result.paste(band.convert(mode), (0, top))
+
+    return result
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_open__shrunk(sourcefilename, width):
+    """
+        (--large-images, --jpeg-fast-path) Decode sourcefilename with Pillow, at least
+        LARGE_IMAGES__SHRINK_FACTOR times width pixels wide : the JPEG files are
+        decoded at 1/2, 1/4 or 1/8 of their size by libjpeg (see Image.draft()),
+        the other files at full size.
+
+        Return a PIL.Image object.
+    """
+    image = Image.open(sourcefilename)
+    source_width, source_height = image.size
+    draft_width = min(source_width, LARGE_IMAGES__SHRINK_FACTOR * width)
+    image.draft(image.mode if image.mode in ("RGB", "L") else "RGB",
+                (draft_width, max(1, source_height * draft_width // source_width)))
+    image.load()
+    return image
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_result_cache_index():
+    """
+        Return the connection to the index of the result cache (--result-cache),
+        opened once by each process.
+    """
+    global RESULT_CACHE__INDEX  # pylint: disable=global-statement
+
+    if RESULT_CACHE__INDEX is None or RESULT_CACHE__INDEX[0] != os.getpid():
+        if not os.path.exists(ARGS.result_cache):
+            os.makedirs(ARGS.result_cache)
+
+        connection = sqlite3.connect(os.path.join(ARGS.result_cache, "index.sqlite"),
+                                     timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS files " \
+                           "(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, " \
+                           "sha256 TEXT)")
+        connection.commit()
+        RESULT_CACHE__INDEX = (os.getpid(), connection)
+
+    return RESULT_CACHE__INDEX[1]
+
+#///////////////////////////////////////////////////////////////////////////////
+def file_digest(filename):
+    """
+        Return the SHA-256 (hexadecimal string) of the content of filename.
+
+        With --result-cache, the digests are stored in the index of the result
+        cache, with the size and the modification time of the file : an unchanged
+        file isn't read again.
+    """
+    path = os.path.abspath(filename)
+
+    index = None
+    if ARGS.result_cache is not None:
+        index = get_result_cache_index()
+        stat = os.stat(path)
+        mtime = getattr(stat, "st_mtime_ns", int(stat.st_mtime * 1e9))
+
+        row = index.execute("SELECT sha256 FROM files WHERE path=? AND size=? AND mtime=?",
+                            (path, stat.st_size, mtime)).fetchone()
+        if row is not None:
+            return row[0]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as content:
+        for chunk in iter(lambda: content.read(RESULT_CACHE__CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    if index is not None:
+        index.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                      (path, stat.st_size, mtime, digest.hexdigest()))
+        index.commit()
+
+    return digest.hexdigest()
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_prescan_index():
+    """
+        Return the connection to the capacity index (--capacity-index, or an
+        index in memory), opened once by each process.
+    """
+    global PRESCAN__INDEX  # pylint: disable=global-statement
+
+    if PRESCAN__INDEX is None or PRESCAN__INDEX[0] != os.getpid():
+        connection = sqlite3.connect(ARGS.capacity_index or ":memory:", timeout=60)
+        connection.execute("CREATE TABLE IF NOT EXISTS capacities " \
+                           "(sha256 TEXT, backend TEXT, width INTEGER, height INTEGER, " \
+                           "capacity INTEGER, PRIMARY KEY (sha256, backend))")
+        connection.commit()
+        PRESCAN__INDEX = (os.getpid(), connection)
+
+    return PRESCAN__INDEX[1]
+
+#///////////////////////////////////////////////////////////////////////////////
+def steghide_capacity(filename):
+    """
+        Return the number of bytes that steghide can embed in filename, as given
+        by "steghide info" (None if it can't be read).
+    """
+    stdout = run_order(["steghide", "info", "-p", ARGS.passphrase, filename],
+                       capture=True)[1] or b""
+    match = re.search(r"capacity:\s*([0-9.]+)\s*(Byte|KB|MB)", stdout.decode("utf-8", "replace"))
+    if match is None:
+        return None
+    return int(float(match.group(1)) * {"Byte": 1, "KB": 1024, "MB": 1024 ** 2}[match.group(2)])
+
+#///////////////////////////////////////////////////////////////////////////////
+def source_capacity(sourcefilename, backend):
+    """
+        Return the (width, height, capacity in bytes) of sourcefilename for the
+        steganography backend; capacity is None if it can't be estimated.
+
+        The values are stored in the capacity index, by SHA-256 of the file.
+    """
+    index = get_prescan_index()
+    digest = file_digest(sourcefilename)
+
+    row = index.execute("SELECT width, height, capacity FROM capacities " \
+                        "WHERE sha256=? AND backend=?", (digest, backend)).fetchone()
+    if row is not None:
+        return row
+
+    if Image is not None:
+        with Image.open(sourcefilename) as source_image:
+            width, height = source_image.size
+    else:
+        width, height = get_image_size(sourcefilename)
+
+    if backend == "native":
+        capacity = native_stego_capacity(sourcefilename)
+    else:
+        capacity = steghide_capacity(sourcefilename)
+
+    if capacity is not None:
+        index.execute("INSERT OR REPLACE INTO capacities VALUES (?, ?, ?, ?, ?)",
+                      (digest, backend, width, height, capacity))
+        index.commit()
+
+    return (width, height, capacity)
+
+#///////////////////////////////////////////////////////////////////////////////
+def prescan_transformations(sourcefilename, destfilenames):
+    """
+        (--prescan) Estimate, without writing anything, the capacity of the
+        destination files of destfilenames (a dict transformation number ->
+        destination file) from the capacity of sourcefilename (see
+        source_capacity()), scaled by the number of pixels and of samples of
+        each destination file.
+
+        The destination files which can't carry the message are added to
+        PRESCAN__SKIPPED.
+
+        Return the set of the numbers of these transformations.
+    """
+    skipped = set()
+    message = ARGS.message.encode("utf-8")
+
+    for transformation_number, destfilename in sorted(destfilenames.items()):
+        steps = TRANSFORMATION_STEPS[transformation_number]
+        backend = stego_backend(destfilename)
+        width, height, capacity = source_capacity(sourcefilename, backend)
+        if capacity is None:
+            continue
+
+        ratio = 1.0
+        if "resize" in steps:
+            ratio = 400.0 * max(1, int(height * 400.0 / width + 0.5)) / (width * height)
+
+        if backend == "native":
+            # the destination file of a gray transformation has one sample per
+            # pixel :
+            if "gray" in steps:
+                ratio *= 1.0 / 3
+            needed = len(message)
+        else:
+            if "gray" in steps:
+                ratio *= PRESCAN__STEGHIDE_GRAY_FACTORS.get(
+                    os.path.splitext(destfilename)[1].lower(), 1.0)
+            needed = len(message) + len(os.path.basename(STEGHIDE__EMBED_FILE)) + \
+                     PRESCAN__STEGHIDE_OVERHEAD
+
+        estimated_capacity = int(capacity * ratio)
+        if estimated_capacity < needed:
+            skipped.add(transformation_number)
+            PRESCAN__SKIPPED.append((destfilename, estimated_capacity, needed))
+            if not ARGS.quiet:
+                print("     {0} ... skipping {1} : about {2} byte(s) available, " \
+                      "{3} needed".format(PROMPT, destfilename, estimated_capacity, needed))
+
+    return skipped
+
+#///////////////////////////////////////////////////////////////////////////////
+def result_cache_key(transformation_number, source_digest, overlay_digest):
+    """
+        Return the key of a destination file in the result cache : the SHA-256
+        of everything that changes the content of the file.
+
+        overlay_digest : None if the transformation doesn't use the overlay.
+    """
+    parameters = (PROGRAM_VERSION,
+                  str(transformation_number),
+                  source_digest,
+                  overlay_digest or "",
+                  ARGS.message,
+                  hashlib.sha256(ARGS.passphrase.encode("utf-8")).hexdigest(),
+                  ARGS.engine,
+                  ARGS.stego,
+                  ARGS.font or "",
+                  # the resized images are decoded at a reduced scale :
+                  "large-images" if ARGS.large_images else "",
+                  # jpegtran's gray image, Rec.601 luma, shrink-on-load :
+                  "jpeg-fast-path" if ARGS.jpeg_fast_path else "")
+
+    return hashlib.sha256("\n".join(parameters).encode("utf-8")).hexdigest()
+
+#///////////////////////////////////////////////////////////////////////////////
+def result_cache_filename(key, destfilename):
+    """
+        Return the name of the file storing in the result cache the destination
+        file whose key is "key".
+    """
+    return os.path.join(ARGS.result_cache, "objects", key[:2],
+                        key + os.path.splitext(destfilename)[1])
+
+#///////////////////////////////////////////////////////////////////////////////
+def link_or_copy(filename, linkname):
+    """
+        Hardlink filename to linkname or, if it's not possible (e.g. different
+        filesystems), copy filename to linkname.
+    """
+    try:
+        os.link(filename, linkname)
+    except OSError:
+        shutil.copyfile(filename, linkname)
+
+#///////////////////////////////////////////////////////////////////////////////
+def publish_file(stagedfilename, destfilename):
+    """
+        Move stagedfilename (a file of the scratch directory) to destfilename,
+        which appears at once : a rename, or, across filesystems, a single
+        sequential copy to a temporary file of the destination path, renamed.
+
+        A destination file hardlinked to the result cache is replaced, not
+        modified.
+    """
+    try:
+        os.rename(stagedfilename, destfilename)
+    except OSError:
+        tmpfilename = "{0}.{1}.tmp".format(destfilename, os.getpid())
+        shutil.copyfile(stagedfilename, tmpfilename)
+        os.rename(tmpfilename, destfilename)
+        os.remove(stagedfilename)
+
+#///////////////////////////////////////////////////////////////////////////////
+def result_cache_fetch(key, destfilename):
+    """
+        Write destfilename from the result cache, if the cache stores it.
+
+        Return True if destfilename has been written.
+    """
+    cachedfilename = result_cache_filename(key, destfilename)
+    if not os.path.exists(cachedfilename):
+        return False
+
+    if os.path.exists(destfilename) and os.path.samefile(cachedfilename, destfilename):
+        return True
+
+    # the file appears at once in the destination path :
+    tmpfilename = "{0}.{1}.tmp".format(destfilename, os.getpid())
+    link_or_copy(cachedfilename, tmpfilename)
+    os.rename(tmpfilename, destfilename)
+    return True
+
+
+#///////////////////////////////////////////////////////////////////////////////
+def result_cache_store(key, destfilename, status):
+    """
+        Store destfilename in the result cache, if it has been written (status
+        is 0).
+    """
+    if key is None or status != 0 or not os.path.exists(destfilename):
+        return
+
+    cachedfilename = result_cache_filename(key, destfilename)
+    if not os.path.exists(os.path.dirname(cachedfilename)):
+        try:
+            os.makedirs(os.path.dirname(cachedfilename))
+        except OSError:
+            # created in the meantime by another process.
+            pass
+
+    # the file appears at once in the cache :
+    tmpfilename = "{0}.{1}.tmp".format(cachedfilename, os.getpid())
+    link_or_copy(destfilename, tmpfilename)
+    os.rename(tmpfilename, cachedfilename)
+
+#///////////////////////////////////////////////////////////////////////////////
+def plan_transformations(transformation_numbers):
+    """
+        Return the list of the steps' chains (see TRANSFORMATION_STEPS) to be
+        computed to apply the transformations transformation_numbers : each chain
+        is a tuple of steps; a chain appears once, even if it is shared by several
+        transformations, and after its parent chain (chain[:-1]).
+
+        e.g. (3, 4, 5) -> [("overlay",), ("gray",), ("gray", "overlay")]
+    """
+    chains = []
+    for transformation_number in sorted(transformation_numbers):
+        steps = TRANSFORMATION_STEPS[transformation_number]
+        for length in range(1, len(steps) + 1):
+            if steps[:length] not in chains:
+                chains.append(steps[:length])
+    return chains
+
+#///////////////////////////////////////////////////////////////////////////////
+def chain_outputs(chain, chains, destfilenames):
+    """
+        Return a (destination files, has children) tuple for chain :
+
+            o the destination files of the transformations whose steps are chain;
+            o has children : True if another chain of chains is computed from
+              chain.
+    """
+    outputs = [destfilenames[transformation_number]
+               for transformation_number in sorted(destfilenames)
+               if TRANSFORMATION_STEPS[transformation_number] == chain]
+    has_children = any(other_chain[:-1] == chain for other_chain in chains)
+    return (outputs, has_children)
+
+#///////////////////////////////////////////////////////////////////////////////
+def chain_transformations(chain, destfilenames):
+    """
+        Return the numbers of the transformations of destfilenames computed from
+        chain, e.g. "4+5" for ("gray",) (see METRICS__CONTEXT).
+    """
+    return "+".join(str(transformation_number)
+                    for transformation_number in sorted(destfilenames)
+                    if TRANSFORMATION_STEPS[transformation_number][:len(chain)] == chain)
+
+#///////////////////////////////////////////////////////////////////////////////
+def imagemagick_operators(step, size, overlay, gray, streams=False, args=None):
+    """
+        Return the ImageMagick operators (a list of arguments) of step, to be
+        applied to an image list containing only the image to be transformed.
+
+        size : (width, height) of the source file
+        gray : True if the image has been converted to gray by a previous step
+        streams : if True, the watermark tile and the overlay are read in the
+                  memory registers mpr:watermark and mpr:overlay, the overlay
+                  being resized here (see pipeline_order()).
+        args : the arguments (see get_args()), ARGS by default.
+    """
+    args = args or ARGS
+
+    if step == "resize":
+        # resize 400x...
+        return ["-resize", "400"]
+
+    if step == "watermark":
+        # the tile is rendered once (see get_watermark_tile()) and repeated over
+        # the whole image, as "composite -tile" does.
+        tile = "mpr:watermark" if streams else get_watermark_tile(args.message)
+        return ["(", "+clone", "-alpha", "set", "-tile", tile,
+                "-draw", "color 0,0 reset", ")", "-composite"]
+
+    if step == "gray":
+        return ["-grayscale", gray_method(args)]
+
+    # step == "overlay" : the overlay has been resized to the source's size
+    # (see get_overlay()).
+    if streams:
+        overlay_image = ["(", "mpr:overlay"] + overlay_operators(size, gray, args) + [")"]
+    else:
+        overlay_image = [get_overlay(overlay, size, gray)]
+    return overlay_image + ["-geometry", "+0+0", "-composite", "-depth", "8"]
+
+#///////////////////////////////////////////////////////////////////////////////
+def imagemagick_writes(filenames):
+    """
+        Return the end of a "convert" order writing the current image in every
+        file of filenames.
+    """
+    order = []
+    for filename in filenames[:-1]:
+        order += ["-write", filename]
+    return order + [filenames[-1]]
+
+#///////////////////////////////////////////////////////////////////////////////
+def shrink_on_load(sourcefilename):
+    """
+        Return True if the resize step decodes sourcefilename at a reduced size
+        (DCT scaling of libjpeg, ignored by the other formats) : with
+        --large-images, or with --jpeg-fast-path for the JPEG sources.
+
+        Not used by --pipeline, whose register of the source (see
+        pipeline_order()) is also read by the other chains, at full size.
+    """
+    return ARGS.large_images or \
+           (ARGS.jpeg_fast_path and sniff_image_format(sourcefilename) == "JPEG")
+
+#///////////////////////////////////////////////////////////////////////////////
+def imagemagick_shrink_on_load(size):
+    """
+        --large-images : return the read options of "convert" making libjpeg
+        decode a source of this size at the smallest scale (1/2, 1/4, 1/8) giving
+        at least LARGE_IMAGES__SHRINK_FACTOR times the width of the resize step
+        (ignored by the other formats).
+    """
+    width = min(size[0], LARGE_IMAGES__SHRINK_FACTOR * 400)
+    return ["-define", "jpeg:size={0}x{1}".format(width, max(1, size[1] * width // size[0]))]
+
+#///////////////////////////////////////////////////////////////////////////////
+def imagemagick_orders(sourcefilename, destfilenames, overlay, chains, tmpdirectory):
+    """
+        ImageMagick engine : return the list of the (chain, order, outputs) tuples
+        computing each chain of steps with one call to "convert", from the file
+        written for its parent chain; outputs are the files written by order.
+
+        The intermediate files (chains with children) are written in the lossless
+        MIFF format, in tmpdirectory.
+
+        With --large-images or --jpeg-fast-path, the resize step decodes the JPEG
+        sources at a reduced size (see shrink_on_load()).
+    """
+    shrink = shrink_on_load(sourcefilename)
+    size = get_image_size(sourcefilename) \
+           if shrink or any("overlay" in chain for chain in chains) else None
+
+    orders = []
+    filenames = {(): sourcefilename}
+    for chain in chains:
+        outputs, has_children = chain_outputs(chain, chains, destfilenames)
+        if has_children:
+            filenames[chain] = os.path.join(tmpdirectory, "_".join(chain) + ".miff")
+            outputs = [filenames[chain]] + outputs
+
+        read_options = []
+        if chain == ("resize",) and shrink:
+            read_options = imagemagick_shrink_on_load(size)
+
+        orders.append((chain,
+                       ["convert", "-respect-parentheses"] + read_options +
+                       [filenames[chain[:-1]]] +
+                       imagemagick_operators(chain[-1], size, overlay, "gray" in chain[:-1]) +
+                       imagemagick_writes(outputs),
+                       outputs))
+    return orders
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_steps__imagemagick(sourcefilename, destfilenames, overlay, chains):
+    """
+        ImageMagick engine : run the orders of imagemagick_orders(), one after
+        the other.
+    """
+    tmpdirectory = tempfile.mkdtemp(prefix="watersteg.", dir=ARGS.scratch)
+    try:
+        for chain, order, outputs in imagemagick_orders(sourcefilename,
+                                                        destfilenames,
+                                                        overlay,
+                                                        chains,
+                                                        tmpdirectory):
+            METRICS__CONTEXT["transform"] = chain_transformations(chain, destfilenames)
+            system(order, outputs=outputs)
+    finally:
+        shutil.rmtree(tmpdirectory)
+
+#///////////////////////////////////////////////////////////////////////////////
+def pipeline_order(sourcefilename, destfilenames, overlay, chains, size=None, streams=False,
+                   args=None):
+    """
+        ImageMagick engine, --pipeline : return the order decoding the source file
+        once by a single call to "convert" which keeps it in a memory register
+        (mpr:source); each chain of steps is computed between parentheses from the
+        register of its parent chain and kept in its own register if other chains
+        need it.
+
+        streams (see process()) : the source file, the overlay and the
+        destination files are pipes (e.g. "-", "fd:3", "jpg:fd:4"), each one
+        read or written once : the watermark tile and the overlay are kept in
+        memory registers too (see imagemagick_operators()); size is the size of
+        the source.
+
+        args : the arguments (see get_args()), ARGS by default.
+    """
+    args = args or ARGS
+
+    if size is None and any("overlay" in chain for chain in chains):
+        size = get_image_size(sourcefilename)
+
+    def register(chain):
+        """Name of the memory register storing the image of chain."""
+        return "mpr:" + ("_".join(chain) or "source")
+
+    order = ["convert", "-respect-parentheses"]
+    if streams:
+        if any("watermark" in chain for chain in chains):
+            order += ["("] + watermark_tile_operators(args.message, args.font) + \
+                     ["-write", "mpr:watermark", "+delete", ")"]
+        if any("overlay" in chain for chain in chains):
+            order += ["(", overlay, "-write", "mpr:overlay", "+delete", ")"]
+    order += [sourcefilename, "-write", register(()), "+delete"]
+    for index, chain in enumerate(chains):
+        outputs, has_children = chain_outputs(chain, chains, destfilenames)
+        if has_children:
+            outputs = [register(chain)] + outputs
+
+        operators = [register(chain[:-1])] + imagemagick_operators(chain[-1],
+                                                                   size,
+                                                                   overlay,
+                                                                   "gray" in chain[:-1],
+                                                                   streams,
+                                                                   args)
+        if index < len(chains) - 1:
+            order += ["("] + operators
+            for output in outputs:
+                order += ["-write", output]
+            order += ["+delete", ")"]
+        else:
+            # the last chain is a leaf (see plan_transformations()) : its last
+            # destination file is the output file of the order.
+            order += operators + imagemagick_writes(outputs)
+
+    return order
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_steps__pipeline(sourcefilename, destfilenames, overlay, chains):
+    """
+        ImageMagick engine, --pipeline : run the order of pipeline_order().
+    """
+    if not chains:
+        return
+
+    system(pipeline_order(sourcefilename, destfilenames, overlay, chains),
+           outputs=list(destfilenames.values()))
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_steps__native(sourcefilename, destfilenames, overlay, chains):
+    """
+        Native engine : the images of the chains of steps are kept in memory.
+    """
+    # only the header is read here (the quantization tables of a JPEG file) :
+    with Image.open(sourcefilename) as source_image:
+        quality = native_jpeg_quality(source_image)
+
+    shrink = shrink_on_load(sourcefilename)
+    images = {}
+    for chain in chains:
+        step = chain[-1]
+        if chain[:-1] == () and step == "resize" and shrink:
+            # shrink-on-load : the source isn't decoded at full size.
+            image = native_open__shrunk(sourcefilename, 400)
+        elif chain[:-1] == ():
+            image = native_open(sourcefilename)
+        else:
+            image = images[chain[:-1]]
+
+        if step == "resize":
+            image = native_resize400(image)
+        elif step == "watermark":
+            image = native_watermark(image, ARGS.message)
+        elif step == "gray":
+            image = native_gray(image)
+        else:
+            image = native_overlay(image, overlay, gray="gray" in chain[:-1])
+
+        outputs, has_children = chain_outputs(chain, chains, destfilenames)
+        if has_children:
+            images[chain] = image
+        for destfilename in outputs:
+            native_save(image, destfilename, quality)
+
+#///////////////////////////////////////////////////////////////////////////////
+async def run_order__async(semaphore, order, outputs=(), transform=None):
+    """
+        (--concurrency > 1) Asynchronous version of run_order() : at most
+        ARGS.concurrency orders run at the same time (see semaphore).
+
+        The processes are waited for by asyncio and not by os.wait4() : their
+        CPU time and peak RSS aren't recorded.
+
+        Return the exit status, as os.system() does.
+    """
+    async with semaphore:
+        if ARGS.debug:
+            print("@@ system() : \"{0}\"".format(" ".join(shlex.quote(arg) for arg in order)))
+
+        start = time.time()
+        try:
+            child = await asyncio.create_subprocess_exec(*order)
+        except OSError:
+            record_stage(order[0], {"runs": 1, "failures": 1}, transform)
+            return 127 << 8
+        returncode = await child.wait()
+
+    # as os.system() : exit code in the high byte, signal number in the low one.
+    status = returncode << 8 if returncode >= 0 else -returncode
+
+    record_stage(order[0],
+                 {"runs": 1,
+                  "failures": 1 if status != 0 else 0,
+                  "wall_seconds": time.time() - start,
+                  "output_bytes": outputs_size(outputs)},
+                 transform)
+
+    return status
+
+#///////////////////////////////////////////////////////////////////////////////
+async def embed__async(semaphore, coverfilename, stegofilename, transform):
+    """
+        (--concurrency > 1) Asynchronous version of embed() : steghide is run by
+        run_order__async(), the native backend in this process.
+    """
+    backend = stego_backend(coverfilename)
+    if backend == "steghide":
+        return await run_order__async(semaphore,
+                                      steghide_embed_order(coverfilename, stegofilename),
+                                      (stegofilename or coverfilename,),
+                                      transform)
+
+    return STEGO__BACKENDS[backend][0](coverfilename, stegofilename)
+
+#///////////////////////////////////////////////////////////////////////////////
+async def run_transformations__async(sourcefilename, destfilenames, overlay, chains):
+    """
+        (--concurrency > 1) Compute the chains of steps and embed the message in
+        the destination files as a graph of asyncio tasks : each chain waits for
+        its parent chain and each embedding for the chain of its transformation;
+        the other tasks run concurrently, with at most ARGS.concurrency external
+        programs at the same time.
+
+        A task whose order fails (exit status != 0) stops the tasks depending on
+        it.
+
+        Return a dict transformation number -> exit status of the embedding (0 if
+        the file has been written).
+    """
+    semaphore = asyncio.Semaphore(ARGS.concurrency)
+
+    async def run_chain(parent, order, outputs, transform):
+        """Run order once the parent chain (a task or None) has been computed."""
+        if parent is not None:
+            status = await parent
+            if status != 0:
+                return status
+        return await run_order__async(semaphore, order, outputs, transform)
+
+    # chain -> task computing the image of this chain (None : nothing to wait for)
+    tasks = {(): None}
+
+    tmpdirectory = tempfile.mkdtemp(prefix="watersteg.", dir=ARGS.scratch)
+    try:
+        if ARGS.engine == "native":
+            run_steps__native(sourcefilename, destfilenames, overlay, chains)
+        elif ARGS.pipeline:
+            if chains:
+                # one order computes all the chains :
+                task = asyncio.ensure_future(
+                    run_chain(None,
+                              pipeline_order(sourcefilename, destfilenames, overlay, chains),
+                              list(destfilenames.values()),
+                              METRICS__CONTEXT["transform"]))
+                for chain in chains:
+                    tasks[chain] = task
+        else:
+            for chain, order, outputs in imagemagick_orders(sourcefilename,
+                                                            destfilenames,
+                                                            overlay,
+                                                            chains,
+                                                            tmpdirectory):
+                tasks[chain] = asyncio.ensure_future(
+                    run_chain(tasks[chain[:-1]],
+                              order,
+                              outputs,
+                              chain_transformations(chain, destfilenames)))
+
+        async def embed_file(transformation_number):
+            """Embed the message once the image of the transformation is written."""
+            steps = TRANSFORMATION_STEPS[transformation_number]
+            destfilename = destfilenames[transformation_number]
+            if tasks.get(steps) is not None:
+                status = await tasks[steps]
+                if status != 0:
+                    print("{0} !! \"{1}\" can't be written : " \
+                          "exit status {2}".format(PROMPT, destfilename, status))
+                    return status
+
+            return await embed__async(semaphore,
+                                      destfilename if steps else sourcefilename,
+                                      destfilename,
+                                      str(transformation_number))
+
+        transformation_numbers = sorted(destfilenames)
+        statuses = await asyncio.gather(*[embed_file(transformation_number)
+                                          for transformation_number in transformation_numbers])
+    finally:
+        shutil.rmtree(tmpdirectory)
+
+    return dict(zip(transformation_numbers, statuses))
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_jpeg_fast_path(sourcefilename, destfilenames):
+    """
+        (--jpeg-fast-path) If sourcefilename is a JPEG file, write the gray image
+        of the transformation #4 without decoding the source : jpegtran drops the
+        chroma components and keeps the DCT coefficients of the luma, so that the
+        image isn't compressed twice before steghide works on its coefficients.
+
+        NB : the luma of a JPEG file is computed with the Rec.601 coefficients :
+             with --jpeg-fast-path, the engines compute every gray image (#5,
+             and #4 of the other sources) with them too, see gray_method().
+
+        Return the destination files (a dict transformation number -> file) still
+        to be computed by the engine (see run_steps()); on failure, the
+        transformation #4 is left to the engine.
+    """
+    if not ARGS.jpeg_fast_path or 4 not in destfilenames or \
+       sniff_image_format(sourcefilename) != "JPEG":
+        return destfilenames
+
+    METRICS__CONTEXT["transform"] = "4"
+    if system(["jpegtran", "-grayscale", "-copy", "all",
+               "-outfile", destfilenames[4], sourcefilename],
+              outputs=(destfilenames[4],)) != 0:
+        return destfilenames
+
+    return {transformation_number: destfilename
+            for transformation_number, destfilename in destfilenames.items()
+            if transformation_number != 4}
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_steps(sourcefilename, destfilenames, overlay, chains):
+    """
+        Compute the chains of steps with the engine chosen by --engine (and
+        --pipeline) and write the images of the transformations in destfilenames.
+    """
+    if ARGS.engine == "native":
+        run_steps__native(sourcefilename, destfilenames, overlay, chains)
+    elif ARGS.pipeline:
+        run_steps__pipeline(sourcefilename, destfilenames, overlay, chains)
+    else:
+        run_steps__imagemagick(sourcefilename, destfilenames, overlay, chains)
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_transformations(sourcefilename, destfilenames, overlay):
+    """
+        Apply to sourcefilename the transformations whose numbers are the keys of
+        destfilenames (a dict transformation number -> destination file) :
+
+            o the chains of steps are computed by the engine (see
+              plan_transformations()), each chain once;
+            o the destination files are steghide'd (see embed()); the
+              transformation #2 embeds directly the source file.
+
+        The images are computed and steghide'd in the scratch directory
+        (--scratch); only the files whose embedding has succeeded are published
+        in the destination path (see publish_file()) : one write per destination
+        file there, and never a half-written file.
+
+        Return a dict transformation number -> exit status of the embedding (0 if
+        the file has been written).
+    """
+    if not ARGS.quiet:
+        for transformation_number in sorted(destfilenames):
+            print("     {0} ... creating {1} ....".format(PROMPT,
+                                                          destfilenames[transformation_number]))
+
+    stagingdirectory = tempfile.mkdtemp(prefix="watersteg.", dir=ARGS.scratch)
+    try:
+        stagedfilenames = {transformation_number: os.path.join(stagingdirectory,
+                                                               os.path.basename(destfilename))
+                           for transformation_number, destfilename in destfilenames.items()}
+        statuses = run_transformations__staged(sourcefilename, stagedfilenames, overlay)
+        for transformation_number, status in statuses.items():
+            if status == 0 and os.path.exists(stagedfilenames[transformation_number]):
+                publish_file(stagedfilenames[transformation_number],
+                             destfilenames[transformation_number])
+    finally:
+        shutil.rmtree(stagingdirectory)
+
+    return statuses
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_transformations__staged(sourcefilename, destfilenames, overlay):
+    """
+        Compute the transformations of run_transformations(), destfilenames being
+        the files of the scratch directory.
+
+        Return a dict transformation number -> exit status of the embedding.
+    """
+    engine_destfilenames = run_jpeg_fast_path(sourcefilename, destfilenames)
+    chains = plan_transformations(engine_destfilenames)
+
+    # the metrics of the engine's stages are given to the transformations which
+    # share them (see chain_transformations()) :
+    METRICS__CONTEXT["transform"] = "+".join(str(transformation_number)
+                                             for transformation_number in
+                                             sorted(engine_destfilenames)
+                                             if TRANSFORMATION_STEPS[transformation_number])
+    if ARGS.concurrency > 1:
+        statuses = asyncio.run(run_transformations__async(sourcefilename,
+                                                          engine_destfilenames,
+                                                          overlay,
+                                                          chains))
+        # the images written by run_jpeg_fast_path() :
+        for transformation_number in set(destfilenames) - set(engine_destfilenames):
+            METRICS__CONTEXT["transform"] = str(transformation_number)
+            statuses[transformation_number] = embed(destfilenames[transformation_number],
+                                                    destfilenames[transformation_number])
+        METRICS__CONTEXT["transform"] = None
+        return statuses
+
+    run_steps(sourcefilename, engine_destfilenames, overlay, chains)
+
+    # steghide
+    statuses = {}
+    for transformation_number, destfilename in sorted(destfilenames.items()):
+        METRICS__CONTEXT["transform"] = str(transformation_number)
+        if TRANSFORMATION_STEPS[transformation_number]:
+            statuses[transformation_number] = embed(destfilename, destfilename)
+        else:
+            statuses[transformation_number] = embed(sourcefilename, destfilename)
+    METRICS__CONTEXT["transform"] = None
+    return statuses
+
+#///////////////////////////////////////////////////////////////////////////////
+def set_recipient(message, passphrase):
+    """
+        (--manifest) ARGS.message and ARGS.passphrase become message and
+        passphrase; the steghide embed file is written again.
+    """
+    ARGS.message, ARGS.passphrase = message, passphrase
+    write_embed_file(STEGHIDE__EMBED_FILE)
+
+#///////////////////////////////////////////////////////////////////////////////
+def fanout_resize(sourcefilename, resizedfilename):
+    """
+        (--manifest) Write in resizedfilename (a lossless file) the resized
+        source, computed once and watermarked for each recipient (see
+        fanout_watermark()).
+    """
+    if ARGS.engine == "native":
+        if shrink_on_load(sourcefilename):
+            image = native_open__shrunk(sourcefilename, 400)
+        else:
+            image = native_open(sourcefilename)
+        native_resize400(image).save(resizedfilename, format="PNG")
+        return
+
+    read_options = imagemagick_shrink_on_load(get_image_size(sourcefilename)) \
+                   if shrink_on_load(sourcefilename) else []
+    system(["convert"] + read_options + [sourcefilename] +
+           imagemagick_operators("resize", None, None, False) + [resizedfilename],
+           outputs=(resizedfilename,))
+
+#///////////////////////////////////////////////////////////////////////////////
+def fanout_watermark(resizedfilename, destfilename, quality):
+    """
+        (--manifest) Write in destfilename the image of the transformation #1 for
+        the current recipient : resizedfilename (see fanout_resize()) watermarked
+        with ARGS.message.
+
+        quality : JPEG quality of the native engine (see native_jpeg_quality())
+    """
+    if ARGS.engine == "native":
+        image = Image.open(resizedfilename)
+        image.load()
+        native_save(native_watermark(image, ARGS.message), destfilename, quality)
+        return
+
+    system(["convert", "-respect-parentheses", resizedfilename] +
+           imagemagick_operators("watermark", None, None, False) + [destfilename],
+           outputs=(destfilename,))
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_transformations__fanout(sourcefilename, destfilenames, overlay):
+    """
+        (--manifest) Apply to sourcefilename the transformations for every
+        recipient; destfilenames is a dict recipient -> (transformation number ->
+        destination file), the recipients being the ones of ARGS.recipients.
+
+        Only the watermark (transformation #1) and the embedding depend on the
+        recipient : the other steps are computed once, in the scratch directory
+        (see run_steps()), as the resized image watermarked for each recipient
+        (see fanout_resize()); each destination file is then embedded and
+        published (see publish_file()). --concurrency is ignored.
+
+        Return a dict recipient -> (transformation number -> exit status of the
+        embedding).
+    """
+    if not ARGS.quiet:
+        for recipient_filenames in destfilenames.values():
+            for transformation_number in sorted(recipient_filenames):
+                print("     {0} ... creating {1} ....".format(
+                    PROMPT, recipient_filenames[transformation_number]))
+
+    transformation_numbers = sorted(next(iter(destfilenames.values())))
+    extension = os.path.splitext(sourcefilename)[1]
+    message, passphrase = ARGS.message, ARGS.passphrase
+
+    stagingdirectory = tempfile.mkdtemp(prefix="watersteg.", dir=ARGS.scratch)
+    try:
+        # the images which don't depend on the recipient :
+        shared = {transformation_number: os.path.join(stagingdirectory,
+                                                      "shared_{0}{1}".format(transformation_number,
+                                                                             extension))
+                  for transformation_number in transformation_numbers
+                  if TRANSFORMATION_STEPS[transformation_number] and
+                  "watermark" not in TRANSFORMATION_STEPS[transformation_number]}
+        shared_engine = run_jpeg_fast_path(sourcefilename, shared)
+        METRICS__CONTEXT["transform"] = "+".join(str(number) for number in sorted(shared_engine))
+        run_steps(sourcefilename, shared_engine, overlay, plan_transformations(shared_engine))
+
+        resizedfilename, quality = None, None
+        if 1 in transformation_numbers:
+            METRICS__CONTEXT["transform"] = "1"
+            resizedfilename = os.path.join(stagingdirectory,
+                                           "resized.png" if ARGS.engine == "native" else
+                                           "resized.miff")
+            fanout_resize(sourcefilename, resizedfilename)
+            if ARGS.engine == "native":
+                with Image.open(sourcefilename) as source_image:
+                    quality = native_jpeg_quality(source_image)
+
+        statuses = {}
+        for recipient in ARGS.recipients:
+            set_recipient(recipient["message"], recipient["passphrase"])
+            statuses[recipient["recipient"]] = {}
+            for transformation_number in transformation_numbers:
+                METRICS__CONTEXT["transform"] = str(transformation_number)
+                destfilename = destfilenames[recipient["recipient"]][transformation_number]
+                stagedfilename = os.path.join(stagingdirectory, os.path.basename(destfilename))
+
+                if transformation_number == 1:
+                    fanout_watermark(resizedfilename, stagedfilename, quality)
+                    status = embed(stagedfilename, stagedfilename)
+                elif transformation_number in shared:
+                    status = embed(shared[transformation_number], stagedfilename)
+                else:
+                    status = embed(sourcefilename, stagedfilename)
+
+                if status == 0 and os.path.exists(stagedfilename):
+                    publish_file(stagedfilename, destfilename)
+                statuses[recipient["recipient"]][transformation_number] = status
+    finally:
+        set_recipient(message, passphrase)
+        METRICS__CONTEXT["transform"] = None
+        shutil.rmtree(stagingdirectory)
+
+    return statuses
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform1__r400_wm_s(sourcefilename, destfilename):
+    """
+        transformation :
+
+                source file -> source file + resize 400 + watermark + steghide
+
+        Return the exit status of the embedding (0 if the file has been written).
+    """
+    return run_transformations(sourcefilename, {1: destfilename}, None)[1]
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform2__steghide(sourcefilename, destfilename):
+    """
+        transformation :
+
+                source file -> source file + steghide
+
+        Return the exit status of the embedding (0 if the file has been written).
+    """
+    return run_transformations(sourcefilename, {2: destfilename}, None)[2]
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform3__steghide_overlay(sourcefilename, destfilename, overlay):
+    """
+        transformation :
+
+                source file -> source file + steghide + overlay
+
+        Return the exit status of the embedding (0 if the file has been written).
+    """
+    return run_transformations(sourcefilename, {3: destfilename}, overlay)[3]
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform4__gray__steghide(sourcefilename, destfilename):
+    """
+        transformation :
+
+                source file -> source file in gray + steghide
+
+        Return the exit status of the embedding (0 if the file has been written).
+    """
+    return run_transformations(sourcefilename, {4: destfilename}, None)[4]
+
+#///////////////////////////////////////////////////////////////////////////////
+def transf5__gray__steg_overlay(sourcefilename, destfilename, overlay):
+    """
+        transformation :
+
+                source file -> source file in gray + steghide + overlay
+
+        Return the exit status of the embedding (0 if the file has been written).
+    """
+    return run_transformations(sourcefilename, {5: destfilename}, overlay)[5]
+
+# transformations : (number, format of the destination file, function, does the
+#                   function use the overlay ?)
+TRANSFORMATIONS = ((1, FILENAME__TRANS1__FORMAT, transform1__r400_wm_s, False),
+                   (2, FILENAME__TRANS2__FORMAT, transform2__steghide, False),
+                   (3, FILENAME__TRANS3__FORMAT, transform3__steghide_overlay, True),
+                   (4, FILENAME__TRANS4__FORMAT, transform4__gray__steghide, False),
+                   (5, FILENAME__TRANS5__FORMAT, transf5__gray__steg_overlay, True))
+
+#///////////////////////////////////////////////////////////////////////////////
+def apply_transformations__fanout(destination_path,
+                                  source_basename,
+                                  source_extension,
+                                  source_directory,
+                                  overlay):
+    """
+        (--manifest) Apply the transformations selected by --transforms to the
+        source_* file for every recipient (see run_transformations__fanout()) :
+        the destination files are named after "<source basename>_<recipient>".
+
+        --result-cache and --prescan aren't used; with --resume, a source file
+        whose files haven't all been completed is transformed again for every
+        recipient.
+
+        Return the list of the files written in destination_path.
+    """
+    destfilenames = {}
+    for recipient in ARGS.recipients:
+        destfilenames[recipient["recipient"]] = {
+            transformation_number: filename_format.format(destination_path,
+                                                          "{0}_{1}".format(source_basename,
+                                                                           recipient["recipient"]),
+                                                          source_extension)
+            for transformation_number, filename_format, _, _ in TRANSFORMATIONS
+            if transformation_number in ARGS.transforms}
+
+    journal_write([record
+                   for recipient, recipient_filenames in destfilenames.items()
+                   for record in journal_records("started", source_directory,
+                                                 recipient_filenames, recipient)])
+
+    statuses = run_transformations__fanout(source_directory, destfilenames, overlay)
+
+    journal_write([record
+                   for recipient, recipient_filenames in destfilenames.items()
+                   for record in journal_records(
+                       "completed", source_directory,
+                       {transformation_number: destfilename
+                        for transformation_number, destfilename in recipient_filenames.items()
+                        if statuses[recipient][transformation_number] == 0 and
+                        os.path.exists(destfilename)},
+                       recipient)])
+
+    return [recipient_filenames[transformation_number]
+            for recipient_filenames in destfilenames.values()
+            for transformation_number in sorted(recipient_filenames)]
+
+#///////////////////////////////////////////////////////////////////////////////
+def apply_transformations(destination_path,
+                          source_basename,
+                          source_extension,
+                          source_directory,
+                          overlay):
+    """
+        Apply the transformations selected by --transforms to the source_* file
+        and write the resulting files in destination_path; the steps shared by
+        several transformations are computed once (see run_transformations()).
+
+        With --result-cache, the files already computed for the same source
+        content and parameters are taken from the cache (see result_cache_key()).
+
+        With --prescan, the destination files which couldn't carry the message
+        aren't computed (see prescan_transformations()).
+
+        With --manifest, the files are written for every recipient (see
+        apply_transformations__fanout()).
+
+        With --journal, the destination files are recorded as started, then as
+        completed (see journal_write()); with --resume, the ones completed by the
+        previous run are kept.
+
+        Return the list of the files written in destination_path.
+    """
+    if ARGS.recipients is not None:
+        return apply_transformations__fanout(destination_path,
+                                             source_basename,
+                                             source_extension,
+                                             source_directory,
+                                             overlay)
+
+    destfilenames = {}
+    keys = {}
+    for transformation_number, filename_format, _, _ in TRANSFORMATIONS:
+        if transformation_number in ARGS.transforms:
+            destfilenames[transformation_number] = filename_format.format(destination_path,
+                                                                          source_basename,
+                                                                          source_extension)
+            keys[transformation_number] = None
+
+    missing = dict(destfilenames)
+
+    if JOURNAL__DONE_FILES:
+        for transformation_number, destfilename in destfilenames.items():
+            if os.path.abspath(destfilename) in JOURNAL__DONE_FILES and \
+               os.path.exists(destfilename):
+                del missing[transformation_number]
+                if not ARGS.quiet:
+                    print("     {0} ... {1} already written (--resume)".format(PROMPT,
+                                                                              destfilename))
+
+    if ARGS.result_cache is not None:
+        source_digest = file_digest(source_directory)
+        overlay_digest = file_digest(overlay)
+        for transformation_number, _, _, uses_overlay in TRANSFORMATIONS:
+            if transformation_number not in missing:
+                continue
+
+            key = result_cache_key(transformation_number, source_digest,
+                                   overlay_digest if uses_overlay else None)
+            keys[transformation_number] = key
+
+            if result_cache_fetch(key, destfilenames[transformation_number]):
+                del missing[transformation_number]
+                if not ARGS.quiet:
+                    print("     {0} ... {1} taken from the cache".format(
+                        PROMPT, destfilenames[transformation_number]))
+
+    skipped = set()
+    if missing and ARGS.prescan:
+        skipped = prescan_transformations(source_directory, missing)
+        for transformation_number in skipped:
+            del missing[transformation_number]
+
+    if missing:
+        journal_write(journal_records("started", source_directory, missing))
+        statuses = run_transformations(source_directory, missing, overlay)
+
+        for transformation_number, destfilename in missing.items():
+            result_cache_store(keys[transformation_number], destfilename,
+                               statuses[transformation_number])
+
+        journal_write(journal_records("completed", source_directory,
+                                      {transformation_number: destfilename
+                                       for transformation_number, destfilename in missing.items()
+                                       if statuses[transformation_number] == 0 and
+                                       os.path.exists(destfilename)}))
+
+    return [destfilenames[transformation_number]
+            for transformation_number in sorted(destfilenames)
+            if transformation_number not in skipped]
+
+#///////////////////////////////////////////////////////////////////////////////
+def native_compare(filename1, filename2):
+    """
+        Compare the pixels of two images.
+
+        Return (mean absolute difference, maximal absolute difference), 0-255 scale,
+        or None if the images don't have the same dimensions.
+    """
+    with Image.open(filename1) as image1, Image.open(filename2) as image2:
+        if image1.size != image2.size:
+            return None
+
+        mode = "L" if image1.mode == image2.mode == "L" else "RGB"
+        pixels1 = numpy.asarray(image1.convert(mode), dtype=numpy.int16)
+        pixels2 = numpy.asarray(image2.convert(mode), dtype=numpy.int16)
+    difference = numpy.abs(pixels1 - pixels2)
+
+    return (float(difference.mean()), int(difference.max()))
+
+#///////////////////////////////////////////////////////////////////////////////
+def check_engines(source_file):
+    """
+        (--check-engine) Apply the transformations to one of the tuples yielded
+        by get_source_files() with both engines, in a temporary directory, and
+        compare the resulting images.
+
+        Return True if every image written by the native engine is within
+        NATIVE__CHECK_TOLERANCE of the image written by ImageMagick.
+    """
+    source_basename, source_extension, source_filename, _ = source_file
+    result = True
+
+    # the engine chosen by --engine, restored at the end :
+    previous_engine = ARGS.engine
+    tmpdirectory = tempfile.mkdtemp(prefix="watersteg.")
+    try:
+        written_files = {}
+        for engine in ("imagemagick", "native"):
+            ARGS.engine = engine
+            os.mkdir(os.path.join(tmpdirectory, engine))
+            written_files[engine] = \
+                apply_transformations(destination_path=os.path.join(tmpdirectory, engine, ""),
+                                      source_basename=source_basename,
+                                      source_extension=source_extension,
+                                      source_directory=source_filename,
+                                      overlay=OVERLAY)
+
+        for filename1, filename2 in zip(written_files["imagemagick"],
+                                        written_files["native"]):
+            difference = native_compare(filename1, filename2)
+            if difference is None:
+                result = False
+                print("{0} !! {1} : the dimensions differ".format(PROMPT,
+                                                                  os.path.basename(filename2)))
+            elif difference[0] > NATIVE__CHECK_TOLERANCE:
+                result = False
+                print("{0} !! {1} : mean difference={2:.2f}, max difference={3} " \
+                      "(tolerance={4})".format(PROMPT, os.path.basename(filename2),
+                                               difference[0], difference[1],
+                                               NATIVE__CHECK_TOLERANCE))
+            elif not ARGS.quiet:
+                print("{0} {1} : mean difference={2:.2f}, " \
+                      "max difference={3}".format(PROMPT, os.path.basename(filename2),
+                                                  difference[0], difference[1]))
+    finally:
+        ARGS.engine = previous_engine
+        shutil.rmtree(tmpdirectory)
+
+    return result
+
+#///////////////////////////////////////////////////////////////////////////////
+def extract_file(source_file):
+    """
+        (--extract) Extract the message embedded in one of the files yielded by
+        get_source_files() and compare it with ARGS.message .
+
+        Return True if the extracted message is ARGS.message .
+    """
+    source_filename = source_file[2]
+    backend, message = extract(source_filename, ARGS.passphrase)
+
+    if message is None:
+        print("{0} !! \"{1}\" : no message could be extracted.".format(PROMPT,
+                                                                     source_filename))
+        return False
+
+    message = message.decode("utf-8", "replace")
+    if message != ARGS.message:
+        print("{0} !! \"{1}\" ({2}) : unexpected message \"{3}\".".format(PROMPT,
+                                                                         source_filename,
+                                                                         backend,
+                                                                         message))
+        return False
+
+    if not ARGS.quiet:
+        print("{0} \"{1}\" ({2}) : ok.".format(PROMPT, source_filename, backend))
+    return True
+
+#///////////////////////////////////////////////////////////////////////////////
+def destination_file_patterns():
+    """
+        Return a list of (transformation number, regular expression) : the
+        expressions match the names of the destination files written by each
+        transformation (see FILENAME__TRANS*__FORMAT).
+    """
+    patterns = []
+    for transformation_number, filename_format, _, _ in TRANSFORMATIONS:
+        # "\0" and "\1" stand for the basename and the extension :
+        before, rest = filename_format.format("", "\0", "\1").split("\0")
+        middle, after = rest.split("\1")
+        patterns.append((transformation_number,
+                         re.compile("^" + re.escape(before) + "(.+)" + re.escape(middle) +
+                                    r"(\.[^.]+)" + re.escape(after) + "$")))
+    return patterns
+
+#///////////////////////////////////////////////////////////////////////////////
+def find_destination_files(directory):
+    """
+        (--verify) Yield a (filename, transformation number) tuple for each
+        destination file found in directory and in its subdirectories.
+    """
+    patterns = destination_file_patterns()
+    for filename, _ in scan_directory(directory, True):
+        for transformation_number, pattern in patterns:
+            if pattern.match(os.path.basename(filename)):
+                yield (filename, transformation_number)
+                break
+
+#///////////////////////////////////////////////////////////////////////////////
+def verify_file(destination_file):
+    """
+        (--verify) Extract the message embedded in one of the tuples yielded by
+        find_destination_files() and compare it with ARGS.message .
+
+        This function is called either directly (--jobs 1) or by a worker process
+        of the pool (--jobs > 1).
+
+        Return a dict :
+            o "file" : the destination filename
+            o "transformation" : the number of the transformation
+            o "backend" : the steganography backend which has read the message
+            o "status" : "ok", "no message", "unexpected message" or "unreadable"
+            o "seconds" : time spent to extract the message
+    """
+    filename, transformation_number = destination_file
+
+    start = time.time()
+    try:
+        backend, message = extract(filename, ARGS.passphrase)
+        if message is None:
+            status = "no message"
+        elif message.decode("utf-8", "replace") != ARGS.message:
+            status = "unexpected message"
+        else:
+            status = "ok"
+    except (IOError, OSError, ValueError):
+        # e.g. a truncated file, which Pillow can't decode.
+        backend, status = None, "unreadable"
+    seconds = time.time() - start
+
+    if status != "ok":
+        print("{0} !! \"{1}\" : {2}.".format(PROMPT, filename, status))
+    elif not ARGS.quiet:
+        print("{0} \"{1}\" ({2}) : ok.".format(PROMPT, filename, backend))
+
+    return {"file": filename,
+            "transformation": transformation_number,
+            "backend": backend,
+            "status": status,
+            "seconds": seconds}
+
+#///////////////////////////////////////////////////////////////////////////////
+def benchmark_stego_backends(source_files):
+    """
+        (--benchmark-stego) Embed ARGS.message in each of the source_files, in a
+        temporary directory, and display the time spent by each backend for each
+        kind of cover :
+
+            o the BMP files (lossless) : both backends, on the same files;
+            o the JPEG files : steghide alone, since the native backend only
+              embeds in the pixels of lossless files (see stego_backend()).
+    """
+    covers = (("BMP", (".bmp",), ("steghide", "native")),
+              ("JPEG", (".jpg", ".jpeg"), ("steghide",)))
+    # (cover, backend) -> [files, seconds]
+    durations = {(cover, backend): [0, 0.0]
+                 for cover, _, backends in covers for backend in backends}
+
+    tmpdirectory = tempfile.mkdtemp(prefix="watersteg.")
+    try:
+        for _, source_extension, source_filename, _ in source_files:
+            for cover, extensions, backends in covers:
+                if source_extension.lower() in extensions:
+                    break
+            else:
+                if ARGS.debug:
+                    print("@@ benchmark : \"{0}\" skipped".format(source_filename))
+                continue
+
+            for backend in backends:
+                stegofilename = os.path.join(tmpdirectory, backend + source_extension)
+                start = time.time()
+                STEGO__BACKENDS[backend][0](source_filename, stegofilename)
+                durations[(cover, backend)][0] += 1
+                durations[(cover, backend)][1] += time.time() - start
+    finally:
+        shutil.rmtree(tmpdirectory)
+
+    for cover, _, backends in covers:
+        for backend in ("steghide", "native"):
+            if backend not in backends:
+                print("{0} {1:4} {2:8} : not supported (steghide embeds these " \
+                      "files)".format(PROMPT, cover, backend))
+                continue
+            number_of_files, seconds = durations[(cover, backend)]
+            if seconds:
+                print("{0} {1:4} {2:8} : {3} file(s) in {4:.3f}s, {5:.1f} file(s)/s".format(
+                    PROMPT, cover, backend, number_of_files, seconds,
+                    number_of_files / seconds))
+            else:
+                print("{0} {1:4} {2:8} : no file".format(PROMPT, cover, backend))
+
+#///////////////////////////////////////////////////////////////////////////////
+def generate_corpus(directory):
+    """
+        (--benchmark) Write in directory the synthetic source files described by
+        BENCHMARK__RESOLUTIONS, BENCHMARK__FORMATS and BENCHMARK__IMAGES : the
+        pixels depend only on fixed seeds, so that two runs read the same corpus.
+        The files already written in directory are kept.
+
+        Return the list of the (source_basename, source_extension, source_filename,
+        source_subdirectory) tuples, as get_source_files() does.
+    """
+    corpus = []
+    seed = 0
+    for width, height in BENCHMARK__RESOLUTIONS:
+        for extension in BENCHMARK__FORMATS:
+            for _ in range(BENCHMARK__IMAGES):
+                seed += 1
+                basename = "synthetic_{0}x{1}_{2}".format(width, height, seed)
+                filename = os.path.join(directory, basename + extension)
+
+                if not os.path.exists(filename):
+                    if Image is not None:
+                        # smooth random colors + noise :
+                        random = numpy.random.RandomState(seed)
+                        colors = random.randint(0, 256, (height // 64 + 2, width // 64 + 2, 3))
+                        image = Image.fromarray(colors.astype(numpy.uint8), "RGB")
+                        pixels = numpy.asarray(image.resize((width, height), Image.BICUBIC),
+                                               dtype=numpy.float32)
+                        pixels += random.normal(0, 8, pixels.shape)
+                        image = Image.fromarray(numpy.clip(pixels, 0, 255).astype(numpy.uint8))
+                        if extension == ".jpg":
+                            image.save(filename, format="JPEG", quality=90)
+                        else:
+                            image.save(filename, format="BMP")
+                    else:
+                        system(["convert", "-seed", str(seed),
+                                "-size", "{0}x{1}".format(width, height), "plasma:fractal",
+                                "-quality", "90", "-type", "TrueColor", filename],
+                               outputs=(filename,))
+
+                corpus.append((basename, extension, filename, ""))
+
+    return corpus
+
+#///////////////////////////////////////////////////////////////////////////////
+def benchmark_statistics(latencies, duration=None, megapixels=None):
+    """
+        Return a dict describing the list of latencies (in seconds) :
+        number of images, images/s, 50th and 95th percentiles of the latencies.
+
+        duration : total time; the sum of the latencies if None.
+        megapixels : if not None, the megapixels of the source files, for the
+                     megapixels/s.
+    """
+    latencies = sorted(latencies)
+    if duration is None:
+        duration = sum(latencies)
+
+    def percentile(rank):
+        """Nearest-rank percentile."""
+        return latencies[max(0, int(math.ceil(rank / 100.0 * len(latencies))) - 1)]
+
+    statistics = {"images": len(latencies),
+                  "images_per_second": len(latencies) / duration if duration else 0.0,
+                  "p50": percentile(50),
+                  "p95": percentile(95)}
+    if megapixels is not None:
+        statistics["megapixels_per_second"] = megapixels / duration if duration else 0.0
+    return statistics
+
+#///////////////////////////////////////////////////////////////////////////////
+def run_benchmark(corpus_directory):
+    """
+        (--benchmark) Generate the synthetic corpus in corpus_directory, then
+        time :
+
+            o each transformation function (transform1__r400_wm_s(), ...) on each
+              source file;
+            o apply_transformations() on batches of BENCHMARK__BATCH_SIZES source
+              files;
+            o with --jpeg-fast-path, the transformations #1 and #4 on the JPEG
+              source files, with and without the fast path (see
+              run_jpeg_fast_path()) : the report gives the speedup in
+              megapixels/s.
+
+        Return the report (a dict which can be written as JSON).
+    """
+    corpus = generate_corpus(corpus_directory)
+    if not ARGS.quiet:
+        print("{0} benchmark : {1} synthetic source file(s) in \"{2}\"".format(PROMPT,
+                                                                            len(corpus),
+                                                                            corpus_directory))
+
+    # the messages and the result cache would disturb the measures :
+    quiet, result_cache, jpeg_fast_path = ARGS.quiet, ARGS.result_cache, ARGS.jpeg_fast_path
+    ARGS.quiet, ARGS.result_cache = True, None
+
+    # megapixels of each source file :
+    megapixels = {}
+    for _, _, source_filename, _ in corpus:
+        width, height = source_dimensions(source_filename)
+        megapixels[source_filename] = width * height / 1e6
+
+    results = {}
+    speedups = {}
+    destination_path = tempfile.mkdtemp(prefix="watersteg.")
+    try:
+        for _, filename_format, function, uses_overlay in TRANSFORMATIONS:
+            latencies = []
+            for source_basename, source_extension, source_filename, _ in corpus:
+                destfilename = filename_format.format(os.path.join(destination_path, ""),
+                                                      source_basename,
+                                                      source_extension)
+                start = time.time()
+                if uses_overlay:
+                    function(source_filename, destfilename, OVERLAY)
+                else:
+                    function(source_filename, destfilename)
+                latencies.append(time.time() - start)
+
+            results[function.__name__] = benchmark_statistics(latencies,
+                                                              megapixels=sum(megapixels.values()))
+
+        jpeg_corpus = [source_file for source_file in corpus
+                       if sniff_image_format(source_file[2]) == "JPEG"]
+        for transformation_number, filename_format, function, _ in TRANSFORMATIONS:
+            if not jpeg_fast_path or not jpeg_corpus or transformation_number not in (1, 4):
+                continue
+
+            for fast_path, name in ((False, function.__name__ + "[jpeg]"),
+                                    (True, function.__name__ + "[jpeg, fast path]")):
+                ARGS.jpeg_fast_path = fast_path
+                latencies = []
+                for source_basename, source_extension, source_filename, _ in jpeg_corpus:
+                    start = time.time()
+                    function(source_filename,
+                             filename_format.format(os.path.join(destination_path, ""),
+                                                    source_basename,
+                                                    source_extension))
+                    latencies.append(time.time() - start)
+                results[name] = benchmark_statistics(
+                    latencies,
+                    megapixels=sum(megapixels[source_file[2]] for source_file in jpeg_corpus))
+
+            speedups[function.__name__] = \
+                results[function.__name__ + "[jpeg, fast path]"]["megapixels_per_second"] / \
+                (results[function.__name__ + "[jpeg]"]["megapixels_per_second"] or 1.0)
+        ARGS.jpeg_fast_path = jpeg_fast_path
+
+        for batch_size in BENCHMARK__BATCH_SIZES:
+            latencies = []
+            batch_start = time.time()
+            for index in range(batch_size):
+                source_basename, source_extension, source_filename, _ = \
+                    corpus[index % len(corpus)]
+                start = time.time()
+                apply_transformations(destination_path=os.path.join(destination_path, ""),
+                                      source_basename=source_basename,
+                                      source_extension=source_extension,
+                                      source_directory=source_filename,
+                                      overlay=OVERLAY)
+                latencies.append(time.time() - start)
+
+            results["apply_transformations[batch={0}]".format(batch_size)] = \
+                benchmark_statistics(latencies,
+                                     time.time() - batch_start,
+                                     sum(megapixels[corpus[index % len(corpus)][2]]
+                                         for index in range(batch_size)))
+    finally:
+        ARGS.quiet, ARGS.result_cache, ARGS.jpeg_fast_path = quiet, result_cache, jpeg_fast_path
+        shutil.rmtree(destination_path)
+
+    return {"program": PROGRAM_NAME,
+            "version": PROGRAM_VERSION,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "engine": ARGS.engine,
+            "stego": ARGS.stego,
+            "pipeline": ARGS.pipeline,
+            "corpus": [os.path.basename(source_filename) for _, _, source_filename, _ in corpus],
+            "results": results,
+            # (--jpeg-fast-path) megapixels/s with the fast path / without it :
+            "jpeg_fast_path_speedup": speedups,
+            # ru_maxrss is given in kilobytes by Linux :
+            "peak_rss_kb": {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}}
+
+#///////////////////////////////////////////////////////////////////////////////
+def compare_benchmarks(report, baseline):
+    """
+        (--benchmark-baseline) Compare the results of two reports written by
+        run_benchmark() .
+
+        Return the list of the regressions (strings) : images/s lower or p95
+        latency higher than the baseline by more than
+        BENCHMARK__REGRESSION_THRESHOLD.
+    """
+    regressions = []
+    for name, result in sorted(report["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        reference = baseline["results"][name]
+
+        if result["images_per_second"] < \
+           reference["images_per_second"] * (1 - BENCHMARK__REGRESSION_THRESHOLD):
+            regressions.append("{0} : {1:.2f} image(s)/s instead of {2:.2f}".format(
+                name, result["images_per_second"], reference["images_per_second"]))
+
+        if result["p95"] > reference["p95"] * (1 + BENCHMARK__REGRESSION_THRESHOLD):
+            regressions.append("{0} : p95 latency = {1:.3f}s instead of {2:.3f}s".format(
+                name, result["p95"], reference["p95"]))
+
+    return regressions
+
+#///////////////////////////////////////////////////////////////////////////////
+def sniff_image_format(filename):
+    """
+        Read the first bytes of filename and return the name of its format (see
+        SOURCE__MAGIC_NUMBERS) or None if the format isn't known.
+    """
+    try:
+        with open(filename, "rb") as image_file:
+            header = image_file.read(SOURCE__SNIFF_LENGTH)
+    except (IOError, OSError):
+        return None
+
+    for magic_number, image_format in SOURCE__MAGIC_NUMBERS:
+        if header.startswith(magic_number):
+            return image_format
+    return None
+
+#///////////////////////////////////////////////////////////////////////////////
+def is_a_source_file(filename, relative_filename):
+    """
+        Return True if filename must be transformed :
+
+            o relative_filename (path from the source directory) matches one of
+              the --include patterns (if any) and none of the --exclude patterns;
+            o its format can carry steganographic data : JPEG and BMP (steghide),
+              PNG (only with --stego native).
+    """
+    def matches(patterns):
+        """Does filename match one of the patterns ?"""
+        return any(fnmatch.fnmatch(relative_filename, pattern) or
+                   fnmatch.fnmatch(os.path.basename(relative_filename), pattern)
+                   for pattern in patterns)
+
+    if ARGS.include and not matches(ARGS.include):
+        return False
+    if ARGS.exclude and matches(ARGS.exclude):
+        return False
+
+    image_format = sniff_image_format(filename)
+    if image_format in ("JPEG", "BMP") or (image_format == "PNG" and ARGS.stego == "native"):
+        return True
+
+    if ARGS.debug:
+        print("@@ \"{0}\" skipped (format : {1})".format(filename, image_format))
+    return False
+
+#///////////////////////////////////////////////////////////////////////////////
+def scan_directory(directory, recursive, subdirectory=""):
+    """
+        Yield a (filename, relative filename) tuple for each file in
+        directory (and in its subdirectories if recursive is True), as soon as
+        os.scandir() finds it.
+
+        The symbolic links to directories aren't followed (a loop would yield
+        the same files again and again); a directory or an entry which can't be
+        read is skipped.
+
+        subdirectory : path of directory relative to the source directory.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_a_file = entry.is_file()
+                    is_a_directory = entry.is_dir(follow_symlinks=False)
+                except OSError as error:
+                    print("{0} !! \"{1}\" skipped : {2}".format(PROMPT, entry.path, error))
+                    continue
+
+                if is_a_file:
+                    yield (entry.path, os.path.join(subdirectory, entry.name))
+                elif is_a_directory and recursive:
+                    yield from scan_directory(entry.path, recursive,
+                                              os.path.join(subdirectory, entry.name))
+    except OSError as error:
+        print("{0} !! \"{1}\" skipped : {2}".format(PROMPT, directory, error))
+
+#///////////////////////////////////////////////////////////////////////////////
+def source_file_key(relative_filename):
+    """
+        Return the SHA-1 (hexadecimal) of relative_filename, the path of a source
+        file relative to --source : the same on every node (see --shard, --queue).
+    """
+    return hashlib.sha1(relative_filename.encode("utf-8")).hexdigest()
+
+#///////////////////////////////////////////////////////////////////////////////
+def is_in_shard(relative_filename):
+    """
+        Return True if the source file relative_filename belongs to the shard
+        chosen by --shard (always True without --shard).
+    """
+    if ARGS.shard is None:
+        return True
+    shard, shards = ARGS.shard
+    return int(source_file_key(relative_filename), 16) % shards == shard - 1
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_source_files(source, source_type):
+    """
+        Yield a (source_basename, source_extension, source_filename,
+        source_subdirectory) tuple for every file described by "source" and
+        accepted by is_a_source_file(); the files are yielded as soon as they are
+        found.
+
+            o source_type == "a file" : the file itself;
+            o source_type == "a directory" : every file in it (and in its
+              subdirectories with --recursive);
+            o source_type == "neither a file nor a directory" : every file matching
+              the wildcards (in the subdirectories too with --recursive).
+
+        source_subdirectory is the path of the file's directory relative to the
+        source directory ("" for the files directly in it) : the destination
+        files are written in the same subdirectory of DESTPATH.
+
+        With --shard, only the files of the shard are yielded (see is_in_shard()).
+    """
+    if source_type == 'a file':
+        # e.g. if source = img/IMG_4280.JPG,
+        #           then source_basename = IMG_4280
+        #           then source_extension = .JPG
+        if is_a_source_file(source, os.path.basename(source)) and \
+           is_in_shard(os.path.basename(source)):
+            source_basename, source_extension = os.path.splitext(os.path.basename(source))
+            yield (source_basename, source_extension, source, "")
+        return
+
+    if source_type == 'a directory':
+        source_directory = source
+        source_name = None
+    else:
+        # source_type == 'neither a file nor a directory', hopefully something with wildcards.
+        source_directory = os.path.dirname(source) or "."
+        source_name = os.path.basename(source)
+
+    for filename, relative_filename in scan_directory(source_directory, ARGS.recursive):
+        if source_name is not None and \
+           not fnmatch.fnmatch(os.path.basename(filename), source_name):
+            continue
+
+        if is_a_source_file(filename, relative_filename) and is_in_shard(relative_filename):
+            # e.g. if source = img/ and if filename = img/subdir/file001.jpg
+            #           then source_basename = file001
+            #           then source_extension = .jpg
+            #           then source_subdirectory = subdir
+            source_basename, source_extension = os.path.splitext(os.path.basename(filename))
+            yield (source_basename, source_extension, filename,
+                   os.path.dirname(relative_filename))
+
+#///////////////////////////////////////////////////////////////////////////////
+def reset_peak_rss():
+    """
+        (--large-images) Reset the peak RSS of this process (Linux >= 4.0), so
+        that peak_rss_kb() gives the peak RSS of the next source file.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as clear_refs:
+            clear_refs.write("5")
+    except (IOError, OSError):
+        pass
+
+#///////////////////////////////////////////////////////////////////////////////
+def peak_rss_kb():
+    """
+        Return the peak RSS of this process (in KiB) since the last call to
+        reset_peak_rss().
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+
+    # ru_maxrss is given in kilobytes by Linux (but isn't reset) :
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform_file(source_file):
+    """
+        Apply all the transformations to one of the tuples yielded by
+        get_source_files() .
+
+        This function is called either directly (--jobs 1) or by a worker process
+        of the pool (--jobs > 1).
+
+        Return a dict :
+            o "source" : the source filename
+            o "written_files" : the list of the files written
+            o "caches" : hits/misses of the caches for this file (see cache_counters())
+            o "metrics" : metrics of the external stages for this file (see
+              new_metrics())
+            o "skipped" : the destination files skipped by --prescan (see
+              PRESCAN__SKIPPED)
+            o "complete" : True if all the destination files have been written
+    """
+    source_basename, source_extension, source_filename, source_subdirectory = source_file
+
+    destination_path = DESTPATH
+    if source_subdirectory:
+        destination_path = os.path.join(DESTPATH, source_subdirectory, "")
+        if not os.path.exists(destination_path):
+            try:
+                os.makedirs(destination_path)
+            except OSError:
+                # created in the meantime by another worker.
+                pass
+
+    counters_before = cache_counters()
+    skipped_before = len(PRESCAN__SKIPPED)
+
+    metrics, previous_metrics = new_metrics(), METRICS__CONTEXT["metrics"]
+    METRICS__CONTEXT["metrics"], METRICS__CONTEXT["file"] = metrics, source_filename
+    if ARGS.large_images:
+        reset_peak_rss()
+    try:
+        written_files = apply_transformations(destination_path=destination_path,
+                                              source_basename=source_basename,
+                                              source_extension=source_extension,
+                                              source_directory=source_filename,
+                                              overlay=OVERLAY)
+    finally:
+        METRICS__CONTEXT["metrics"], METRICS__CONTEXT["file"] = previous_metrics, None
+
+    # every embedding has succeeded (the failed files aren't published) :
+    complete = all(os.path.exists(filename) for filename in written_files)
+    if complete:
+        journal_write([{"event": "completed",
+                        "source": os.path.abspath(source_filename),
+                        "transforms": ARGS.transforms}])
+
+    if ARGS.large_images:
+        counters = metrics["files"].setdefault(source_filename, {})
+        counters["self_maxrss_kb"] = peak_rss_kb()
+        if not ARGS.quiet:
+            print("     {0} peak RSS for \"{1}\" : {2} KiB (watersteg), " \
+                  "{3} KiB (external programs)".format(PROMPT,
+                                                       source_filename,
+                                                       counters["self_maxrss_kb"],
+                                                       counters.get("maxrss_kb", 0)))
+
+    caches = {}
+    for name, (hits, misses) in cache_counters().items():
+        caches[name] = [hits - counters_before[name][0], misses - counters_before[name][1]]
+
+    return {"source": source_filename,
+            "written_files": written_files,
+            "caches": caches,
+            "metrics": metrics,
+            "skipped": PRESCAN__SKIPPED[skipped_before:],
+            "complete": complete}
+
+#///////////////////////////////////////////////////////////////////////////////
+def add_results(total, result):
+    """
+        Add to total (a dict) the per-file result returned by transform_file() .
+    """
+    total["files"] = total.get("files", 0) + 1
+
+    caches = total.setdefault("caches", {})
+    for name, (hits, misses) in result["caches"].items():
+        counters = caches.setdefault(name, [0, 0])
+        counters[0] += hits
+        counters[1] += misses
+
+    merge_metrics(total.setdefault("metrics", new_metrics()), result["metrics"])
+
+    total.setdefault("skipped", []).extend(result["skipped"])
+
+#///////////////////////////////////////////////////////////////////////////////
+def queue_claim(key, owner):
+    """
+        (--queue) Try to claim the source file whose key (see source_file_key())
+        is given : its lease file is created with O_EXCL, which works on NFS too;
+        an expired lease (not renewed for --lease-seconds : its node has crashed)
+        is first moved away by a rename, which only one node can do.
+
+        The clocks of the nodes are supposed to be synchronized (NTP).
+
+        Return the name of the lease file, or None if the source file has already
+        been transformed or is claimed by another node.
+    """
+    leasefilename = os.path.join(ARGS.queue, key + ".lease")
+    if os.path.exists(os.path.join(ARGS.queue, key + ".done")):
+        return None
+
+    for _ in range(2):
+        try:
+            lease = os.open(leasefilename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except OSError:
+            try:
+                if time.time() - os.path.getmtime(leasefilename) < ARGS.lease_seconds:
+                    return None
+                stalefilename = "{0}.{1}.stale".format(leasefilename, owner.replace("/", "_"))
+                os.rename(leasefilename, stalefilename)
+            except OSError:
+                # released or taken over in the meantime.
+                return None
+
+            if time.time() - os.path.getmtime(stalefilename) < ARGS.lease_seconds:
+                # a lease renewed in the meantime : it is given back.
+                try:
+                    os.link(stalefilename, leasefilename)
+                except OSError:
+                    pass
+                os.remove(stalefilename)
+                return None
+            os.remove(stalefilename)
+            if ARGS.debug:
+                print("@@ lease \"{0}\" has expired : taken over".format(leasefilename))
+            continue
+
+        with os.fdopen(lease, "w") as lease_file:
+            lease_file.write(owner)
+        # a file transformed between the first test and the claim :
+        if os.path.exists(os.path.join(ARGS.queue, key + ".done")):
+            os.remove(leasefilename)
+            return None
+        return leasefilename
+
+    return None
 
 #///////////////////////////////////////////////////////////////////////////////
-#
-# (2) before quitting
-#
-#///////////////////////////////////////////////////////////////////////////////
+def queue_heartbeat(leasefilename, owner, stop):
+    """
+        (--queue) Renew the lease leasefilename (its modification time) until
+        stop (a threading.Event) is set, as long as owner holds it.
+    """
+    while not stop.wait(ARGS.lease_seconds / QUEUE__HEARTBEAT_FACTOR):
+        try:
+            with open(leasefilename, encoding="utf-8") as lease_file:
+                if lease_file.read() != owner:
+                    print("{0} !! the lease \"{1}\" has been taken over by another " \
+                          "node.".format(PROMPT, leasefilename))
+                    return
+            os.utime(leasefilename)
+        except (IOError, OSError):
+            return
+
+#///////////////////////////////////////////////////////////////////////////////
+def queue_release(leasefilename, owner):
+    """
+        (--queue) Remove the lease leasefilename if owner still holds it : the
+        lease is first moved away by a rename (atomic) and read; a lease taken
+        over by another node (this one having stalled for --lease-seconds) is
+        given back.
+
+        Return True if the lease has been released.
+    """
+    releasefilename = "{0}.{1}.release".format(leasefilename, owner.replace("/", "_"))
+    try:
+        os.rename(leasefilename, releasefilename)
+    except OSError:
+        # taken over and released in the meantime.
+        return False
+
+    try:
+        with open(releasefilename, encoding="utf-8") as lease_file:
+            released = lease_file.read() == owner
+        if not released:
+            print("{0} !! the lease \"{1}\" has been taken over by another " \
+                  "node : it is kept.".format(PROMPT, leasefilename))
+            try:
+                os.link(releasefilename, leasefilename)
+            except OSError:
+                # expired and claimed again in the meantime.
+                pass
+    finally:
+        os.remove(releasefilename)
+    return released
+
+#///////////////////////////////////////////////////////////////////////////////
+def transform_file__queue(source_file):
+    """
+        (--queue) Transform source_file (see transform_file()) if it can be
+        claimed (see queue_claim()); the lease is renewed by a thread while the
+        file is transformed, then the file is marked as done if all its
+        destination files have been written, and the lease is released if it is
+        still ours (see queue_release()) : a file whose transformation has
+        failed can be claimed again.
+
+        Return the result of transform_file() or None if the file hasn't been
+        claimed.
+    """
+    _, _, _, source_subdirectory = source_file
+    key = source_file_key(os.path.join(source_subdirectory, os.path.basename(source_file[2])))
+    owner = "{0}:{1}:{2}".format(socket.gethostname(), os.getpid(), time.time())
+
+    leasefilename = queue_claim(key, owner)
+    if leasefilename is None:
+        if ARGS.debug:
+            print("@@ \"{0}\" : done or claimed by another node".format(source_file[2]))
+        return None
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=queue_heartbeat, args=(leasefilename, owner, stop))
+    heartbeat.daemon = True
+    heartbeat.start()
+    try:
+        result = transform_file(source_file)
+
+        if result["complete"]:
+            # the mark appears at once :
+            donefilename = os.path.join(ARGS.queue, key + ".done")
+            tmpfilename = donefilename + "." + str(os.getpid()) + ".tmp"
+            with open(tmpfilename, "w", encoding="utf-8") as done_file:
+                done_file.write("{0}\n{1}\n".format(owner, source_file[2]))
+            os.rename(tmpfilename, donefilename)
+        else:
+            print("{0} !! \"{1}\" : some destination files haven't been written, " \
+                  "the file is left in the queue.".format(PROMPT, source_file[2]))
+    finally:
+        stop.set()
+        heartbeat.join()
+        queue_release(leasefilename, owner)
+
+    return result
+
+#///////////////////////////////////////////////////////////////////////////////
+def journal_write(records):
+    """
+        (--journal) Append records (dicts) to the journal, one JSON line each, in
+        a single write, and wait until they are on disk (fsync).
+
+        The journal is opened (O_APPEND) by every call : the worker processes
+        append to the same file.
+    """
+    if ARGS.journal is None or not records:
+        return
+
+    lines = "".join(json.dumps(record, sort_keys=True) + "\n" for record in records)
+    journal = os.open(ARGS.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(journal, lines.encode("utf-8"))
+        os.fsync(journal)
+    finally:
+        os.close(journal)
+
+#///////////////////////////////////////////////////////////////////////////////
+def journal_records(event, sourcefilename, destfilenames, recipient=None):
+    """
+        Return the journal records (see journal_write()) of the event "started"
+        or "completed" for destfilenames, a dict transformation number ->
+        destination file.
+    """
+    records = []
+    for transformation_number, destfilename in sorted(destfilenames.items()):
+        record = {"event": event,
+                  "source": os.path.abspath(sourcefilename),
+                  "transform": transformation_number,
+                  "file": os.path.abspath(destfilename)}
+        if recipient is not None:
+            record["recipient"] = recipient
+        records.append(record)
+    return records
+
+#///////////////////////////////////////////////////////////////////////////////
+def read_journal(filename):
+    """
+        (--resume) Read the journal written by the previous run(s).
+
+        Return (done_sources, done_files, started_files) : the source files
+        completed (with at least the transformations of --transforms), the
+        destination files completed and the ones started but not completed.
+
+        A last line cut by a crash is ignored, and ended in the journal.
+    """
+    done_sources, done_files, started_files = set(), set(), set()
+    if not os.path.exists(filename):
+        return done_sources, done_files, started_files
+
+    line = "\n"
+    with open(filename, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line, cut by the crash.
+                continue
+
+            if "file" not in record:
+                if set(ARGS.transforms) <= set(record.get("transforms", ())):
+                    done_sources.add(record["source"])
+            elif record["event"] == "started":
+                started_files.add(record["file"])
+                done_files.discard(record["file"])
+            else:
+                done_files.add(record["file"])
+                started_files.discard(record["file"])
+
+    if not line.endswith("\n"):
+        # the line cut by the crash is ended : the next records are appended after.
+        with open(filename, "a", encoding="utf-8") as journal:
+            journal.write("\n")
+
+    return done_sources, done_files, started_files
+
+#///////////////////////////////////////////////////////////////////////////////
+def remove_partial_files(started_files):
+    """
+        (--resume) Remove the destination files started but not completed by the
+        previous run, and the temporary files left by publish_file() : they are
+        computed again.
+
+        Return the number of files removed.
+    """
+    removed = 0
+    for destfilename in sorted(started_files):
+        directory, name = os.path.split(destfilename)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            if filename == name or fnmatch.fnmatch(filename, name + ".*.tmp"):
+                os.remove(os.path.join(directory, filename))
+                removed += 1
+                if ARGS.debug:
+                    print("@@ partial file removed : \"{0}\"".format(
+                        os.path.join(directory, filename)))
+    return removed
+
+#///////////////////////////////////////////////////////////////////////////////
+def pending_source_files(source, source_type):
+    """
+        Return the generator of the source files to be transformed : the ones of
+        get_source_files() without the ones completed by the previous run
+        (--resume, see JOURNAL__DONE_SOURCES).
+    """
+    source_files = get_source_files(source, source_type)
+    if JOURNAL__DONE_SOURCES:
+        source_files = (source_file for source_file in source_files
+                        if os.path.abspath(source_file[2]) not in JOURNAL__DONE_SOURCES)
+    return source_files
+
+#///////////////////////////////////////////////////////////////////////////////
+def count_source_files(source_files, progress):
+    """
+        Count in a thread the source files of source_files (a generator, see
+        pending_source_files(), other than the one given to the workers) :
+        progress["total"] is set once all of them have been found, while the
+        first ones are already being transformed. Only their headers are read
+        (see is_a_source_file()).
+
+        Return the thread.
+    """
+    def count():
+        """Count the source files."""
+        progress["total"] = sum(1 for _ in source_files)
+
+    thread = threading.Thread(target=count, daemon=True)
+    thread.start()
+    return thread
+
+#///////////////////////////////////////////////////////////////////////////////
+def progress_line(files_done, files_total, images, duration):
+    """
+        Return the progress line : source files done, destination files written
+        per second and estimated time left.
+
+        files_total : None while the source files are still being searched (the
+        total and the ETA are unknown).
+    """
+    eta = "?"
+    if files_done and files_total is not None:
+        seconds = int(round((files_total - files_done) * duration / files_done))
+        eta = "{0}:{1:02}:{2:02}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+    return "{0} progress : {1}/{2} file(s), {3} image(s) in {4:.1f}s " \
+           "({5:.2f} image(s)/s), ETA {6}".format(PROMPT,
+                                                  files_done,
+                                                  "?" if files_total is None else files_total,
+                                                  images,
+                                                  duration,
+                                                  images / duration if duration else 0.0,
+                                                  eta)
+
+#///////////////////////////////////////////////////////////////////////////////
+def init_worker(embed_directory):
+    """
+        Initializer of the worker processes (--jobs > 1) .
+
+        Each worker writes its own steghide embed file in its own subdirectory of
+        embed_directory, so that two workers never share the same file.
+    """
+    global STEGHIDE__EMBED_FILE  # pylint: disable=global-statement
+
+    worker_directory = os.path.join(embed_directory, str(os.getpid()))
+    os.mkdir(worker_directory)
+
+    STEGHIDE__EMBED_FILE = os.path.join(worker_directory,
+                                        os.path.basename(STEGHIDE__EMBED_FILE))
+    write_embed_file(STEGHIDE__EMBED_FILE)
+
+    # the cached files of the worker are written in its own subdirectory :
+    init_caches(worker_directory)
+
+    # each ImageMagick call would otherwise start one thread per CPU : with one
+    # worker per CPU, the machine would be oversubscribed.
+    if "MAGICK_THREAD_LIMIT" not in os.environ:
+        os.environ["MAGICK_THREAD_LIMIT"] = "1"
+
+#///////////////////////////////////////////////////////////////////////////////
+def inotify_init():
+    """
+        (--watch) Return a file descriptor reading the inotify events (Linux),
+        through the C library.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    file_descriptor = libc.inotify_init()
+    if file_descriptor < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init() failed")
+    return (libc, file_descriptor)
+
+#///////////////////////////////////////////////////////////////////////////////
+def inotify_add_watch(inotify, directory):
+    """
+        (--watch) Watch the files written in directory (see INOTIFY__MASK).
+
+        Return the watch descriptor (an integer).
+    """
+    libc, file_descriptor = inotify
+    watch_descriptor = libc.inotify_add_watch(file_descriptor,
+                                              directory.encode(sys.getfilesystemencoding()),
+                                              INOTIFY__MASK)
+    if watch_descriptor < 0:
+        raise OSError(ctypes.get_errno(), "inotify_add_watch() failed", directory)
+    return watch_descriptor
+
+#///////////////////////////////////////////////////////////////////////////////
+def inotify_read_events(inotify):
+    """
+        (--watch) Read the pending inotify events and return a list of
+        (watch descriptor, mask, name) tuples.
+    """
+    buffer = os.read(inotify[1], INOTIFY__BUFFER_SIZE)
+
+    events = []
+    offset = 0
+    while offset < len(buffer):
+        watch_descriptor, mask, _, length = struct.unpack_from("iIII", buffer, offset)
+        offset += struct.calcsize("iIII")
+        name = buffer[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding())
+        offset += length
+        events.append((watch_descriptor, mask, name))
+    return events
+
+#///////////////////////////////////////////////////////////////////////////////
+def watch_source_directory(source_directory, dest_archive=None):
+    """
+        (--watch) Daemon : transform every source file written (or moved) in
+        source_directory (and in its subdirectories with --recursive), by a pool
+        of worker processes started once, until SIGTERM or ^C.
+
+        The files already in source_directory are transformed first. The status
+        of the queue is sent as JSON to the clients of the Unix socket
+        --status-socket, if any.
+
+        With dest_archive (see DestArchive), the destination files are appended
+        to the archive as soon as they are written.
+
+        Return the sum of the results of transform_file() (see add_results()).
+    """
+    # the files written in DESTPATH are skipped only if DESTPATH is a
+    # subdirectory of source_directory (not source_directory itself nor one of
+    # its ancestors, e.g. the default "."); the destination files are
+    # recognized by their names anyway (see destination_file_patterns()).
+    destination_directory = os.path.realpath(DESTPATH)
+    source_realpath = os.path.realpath(source_directory)
+    if not destination_directory.startswith(source_realpath + os.sep):
+        destination_directory = None
+    patterns = destination_file_patterns()
+
+    results = {}
+    status = {"start": time.time(), "queued": 0, "done": 0, "latencies": []}
+    # (path, modification time) of the files given to the pool : a file found
+    # by the first scan and by an event of the watch (added before) is
+    # transformed once, a file written again is transformed again.
+    submitted = set()
+    lock = threading.Lock()
+
+    def finished(result, received):
+        """Callback of the pool : called when a source file has been transformed."""
+        with lock:
+            if dest_archive is not None:
+                dest_archive.add_files(result["written_files"], DESTPATH)
+            add_results(results, result)
+            status["queued"] -= 1
+            status["done"] += 1
+            status["latencies"] = (status["latencies"] +
+                                   [time.time() - received])[-WATCH__LATENCIES:]
+
+    def failed(error):
+        """Callback of the pool : called when transform_file() has raised error."""
+        print("{0} !! {1}".format(PROMPT, error))
+        with lock:
+            status["queued"] -= 1
+
+    def submit(filename, relative_filename):
+        """Give filename to the pool if it is a source file."""
+        if (destination_directory is not None and
+                os.path.realpath(filename).startswith(destination_directory + os.sep)) or \
+           any(pattern.match(os.path.basename(filename)) for _, pattern in patterns) or \
+           WATCH__TMPFILE_PATTERN.search(filename):
+            # a destination file (or a temporary one, about to be renamed) : it
+            # mustn't be transformed.
+            return
+        try:
+            submission = (filename, os.stat(filename).st_mtime_ns)
+        except OSError:
+            # already renamed or removed.
+            return
+        if submission in submitted or not is_a_source_file(filename, relative_filename):
+            return
+        submitted.add(submission)
+
+        # as get_source_files() :
+        source_basename, source_extension = os.path.splitext(os.path.basename(filename))
+        source_file = (source_basename, source_extension, filename,
+                       os.path.dirname(relative_filename))
+
+        received = time.time()
+        with lock:
+            status["queued"] += 1
+        pool.apply_async(transform_file, (source_file,),
+                         callback=lambda result: finished(result, received),
+                         error_callback=failed)
+
+    def status_message():
+        """Return the status of the queue (JSON, bytes)."""
+        with lock:
+            message = {"uptime": time.time() - status["start"],
+                       "queue_depth": status["queued"],
+                       "done": status["done"],
+                       "latency_p50": None,
+                       "latency_p95": None}
+            if status["latencies"]:
+                statistics = benchmark_statistics(status["latencies"])
+                message["latency_p50"] = statistics["p50"]
+                message["latency_p95"] = statistics["p95"]
+        return (json.dumps(message, sort_keys=True) + "\n").encode("utf-8")
+
+    inotify = inotify_init()
+    # watch descriptor -> path of the directory relative to source_directory :
+    watched = {inotify_add_watch(inotify, source_directory): ""}
+
+    server = None
+    if ARGS.status_socket is not None:
+        if os.path.exists(ARGS.status_socket):
+            os.remove(ARGS.status_socket)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(ARGS.status_socket)
+        server.listen(8)
+
+    embed_directory = tempfile.mkdtemp(prefix="watersteg.")
+    pool = get_pool(JOBS, embed_directory)
+
+    # SIGTERM stops the daemon as ^C does (the workers, already forked, keep
+    # the default handler) :
+    sigterm_handler = signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        if ARGS.recursive:
+            for directory, _, _ in os.walk(source_directory):
+                if directory != source_directory:
+                    watched[inotify_add_watch(inotify, directory)] = \
+                        os.path.relpath(directory, source_directory)
+
+        for filename, relative_filename in scan_directory(source_directory, ARGS.recursive):
+            submit(filename, relative_filename)
+
+        if not ARGS.quiet:
+            print("{0} watching \"{1}\" with {2} worker process(es)...".format(PROMPT,
+                                                                             source_directory,
+                                                                             JOBS))
+
+        while True:
+            readable = select.select([inotify[1]] + ([server] if server else []), [], [])[0]
+
+            if server in readable:
+                connection = server.accept()[0]
+                try:
+                    connection.sendall(status_message())
+                finally:
+                    connection.close()
+
+            if inotify[1] in readable:
+                for watch_descriptor, mask, name in inotify_read_events(inotify):
+                    if mask & INOTIFY__IN_Q_OVERFLOW:
+                        print("{0} !! too many events : some files may have been " \
+                              "missed.".format(PROMPT))
+                    if watch_descriptor not in watched:
+                        continue
+                    relative_filename = os.path.join(watched[watch_descriptor], name)
+                    filename = os.path.join(source_directory, relative_filename)
+
+                    if mask & INOTIFY__IN_ISDIR:
+                        if ARGS.recursive:
+                            watched[inotify_add_watch(inotify, filename)] = relative_filename
+                            # the files written before the watch was added :
+                            for found in scan_directory(filename, True, relative_filename):
+                                submit(*found)
+                    elif mask & (INOTIFY__IN_CLOSE_WRITE | INOTIFY__IN_MOVED_TO):
+                        # IN_CREATE : the file is still being written.
+                        submit(filename, relative_filename)
+
+    except KeyboardInterrupt:
+        if not ARGS.quiet:
+            print("{0} stopping : waiting for the {1} queued file(s)...".format(PROMPT,
+                                                                              status["queued"]))
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        signal.signal(signal.SIGTERM, sigterm_handler)
+        pool.join()
+        shutil.rmtree(embed_directory)
+        os.close(inotify[1])
+        if server is not None:
+            server.close()
+            os.remove(ARGS.status_socket)
+
+    return results
+
+#///////////////////////////////////////////////////////////////////////////////
+def get_pool(jobs, embed_directory):
+    """
+        Return a pool of "jobs" worker processes initialized by init_worker() .
+
+        The workers are forked : they inherit ARGS, DESTPATH and OVERLAY.
+    """
+    return multiprocessing.get_context("fork").Pool(processes=jobs,
+                                                    initializer=init_worker,
+                                                    initargs=(embed_directory,))
+
+#///////////////////////////////////////////////////////////////////////////////
+def imap_jobs(function, arguments, jobs):
+    """
+        Yield function(argument) for each argument of arguments : in this process
+        if jobs is 1, by a pool of jobs worker processes otherwise (see
+        get_pool()), in the order the results come.
+    """
+    if jobs == 1:
+        for argument in arguments:
+            yield function(argument)
+        return
+
+    embed_directory = tempfile.mkdtemp(prefix="watersteg.")
+    pool = get_pool(jobs, embed_directory)
+    try:
+        yield from pool.imap_unordered(function, arguments)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        shutil.rmtree(embed_directory)
+
+#///////////////////////////////////////////////////////////////////////////////
+def source_dimensions(filename):
+    """
+        Return the (width, height) of the source file filename, read in its header :
+        by Pillow if it's available (the pixels aren't decoded), by "identify
+        -ping" otherwise; (0, 0) if the file can't be read.
+    """
+    try:
+        if Image is not None:
+            with Image.open(filename) as image:
+                return image.size
+        return get_image_size(filename)
+    except (IOError, OSError, ValueError):
+        return (0, 0)
+
+#///////////////////////////////////////////////////////////////////////////////
+def estimated_memory(source_file):
+    """
+        (--memory-budget) Return the memory (bytes) estimated to transform one of
+        the tuples yielded by get_source_files() (see ADMISSION__BYTES_PER_PIXEL).
+    """
+    width, height = source_dimensions(source_file[2])
+    return width * height * ADMISSION__BYTES_PER_PIXEL
+
+#///////////////////////////////////////////////////////////////////////////////
+def admit_jobs(function, arguments, jobs):
+    """
+        (--memory-budget) Yield function(argument) for each argument of
+        arguments (tuples yielded by get_source_files()), as imap_jobs() does,
+        with an admission control :
+
+            o the dimensions of all the source files are read first, and the
+              largest files are given first to the workers;
+            o a file is only given to a worker if its estimated memory (see
+              estimated_memory()) fits in what remains of --memory-budget; a
+              smaller file which fits is given instead of a larger one which
+              doesn't, and a file larger than the whole budget is transformed
+              alone.
+    """
+    budget = ARGS.memory_budget * 1024 * 1024
+    pending = sorted(((estimated_memory(argument), argument) for argument in arguments),
+                     key=lambda job: job[0],
+                     reverse=True)
+    if ARGS.debug:
+        print("@@ admission : {0} file(s), {1:.1f} MiB for the largest one".format(
+            len(pending), pending[0][0] / 1024.0 / 1024 if pending else 0))
+
+    if jobs == 1:
+        for _, argument in pending:
+            yield function(argument)
+        return
+
+    embed_directory = tempfile.mkdtemp(prefix="watersteg.")
+    pool = get_pool(jobs, embed_directory)
+    done = queue.Queue()
+    running = 0
+    memory_in_use = 0
+    try:
+        while pending or running:
+            while pending and running < jobs:
+                index = next((index for index, (memory, _) in enumerate(pending)
+                              if memory_in_use + memory <= budget),
+                             None if running else 0)
+                if index is None:
+                    break
+                memory, argument = pending.pop(index)
+                pool.apply_async(function, (argument,),
+                                 callback=lambda result, memory=memory: done.put((memory,
+                                                                                  result)),
+                                 error_callback=lambda error: done.put((None, error)))
+                running += 1
+                memory_in_use += memory
+
+            memory, result = done.get()
+            if memory is None:
+                raise result
+            running -= 1
+            memory_in_use -= memory
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        shutil.rmtree(embed_directory)
+
+#///////////////////////////////////////////////////////////////////////////////
+def process(image, message, passphrase, overlay=None, transforms=(1, 2, 3, 4, 5),
+            extension=".jpg", basename="image", stego="steghide", font=None):
+    """
+        Library API : apply the transformations whose numbers are in transforms
+        to image (the content of a source file, bytes) and return a dict
+        destination file's name -> content (bytes). The names are the ones the
+        command line would write (see TRANSFORMATIONS) for basename and
+        extension, which gives the format of the destination files.
+
+            o overlay : the content of the overlay file (bytes), required by
+              the transformations #3 and #5;
+            o stego, font : see --stego and --font.
+
+        Nothing is written on disk : a single call to "convert" reads the source
+        on its standard input, the overlay through a pipe and writes each image
+        in its own pipe (see pipeline_order()), then each image is embedded in
+        memory (see embed__streams()). The arguments of the call (see get_args())
+        are given to these functions : no global state is modified and process()
+        can be called by several threads at once.
+
+        Raise ValueError if an argument is wrong, RuntimeError if an external
+        program or the embedding fails.
+    """
+    transforms = sorted(set(transforms))
+    if not transforms or not set(transforms) <= set(TRANSFORMATION_STEPS):
+        raise ValueError("process() : the transformations are numbered from 1 to 5")
+    if overlay is None and any("overlay" in TRANSFORMATION_STEPS[transformation_number]
+                               for transformation_number in transforms):
+        raise ValueError("process() : the transformations #3 and #5 require an overlay")
+    if stego not in STEGO__BACKENDS:
+        raise ValueError("process() : unknown steganography backend \"{0}\"".format(stego))
+
+    names = {transformation_number: filename_format.format("", basename, extension)
+             for transformation_number, filename_format, _, _ in TRANSFORMATIONS
+             if transformation_number in transforms}
+    chains = plan_transformations(transforms)
+    # the images computed by convert (the transformation #2 embeds the source) :
+    computed = [transformation_number for transformation_number in transforms
+                if TRANSFORMATION_STEPS[transformation_number]]
+    image_format = extension.lower().lstrip(".")
+
+    args = get_args(["--source=-", "--quiet",
+                     "--message=" + message,
+                     "--passphrase=" + passphrase,
+                     "--overlay=-",
+                     "--stego=" + stego] +
+                    ([] if font is None else ["--font=" + font]))
+
+    images = {2: image}
+    if computed:
+        uses_overlay = any("overlay" in chain for chain in chains)
+        size = get_image_size("-", data=image) if uses_overlay else None
+        status, _, contents = run_order__pipes(
+            lambda input_fds, output_fds: pipeline_order(
+                "-",
+                {transformation_number: "{0}:fd:{1}".format(image_format, output_fd)
+                 for transformation_number, output_fd in zip(computed, output_fds)},
+                "fd:{0}".format(input_fds[0]) if input_fds else None,
+                chains,
+                size,
+                streams=True,
+                args=args),
+            image,
+            inputs=[overlay] if uses_overlay else [],
+            outputs_number=len(computed))
+        if status != 0:
+            raise RuntimeError("convert has failed (exit status {0})".format(status >> 8))
+        images.update(zip(computed, contents))
+
+    return {names[transformation_number]: embed__streams(images[transformation_number],
+                                                         extension,
+                                                         args)
+            for transformation_number in transforms}
+
+#///////////////////////////////////////////////////////////////////////////////
+#///////////////////////////////////////////////////////////////////////////////
+#///                                                                         ///
+#///                            ENTRY POINT                                  ///
+#///                                                                         ///
+#///////////////////////////////////////////////////////////////////////////////
+#///////////////////////////////////////////////////////////////////////////////
+
+#///////////////////////////////////////////////////////////////////////////////
+def main():
+    """
+        Entry point of the command line : read the arguments, transform (or
+        check, benchmark, watch...) the source files and display the summary.
+
+        ARGS, DESTPATH, OVERLAY and JOBS are set here, as module globals read by
+        the functions above and inherited by the worker processes.
+    """
+    global ARGS, DESTPATH, OVERLAY, JOBS, STEGHIDE__EMBED_FILE  # pylint: disable=global-statement
+
+    #///////////////////////////////////////////////////////////////////////////
+    #
+    # (0) warm-up
+    #
+    #///////////////////////////////////////////////////////////////////////////
+
+    # (0.a) arguments from the command line
+    ARGS = get_args()
+
+    # metrics of the external programs called by this process outside
+    # transform_file() (see record_stage()) :
+    METRICS__CONTEXT["metrics"] = new_metrics()
+
+    # (0.b) source file/directory
+    if ARGS.benchmark:
+        # the source files are generated, see generate_corpus() :
+        if ARGS.source is None:
+            source = tempfile.mkdtemp(prefix="watersteg.")
+        else:
+            source = os.path.expanduser(ARGS.source)
+            if not os.path.exists(source):
+                os.makedirs(source)
+    elif ARGS.verify:
+        # the destination files are read, see find_destination_files() :
+        source = os.path.expanduser(ARGS.destpath)
+    else:
+        source = os.path.expanduser(ARGS.source)
+
+    source_type = None
+    if ARGS.benchmark:
+        source_type = "a synthetic corpus"
+    elif ARGS.verify:
+        source_type = "the destination files"
+    elif os.path.isfile(source):
+        source_type = "a file"
+    elif os.path.isdir(source):
+        source_type = "a directory"
+    else:
+        # ... hopefully something with wildcards.
+        source_type = "neither a file nor a directory"
+
+    if ARGS.watch and source_type != "a directory":
+        print("{0} !! --watch : the source \"{1}\" must be a directory : " \
+              "the program has to stop.".format(PROMPT, source))
+        sys.exit()
+
+    # (0.c) destination path
+    DESTPATH = os.path.expanduser(ARGS.destpath)
+    if not DESTPATH.endswith("/"):
+        DESTPATH += "/"
+    if not os.path.exists(DESTPATH):
+        print("{0} !! the destination path \"{1}\" doesn't exist : " \
+              "the program has to stop.".format(PROMPT, DESTPATH))
+        sys.exit()
+
+    # archive sink (--dest-archive) : the destination files are written in a
+    # directory of the scratch directory, then appended to the archive.
+    dest_archive = None
+    if ARGS.dest_archive is not None and not (ARGS.extract or ARGS.benchmark or
+                                              ARGS.benchmark_stego or
+                                              ARGS.check_engine or ARGS.verify):
+        if not os.path.isdir(os.path.dirname(ARGS.dest_archive)):
+            print("{0} !! the directory of the archive \"{1}\" doesn't exist : " \
+                  "the program has to stop.".format(PROMPT, ARGS.dest_archive))
+            sys.exit()
+        dest_archive = DestArchive(ARGS.dest_archive)
+        DESTPATH = tempfile.mkdtemp(prefix="watersteg.", dir=ARGS.scratch) + "/"
+
+    # (0.d) overlay file
+    OVERLAY = os.path.expanduser(ARGS.overlay)
+
+    # (0.e) displaying the summary
+    if not ARGS.quiet:
+        print("=== {0} v. {1} === ".format(PROGRAM_NAME, PROGRAM_VERSION))
+
+        print("{0} source=\"{1}\" ({2})".format(PROMPT, source, source_type))
+        if source_type == "neither a file nor a directory":
+            print("{0} source \"{1}\" is neither an existing file nor an existing directory : " \
+                  "it will be analysed as a path with wildcards.".format(PROMPT, source))
+
+        if dest_archive is None:
+            print("{0} output path=\"{1}\"".format(PROMPT, DESTPATH))
+        else:
+            print("{0} output archive=\"{1}\"".format(PROMPT, ARGS.dest_archive))
+
+    # (0.f) are the required external programs available ?
+    if not external_programs_are_available():
+        sys.exit()
+
+    # (0.g) number of jobs :
+    JOBS = ARGS.jobs
+    if JOBS == 0:
+        JOBS = multiprocessing.cpu_count() if ARGS.threads is None else ARGS.threads
+    if ARGS.benchmark:
+        # the transformations are timed in this process :
+        JOBS = 1
+
+    # (0.h) creating the embed file used by steghide in a temporary directory,
+    #       removed at exit even after a ^C (the worker processes, and the pool
+    #       of --watch, write their own embed file, see init_worker()) :
+    embed_directory = tempfile.mkdtemp(prefix="watersteg.")
+    atexit.register(shutil.rmtree, embed_directory, True)
+    if JOBS == 1 and not ARGS.watch:
+        STEGHIDE__EMBED_FILE = os.path.join(embed_directory,
+                                            os.path.basename(STEGHIDE__EMBED_FILE))
+        write_embed_file(STEGHIDE__EMBED_FILE)
+
+    # (0.i) watermark tiles and overlays caches (the worker processes have their
+    #       own caches, see init_worker()) :
+    cache_directory = tempfile.mkdtemp(prefix="watersteg.")
+    init_caches(cache_directory)
+
+    # (0.j) large images : ImageMagick's memory limits, inherited by the worker
+    #       processes; the pixels beyond are cached on disk.
+    if ARGS.large_images:
+        os.environ["MAGICK_MEMORY_LIMIT"] = "{0}MiB".format(ARGS.memory_limit)
+        os.environ["MAGICK_MAP_LIMIT"] = "{0}MiB".format(ARGS.memory_limit *
+                                                         LARGE_IMAGES__MAP_FACTOR)
+        if ARGS.pixel_cache is not None and not os.path.exists(ARGS.pixel_cache):
+            os.makedirs(ARGS.pixel_cache)
+        os.environ["MAGICK_TEMPORARY_PATH"] = ARGS.pixel_cache or cache_directory
+
+    # (0.k) thread budget : the threads left to each external program by the
+    #       worker processes and --concurrency (inherited by the workers).
+    if ARGS.threads is not None:
+        threads_per_order = max(1, ARGS.threads // (JOBS * ARGS.concurrency))
+        os.environ["MAGICK_THREAD_LIMIT"] = str(threads_per_order)
+        os.environ["OMP_NUM_THREADS"] = str(threads_per_order)
+        if not ARGS.quiet:
+            print("{0} {1} thread(s) : {2} job(s) x {3} concurrent order(s) x {4} " \
+                  "ImageMagick thread(s)".format(PROMPT, ARGS.threads, JOBS,
+                                                ARGS.concurrency, threads_per_order))
+
+    # (0.l) --resume : what the previous run has done (inherited by the workers).
+    if ARGS.resume:
+        done_sources, done_files, started_files = read_journal(ARGS.journal)
+        JOURNAL__DONE_SOURCES.update(done_sources)
+        JOURNAL__DONE_FILES.update(done_files)
+        partial_files = remove_partial_files(started_files)
+        if not ARGS.quiet:
+            print("{0} resuming \"{1}\" : {2} source file(s) and {3} destination file(s) " \
+                  "already done, {4} partial file(s) removed".format(PROMPT,
+                                                                     ARGS.journal,
+                                                                     len(done_sources),
+                                                                     len(done_files),
+                                                                     partial_files))
+
+    #///////////////////////////////////////////////////////////////////////////
+    #
+    # (1) transformations
+    #
+    #///////////////////////////////////////////////////////////////////////////
+    number_of_files_read_and_transformed = 0
+
+    # sum of the results returned by transform_file(), see add_results() :
+    results = {}
+
+    # exit status of the program : 1 if a regression has been detected
+    # (--benchmark-baseline) or if a destination file is wrong (--verify).
+    exit_status = 0
+
+    if ARGS.extract:
+        # nothing is written in DESTPATH : the embedded messages are checked.
+        number_of_unexpected_messages = 0
+        for source_file in get_source_files(source, source_type):
+            if not extract_file(source_file):
+                number_of_unexpected_messages += 1
+            number_of_files_read_and_transformed += 1
+
+        print("{0} messages extracted : {1} file(s) without the expected message.".format(
+            PROMPT, number_of_unexpected_messages))
+
+    elif ARGS.benchmark:
+        # nothing is written in DESTPATH : the transformations are timed.
+        benchmark_report = run_benchmark(source)
+        if ARGS.source is None:
+            shutil.rmtree(source)
+
+        if ARGS.benchmark_report is None:
+            print(json.dumps(benchmark_report, indent=4, sort_keys=True))
+        else:
+            with open(ARGS.benchmark_report, "w", encoding="utf-8") as report_file:
+                json.dump(benchmark_report, report_file, indent=4, sort_keys=True)
+
+        if not ARGS.quiet:
+            for benchmark_name, benchmark_result in sorted(benchmark_report["results"].items()):
+                print("{0} {1:40} : {2:7.2f} image(s)/s, p50={3:.3f}s, p95={4:.3f}s".format(
+                    PROMPT, benchmark_name, benchmark_result["images_per_second"],
+                    benchmark_result["p50"], benchmark_result["p95"]))
+
+            for benchmark_name, speedup in \
+                    sorted(benchmark_report["jpeg_fast_path_speedup"].items()):
+                print("{0} {1:40} : JPEG fast path x {2:.2f} (megapixels/s)".format(
+                    PROMPT, benchmark_name, speedup))
+
+        if ARGS.benchmark_baseline is not None:
+            with open(ARGS.benchmark_baseline, encoding="utf-8") as baseline_file:
+                benchmark_regressions = compare_benchmarks(benchmark_report,
+                                                           json.load(baseline_file))
+            for benchmark_regression in benchmark_regressions:
+                print("{0} !! regression : {1}".format(PROMPT, benchmark_regression))
+            if benchmark_regressions:
+                exit_status = 1
+
+    elif ARGS.benchmark_stego:
+        # nothing is written in DESTPATH : both steganography backends are compared.
+        benchmark_stego_backends(get_source_files(source, source_type))
+
+    elif ARGS.check_engine:
+        # nothing is written in DESTPATH : both engines are compared.
+        number_of_files_out_of_tolerance = 0
+        for source_file in get_source_files(source, source_type):
+            if not check_engines(source_file):
+                number_of_files_out_of_tolerance += 1
+            number_of_files_read_and_transformed += 1
+
+        print("{0} engines compared : {1} file(s) out of tolerance.".format(
+            PROMPT, number_of_files_out_of_tolerance))
+
+    elif ARGS.verify:
+        # nothing is written in DESTPATH : the embedded messages of the destination
+        # files are checked.
+        if not ARGS.quiet and JOBS > 1:
+            print("{0} {1} worker processes".format(PROMPT, JOBS))
+
+        verify_start = time.time()
+        verify_results = []
+        for result in imap_jobs(verify_file, find_destination_files(DESTPATH), JOBS):
+            verify_results.append(result)
+            number_of_files_read_and_transformed += 1
+        verify_duration = time.time() - verify_start
+
+        verify_statuses = collections.Counter(result["status"] for result in verify_results)
+        print("{0} {1} destination file(s) verified in {2:.1f}s : {3}.".format(
+            PROMPT,
+            len(verify_results),
+            verify_duration,
+            ", ".join("{0} {1}".format(verify_number, verify_status)
+                      for verify_status, verify_number in sorted(verify_statuses.items())) or
+            "nothing found"))
+
+        if ARGS.verify_report is not None:
+            with open(ARGS.verify_report, "w", encoding="utf-8") as report_file:
+                json.dump({"program": PROGRAM_NAME,
+                           "version": PROGRAM_VERSION,
+                           "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                           "destpath": DESTPATH,
+                           "seconds": verify_duration,
+                           "statuses": dict(verify_statuses),
+                           "files": sorted(verify_results, key=lambda result: result["file"])},
+                          report_file, indent=4, sort_keys=True)
+
+        if len(verify_results) != verify_statuses["ok"]:
+            exit_status = 1
+
+    elif ARGS.watch:
+        results = watch_source_directory(source, dest_archive)
+        number_of_files_read_and_transformed = results.get("files", 0)
+
+    else:
+        if not ARGS.quiet and JOBS > 1:
+            print("{0} {1} worker processes".format(PROMPT, JOBS))
+
+        if ARGS.queue is not None and not os.path.exists(ARGS.queue):
+            os.makedirs(ARGS.queue, exist_ok=True)
+
+        source_files = pending_source_files(source, source_type)
+
+        # progress line : the source files are counted by a thread while the
+        # first ones are given to the workers; the total and the ETA are known
+        # once they have all been found.
+        progress = None
+        if not ARGS.quiet:
+            progress = {"start": time.time(), "printed": 0.0, "reported": 0, "files": 0,
+                        "images": 0, "total": None}
+            count_source_files(pending_source_files(source, source_type), progress)
+
+        for result in (imap_jobs if ARGS.memory_budget is None else admit_jobs)(
+                transform_file if ARGS.queue is None else transform_file__queue,
+                source_files,
+                JOBS):
+            if result is not None:
+                if ARGS.debug:
+                    print("@@ \"{0}\" -> {1}".format(result["source"],
+                                                     result["written_files"]))
+                if dest_archive is not None:
+                    dest_archive.add_files(result["written_files"], DESTPATH)
+                add_results(results, result)
+                number_of_files_read_and_transformed += 1
+            # else : (--queue) transformed by another process.
+
+            if progress is not None:
+                progress["files"] += 1
+                if result is not None:
+                    progress["images"] += len(result["written_files"])
+                if time.time() - progress["printed"] >= PROGRESS__INTERVAL or \
+                   progress["files"] == progress["total"]:
+                    progress["printed"], progress["reported"] = time.time(), progress["files"]
+                    print(progress_line(progress["files"], progress["total"],
+                                        progress["images"],
+                                        progress["printed"] - progress["start"]),
+                          flush=True)
+
+        if progress is not None and progress["reported"] != progress["files"]:
+            # the last file was done before the count of the source files ended :
+            print(progress_line(progress["files"], progress["total"], progress["images"],
+                                time.time() - progress["start"]),
+                  flush=True)
+
+    #///////////////////////////////////////////////////////////////////////////
+    #
+    # (2) before quitting
+    #
+    #///////////////////////////////////////////////////////////////////////////
+
+    # (2a) removing the embed file used by steghide :
+    shutil.rmtree(embed_directory)
+
+    # (--dest-archive) the archive is given its name :
+    if dest_archive is not None:
+        dest_archive.close()
+        shutil.rmtree(DESTPATH)
+        if not ARGS.quiet:
+            print("{0} {1} file(s) written in \"{2}\" (index : \"{3}\")".format(
+                PROMPT, dest_archive.files, dest_archive.filename,
+                dest_archive.indexfilename))
+
+    # (2b) removing the cached files :
+    WATERMARK__CACHE.clear()
+    OVERLAY__CACHE.clear()
+    shutil.rmtree(cache_directory)
+
+    # (2c) caches' statistics :
+    if not ARGS.quiet and "caches" in results:
+        for cache_name, (cache_hits, cache_misses) in sorted(results["caches"].items()):
+            print("{0} {1} cache : {2} hit(s), {3} miss(es)".format(PROMPT,
+                                                                  cache_name,
+                                                                  cache_hits,
+                                                                  cache_misses))
+
+    # (2d) destination files skipped by --prescan :
+    if ARGS.prescan and not ARGS.quiet:
+        print("{0} {1} destination file(s) skipped : " \
+              "the message doesn't fit.".format(PROMPT, len(results.get("skipped", ()))))
+        for skipped_filename, skipped_capacity, skipped_needed in results.get("skipped", ()):
+            print("{0}   {1} : about {2} byte(s) available, {3} needed".format(PROMPT,
+                                                                             skipped_filename,
+                                                                             skipped_capacity,
+                                                                             skipped_needed))
+
+    # (2e) metrics of the external programs :
+    if ARGS.metrics_json is not None or ARGS.metrics_prom is not None:
+        metrics = results.get("metrics", new_metrics())
+        merge_metrics(metrics, METRICS__CONTEXT["metrics"])
+        write_metrics(metrics, ARGS.metrics_json, ARGS.metrics_prom)
+
+    # (2f) goodbye :
+    if not ARGS.quiet:
+        print("{0} done with \"{1}\" : " \
+              "{2} file(s) read and transformed.".format(PROMPT,
+                                                         source,
+                                                         number_of_files_read_and_transformed))
 
-# (2a) removing the embed file used by steghide :
-system("rm {0}".format(STEGHIDE__EMBED_FILE))
+    if exit_status != 0:
+        sys.exit(exit_status)
 
-# (2b) goodbye :
-if not ARGS.quiet:
-    print("{0} done with \"{1}\" : " \
-          "{2} file(s) read and transformed.".format(PROMPT,
-                                                     SOURCE,
-                                                     NUMBER_OF_FILES_READ_AND_TRANSFORMED))
+if __name__ == "__main__":
+    main()
 
 #///////////////////////////////////////////////////////////////////////////////
 #///////////////////////////////////////////////////////////////////////////////